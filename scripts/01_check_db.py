@@ -1,42 +1,106 @@
-import sqlite3
+import argparse
 import pandas as pd
 import os
 
+from db import connection
+from db_profile import DATABASES, bad_days, entry_days, profile_databases, profile_frame
+from trading_calendar import build_calendar
+
 def explore_database(db_path):
-    """Explore the structure of a SQLite database."""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    """
+    Print the schema and one sample row of a SQLite database.
+    
+    Day tables share one schema, so only the first table is sampled; the
+    per-table statistics come from profile_database instead.
+    """
+    cursor = connection(db_path).cursor()
     
     # Get all tables
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
     tables = cursor.fetchall()
     
-    print(f"\nTables in {db_path}:")
-    for table in tables:
-        table_name = table[0]
+    print(f"\nTables in {db_path}: {len(tables)}")
+    if tables:
+        table_name = tables[0][0]
         print(f"\nTable: {table_name}")
         
         # Get column information
-        cursor.execute(f"PRAGMA table_info('{table_name}');")
+        cursor.execute(f'PRAGMA table_info("{table_name}");')
         columns = cursor.fetchall()
         print("Columns:")
         for col in columns:
             print(f"  - {col[1]} ({col[2]})")
         
         # Get sample data
-        cursor.execute(f"SELECT * FROM '{table_name}' LIMIT 1;")
-        sample_data = cursor.fetchall()
-        if sample_data:
+        cursor.execute(f'SELECT * FROM "{table_name}" LIMIT 1;')
+        sample = cursor.fetchone()
+        if sample:
             print("\nSample data:")
-            df = pd.DataFrame(sample_data, columns=[col[1] for col in columns])
-            print(df)
-            print("\nUnique values in each column:")
-            for col in df.columns:
-                cursor.execute(f"SELECT DISTINCT {col} FROM '{table_name}' LIMIT 5;")
-                unique_vals = cursor.fetchall()
-                print(f"  {col}: {[val[0] for val in unique_vals]}")
+            for col, value in zip(columns, sample):
+                print(f"  {col[1]}: {value!r}")
+
+def profile_database(workers=None, refresh=False, save=True):
+    """
+    Profile every day table of both databases and report data-quality issues.
+    
+    Reports row counts, time coverage gaps, missing 09:15/15:25/09:45 bars,
+    duplicate bars and strike coverage per expiry. The results are cached in
+    data/db_profile.json, which later stages read to skip unusable days.
+    
+    Args:
+        workers (int): Worker threads, os.cpu_count() by default
+        refresh (bool): Profile tables already in the cached manifest again
+        save (bool): Write db_profile_spot.csv and db_profile_opt.csv to the
+            reports directory
+        
+    Returns:
+        dict: The profile manifest
+    """
+    # Get absolute paths
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    base_dir = os.path.dirname(current_dir)
+    data_dir = os.path.join(base_dir, 'data')
+    reports_dir = os.path.join(base_dir, 'reports')
+    
+    print("\nProfiling databases:")
+    print("====================")
+    manifest = profile_databases(data_dir, workers=workers, refresh=refresh)
     
-    conn.close()
+    for kind, db_name in DATABASES:
+        frame = profile_frame(manifest, kind)
+        if frame.empty:
+            continue
+        
+        print(f"\n{db_name}: {len(frame)} days, {int(frame['rows'].sum())} rows")
+        print(f"  Days with coverage gaps: {int((frame['missing_minutes'] > 0).sum())} "
+              f"(largest gap {int(frame['largest_gap'].max())} minutes)")
+        print(f"  Days with missing key bars: {int((frame['missing_bars'] != '').sum())}")
+        print(f"  Duplicate bars: {int(frame['duplicate_bars'].sum())}")
+        
+        if kind == 'opt':
+            # Strike coverage of the nearest expiry of each day
+            nearest = [day['expiries'][0] for day in manifest[kind].values() if day.get('expiries')]
+            if nearest:
+                strikes = pd.DataFrame(nearest)['strikes']
+                print(f"  Strikes per expiry and type (nearest expiry): "
+                      f"min {strikes.min()}, mean {strikes.mean():.0f}, max {strikes.max()}")
+        
+        if save:
+            os.makedirs(reports_dir, exist_ok=True)
+            frame.to_csv(os.path.join(reports_dir, f'db_profile_{kind}.csv'))
+    
+    missing = bad_days(data_dir)
+    print(f"\nDays without data (left out of the trading calendar): {len(missing)}")
+    for date, reasons in list(missing.items())[:10]:
+        print(f"  {date}: {'; '.join(reasons)}")
+    
+    if 'spot' in manifest:
+        _, skipped = entry_days(build_calendar(data_dir), data_dir)
+        print(f"\nDays without a trade (skipped by the pipeline): {len(skipped)}")
+        for date, reasons in list(skipped.items())[:10]:
+            print(f"  {date}: {'; '.join(reasons)}")
+    
+    return manifest
 
 def check_database_structure():
     """Check the structure of both databases and print details."""
@@ -48,8 +112,7 @@ def check_database_structure():
     # Check SPOT database
     print("\nChecking SPOT database structure:")
     print("================================")
-    spot_conn = sqlite3.connect(os.path.join(data_dir, 'SPOT.db'))
-    spot_cursor = spot_conn.cursor()
+    spot_cursor = connection(os.path.join(data_dir, 'SPOT.db')).cursor()
     
     # Get all table names
     spot_cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
@@ -62,28 +125,38 @@ def check_database_structure():
         # Get sample data from first table
         first_table = tables[0][0]
         print(f"\nSample data from table '{first_table}':")
-        spot_cursor.execute(f"SELECT * FROM '{first_table}' LIMIT 1")
+        spot_cursor.execute(f'SELECT * FROM "{first_table}" LIMIT 1')
         columns = [description[0] for description in spot_cursor.description]
         print("Columns:", columns)
         
         # Get time range for first table
         spot_cursor.execute(f"""
             SELECT MIN(time), MAX(time)
-            FROM '{first_table}'
-            WHERE time >= '09:15:00' AND time <= '15:30:00'
-        """)
+            FROM "{first_table}"
+            WHERE time >= ? AND time <= ?
+        """, ('09:15:00', '15:30:00'))
         min_time, max_time = spot_cursor.fetchone()
         print(f"Time range: {min_time} to {max_time}")
-    
-    spot_conn.close()
 
 if __name__ == "__main__":
-    check_database_structure()
+    parser = argparse.ArgumentParser(description="Check and profile SPOT.db and OPT.db.")
+    parser.add_argument('--explore', action='store_true',
+                        help="also print the schema and a sample row of each database")
+    parser.add_argument('--workers', type=int, help="profiling threads (default: all cores)")
+    parser.add_argument('--refresh', action='store_true',
+                        help="profile every table again instead of only new ones")
+    args = parser.parse_args()
     
-    # Explore spot price database
-    print("Exploring SPOT database...")
-    explore_database(os.path.join(data_dir, 'SPOT.db'))
+    check_database_structure()
+    profile_database(workers=args.workers, refresh=args.refresh)
     
-    # Explore options database
-    print("\nExploring OPT database...")
-    explore_database(os.path.join(data_dir, 'OPT.db')) 
\ No newline at end of file
+    if args.explore:
+        data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+        
+        # Explore spot price database
+        print("Exploring SPOT database...")
+        explore_database(os.path.join(data_dir, 'SPOT.db'))
+        
+        # Explore options database
+        print("\nExploring OPT database...")
+        explore_database(os.path.join(data_dir, 'OPT.db'))
@@ -1,10 +1,34 @@
-import sqlite3
+import numpy as np
 import pandas as pd
 from datetime import datetime, time
 import os
 
-def get_spot_movement():
-    """Analyze spot price movement between 9:15 AM and 3:25 PM."""
+from intermediates import write_frame
+from market_store import open_store
+from snapshots import fetch_snapshots
+from trading_calendar import build_calendar
+
+def get_spot_movement(save=True, store=None, open_time='09:15:00', close_time='15:25:00',
+                      calendar=None, dates=None):
+    """
+    Analyze spot price movement between 9:15 AM and 3:25 PM.
+    
+    Both snapshots are read for every day in one pass. The price_915 and
+    price_1525 columns hold the closes at open_time and close_time.
+    
+    Args:
+        save (bool): Write spot_movement to the reports directory
+        store (MarketStore): Columnar store to read from; opened from
+            data/store when built, otherwise SPOT.db is queried
+        open_time (str): Time of the opening snapshot
+        close_time (str): Time of the entry snapshot
+        calendar (TradingCalendar): Shared trading calendar used to tag
+            expiry days; built from the available day tables when not given
+        dates (list): Only analyze these ddmmyyyy days, all days by default
+        
+    Returns:
+        pd.DataFrame: Spot movement indexed by date, or None if no data
+    """
     # Get absolute paths
     current_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(os.path.dirname(current_dir), 'data')
@@ -13,64 +37,37 @@ def get_spot_movement():
     # Create reports directory if it doesn't exist
     os.makedirs(reports_dir, exist_ok=True)
     
-    # Connect to database
-    conn = sqlite3.connect(os.path.join(data_dir, 'SPOT.db'))
-    cursor = conn.cursor()
+    if store is None:
+        store = open_store(data_dir)
     
-    # Get all tables (dates)
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    dates = [table[0] for table in cursor.fetchall()]
+    # Read both snapshots for all days at once
+    snapshots = fetch_snapshots([open_time, close_time], store=store,
+                                db_path=os.path.join(data_dir, 'SPOT.db'), dates=dates)
     
-    # Initialize results DataFrame
-    results = []
+    df_pivot = pd.DataFrame({
+        'price_915': snapshots[open_time],
+        'price_1525': snapshots[close_time]
+    }).dropna()
     
-    # Process each date
-    for date in dates:
-        try:
-            # Query for 9:15 AM price
-            cursor.execute(f"""
-                SELECT time, close as price
-                FROM "{date}"
-                WHERE time = '09:15:00'
-            """)
-            morning_data = cursor.fetchone()
-            
-            # Query for 3:25 PM price
-            cursor.execute(f"""
-                SELECT time, close as price
-                FROM "{date}"
-                WHERE time = '15:25:00'
-            """)
-            afternoon_data = cursor.fetchone()
-            
-            if morning_data and afternoon_data:
-                results.append({
-                    'date': date,
-                    'price_915': morning_data[1],
-                    'price_1525': afternoon_data[1]
-                })
-        except sqlite3.OperationalError as e:
-            print(f"Error processing date {date}: {str(e)}")
-            continue
-    
-    conn.close()
-    
-    # Convert results to DataFrame
-    df_pivot = pd.DataFrame(results)
     if not df_pivot.empty:
-        df_pivot.set_index('date', inplace=True)
-        
         # Calculate price movement
         df_pivot['price_change'] = df_pivot['price_1525'] - df_pivot['price_915']
-        df_pivot['direction'] = df_pivot['price_change'].apply(
-            lambda x: 'UP' if x > 0 else 'DOWN' if x < 0 else 'FLAT'
+        df_pivot['direction'] = np.select(
+            [df_pivot['price_change'] > 0, df_pivot['price_change'] < 0],
+            ['UP', 'DOWN'], default='FLAT'
         )
         
         # Calculate percentage change
         df_pivot['pct_change'] = (df_pivot['price_change'] / df_pivot['price_915'] * 100).round(2)
         
+        # Tag days on which the weekly contract expires
+        if calendar is None:
+            calendar = build_calendar(data_dir, store)
+        df_pivot['is_expiry'] = [calendar.is_expiry(date) for date in df_pivot.index]
+        
         # Save results
-        df_pivot.to_csv(os.path.join(reports_dir, 'spot_movement.csv'))
+        if save:
+            write_frame(df_pivot, 'spot_movement', reports_dir)
         
         # Print summary
         print("\nSpot Price Movement Analysis:")
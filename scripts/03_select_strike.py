@@ -3,54 +3,147 @@ import numpy as np
 from datetime import datetime
 import os
 
-def select_strikes(spot_price, strike_interval=100):
+from intermediates import read_frame, write_frame
+from market_store import open_store
+from option_chain import StrikeIndex
+
+def percent_of_spot(spot_prices, strike_interval, hedge_pct=2.0, **kwargs):
+    """Hedge distance of hedge_pct percent of spot, rounded to whole strikes (at least one)."""
+    steps = np.round(np.asarray(spot_prices) * hedge_pct / 100 / strike_interval)
+    return np.maximum(steps, 1) * strike_interval
+
+def strikes_away(spot_prices, strike_interval, hedge_steps=1, **kwargs):
+    """Hedge distance of a fixed number of strikes."""
+    return np.full(len(spot_prices), hedge_steps * strike_interval)
+
+# Hedge distance rules; each returns the distance from the ATM strike per day
+HEDGE_RULES = {
+    'percent': percent_of_spot,
+    'steps': strikes_away
+}
+
+def select_strikes_vectorized(spot_prices, directions, strike_interval=100, hedge_rule='percent',
+                              hedge_pct=2.0, hedge_steps=1, dates=None, strike_index=None):
+    """
+    Select ATM and hedge strikes for every day in one array operation.
+    
+    The ATM option is sold in the direction of the move (PE when the market
+    went up, CE otherwise) and the hedge is bought further out of the money
+    on the same option type.
+    
+    Args:
+        spot_prices (array-like): Spot price at entry per day
+        directions (array-like): 'UP', 'DOWN' or 'FLAT' per day
+        strike_interval (int): Interval between strike prices
+        hedge_rule (str): Key of HEDGE_RULES for the hedge distance
+        hedge_pct (float): Distance in percent of spot for the 'percent' rule
+        hedge_steps (int): Distance in strikes for the 'steps' rule
+        dates (list): ddmmyyyy date per day, needed to snap strikes
+        strike_index (StrikeIndex): Snap both strikes to the nearest strike
+            quoted that day in the traded expiry when given; the hedge
+            stays at least one listed strike away from the ATM strike
+    
+    Returns:
+        tuple: (atm_strikes, hedge_strikes, option_types) arrays
+    """
+    spot_prices = np.asarray(spot_prices, dtype=float)
+    up = np.asarray(directions) == 'UP'
+    option_types = np.where(up, 'PE', 'CE')
+    
+    # Calculate nearest strike price
+    atm_strikes = (np.round(spot_prices / strike_interval) * strike_interval).astype(np.int64)
+    if strike_index is not None:
+        atm_strikes = strike_index.snap(dates, atm_strikes, option_types)
+    
+    # Hedge below the ATM for a sold PE, above it for a sold CE
+    distance = HEDGE_RULES[hedge_rule](spot_prices, strike_interval,
+                                       hedge_pct=hedge_pct, hedge_steps=hedge_steps)
+    hedge_strikes = (atm_strikes + np.where(up, -1, 1) * distance).astype(np.int64)
+    if strike_index is not None:
+        hedge_strikes = strike_index.snap(dates, hedge_strikes, option_types, atm=atm_strikes)
+    
+    return atm_strikes, hedge_strikes, option_types
+
+def select_strikes(spot_price, strike_interval=100, direction='UP', hedge_rule='percent', hedge_pct=2.0,
+                   hedge_steps=1):
     """
     Select ATM and hedge strike prices based on spot price.
     
     Args:
         spot_price (float): Current spot price
         strike_interval (int): Interval between strike prices
-        
+        direction (str): 'UP' or 'DOWN' market move
+        hedge_rule (str): Key of HEDGE_RULES for the hedge distance
+        hedge_pct (float): Distance in percent of spot for the 'percent' rule
+        hedge_steps (int): Distance in strikes for the 'steps' rule
+    
     Returns:
         tuple: (atm_strike, hedge_strike)
     """
-    # Calculate nearest strike price
-    atm_strike = round(spot_price / strike_interval) * strike_interval
+    atm, hedge, _ = select_strikes_vectorized([spot_price], [direction], strike_interval, hedge_rule,
+                                              hedge_pct, hedge_steps)
+    return int(atm[0]), int(hedge[0])
+
+def process_strike_selection(spot_data=None, save=True, strike_interval=100, hedge_rule='percent',
+                             hedge_pct=2.0, hedge_steps=1, snap_strikes=True, strike_index=None,
+                             store=None, entry_time='15:25:00', expiry_rollover='expiry_day'):
+    """
+    Process strike selection for all trading days.
     
-    # Select hedge strike (one strike above for upward movement)
-    hedge_strike = atm_strike + strike_interval
+    Args:
+        spot_data (pd.DataFrame): Output of get_spot_movement; read from
+            the stored spot_movement when not given
+        save (bool): Write strike_selection to the reports directory
+        strike_interval (int): Interval between strike prices
+        hedge_rule (str): Key of HEDGE_RULES for the hedge distance
+        hedge_pct (float): Distance in percent of spot for the 'percent' rule
+        hedge_steps (int): Distance in strikes for the 'steps' rule
+        snap_strikes (bool): Move strikes to the nearest strike quoted in
+            the option chain at entry_time
+        strike_index (StrikeIndex): Shared strike index; built from the
+            store or OPT.db when snapping and not given
+        store (MarketStore): Columnar store for the strike index
+        entry_time (str): Time the legs are entered
+        expiry_rollover (str): Expiry rule of 04 the strike index snaps in
     
-    return atm_strike, hedge_strike
-
-def process_strike_selection():
-    """Process strike selection for all trading days."""
+    Returns:
+        pd.DataFrame: Selected strikes indexed by date
+    """
     # Get absolute paths
     current_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(os.path.dirname(current_dir), 'data')
     reports_dir = os.path.join(os.path.dirname(current_dir), 'reports')
     
     # Read spot movement data
-    try:
-        spot_data = pd.read_csv(os.path.join(reports_dir, 'spot_movement.csv'))
-        spot_data.set_index('date', inplace=True)
-    except FileNotFoundError:
-        print("Error: spot_movement.csv not found. Please run 02_get_spot_movement.py first.")
-        return
-    
-    # Initialize results DataFrame
-    results = pd.DataFrame(index=spot_data.index)
-    
-    # Process each day
-    for date in spot_data.index:
-        spot_price = spot_data.loc[date, 'price_1525']
-        atm_strike, hedge_strike = select_strikes(spot_price)
-        
-        results.loc[date, 'spot_price'] = spot_price
-        results.loc[date, 'atm_strike'] = atm_strike
-        results.loc[date, 'hedge_strike'] = hedge_strike
-        results.loc[date, 'direction'] = spot_data.loc[date, 'direction']
+    if spot_data is None:
+        spot_data = read_frame('spot_movement', reports_dir)
+        if spot_data is None:
+            print("Error: spot_movement not found. Please run 02_get_spot_movement.py first.")
+            return
+    
+    if snap_strikes and strike_index is None:
+        if store is None:
+            store = open_store(data_dir)
+        strike_index = StrikeIndex(data_dir, store, entry_time, expiry_rollover=expiry_rollover)
+    
+    # Select strikes for every day at once
+    atm_strikes, hedge_strikes, option_types = select_strikes_vectorized(
+        spot_data['price_1525'].to_numpy(), spot_data['direction'].to_numpy(),
+        strike_interval, hedge_rule, hedge_pct, hedge_steps,
+        dates=list(spot_data.index), strike_index=strike_index if snap_strikes else None
+    )
+    
+    results = pd.DataFrame({
+        'spot_price': spot_data['price_1525'].to_numpy(),
+        'atm_strike': atm_strikes,
+        'hedge_strike': hedge_strikes,
+        'direction': spot_data['direction'].to_numpy(),
+        'option_type': option_types
+    }, index=spot_data.index)
     
     # Save results
-    results.to_csv(os.path.join(reports_dir, 'strike_selection.csv'))
+    if save:
+        write_frame(results, 'strike_selection', reports_dir)
     
     # Print summary
     print("\nStrike Selection Analysis:")
@@ -64,4 +157,4 @@ def process_strike_selection():
     return results
 
 if __name__ == "__main__":
-    process_strike_selection() 
\ No newline at end of file
+    process_strike_selection()
@@ -1,8 +1,12 @@
-import sqlite3
 import pandas as pd
 from datetime import datetime
 import os
 
+from executor import DayExecutor, print_failures
+from intermediates import read_frame, write_frame
+from market_store import open_store
+from option_chain import OptionChainLoader
+
 def format_date(date_str):
     """Format date string to match table names (e.g., 1092023 -> 01092023)."""
     try:
@@ -15,8 +19,65 @@ def format_date(date_str):
     except:
         return date_str
 
-def fetch_option_prices():
-    """Fetch option prices at 3:25 PM for selected strikes."""
+def _price_day(shared, date):
+    """Price both legs of one day at the entry time; raises when the day has no chain."""
+    strike_data, chain_loader, entry_time, expiry_rollover = shared
+    
+    # Format date for table name
+    table_date = format_date(date)
+    
+    atm_strike = int(strike_data.loc[date, 'atm_strike'])
+    hedge_strike = int(strike_data.loc[date, 'hedge_strike'])
+    direction = strike_data.loc[date, 'direction']
+    
+    # Both legs are on the option type chosen by strike selection
+    if 'option_type' in strike_data.columns:
+        atm_type = hedge_type = strike_data.loc[date, 'option_type']
+    else:
+        atm_type = "CE" if direction == "UP" else "PE"
+        hedge_type = "PE" if direction == "UP" else "CE"
+    
+    # Resolve the contracts through an index of the entry minute, so every
+    # expiry on the day costs the same dict lookup
+    contracts = chain_loader.contracts(table_date, entry_time, entry_time)
+    if contracts is None:
+        raise LookupError(f"no option chain for {table_date}")
+    expiry = contracts.select_expiry(expiry_rollover)
+    
+    return {
+        'date': date,
+        'atm_strike': atm_strike,
+        'hedge_strike': hedge_strike,
+        'direction': direction,
+        'option_type': atm_type,
+        'expiry': str(expiry) if expiry is not None else None,
+        'atm_price': contracts.price(entry_time, expiry, atm_strike, atm_type),
+        'hedge_price': contracts.price(entry_time, expiry, hedge_strike, hedge_type)
+    }
+
+def fetch_option_prices(strike_data=None, save=True, store=None, chain_loader=None,
+                        entry_time='15:25:00', executor=None, expiry_rollover='expiry_day'):
+    """
+    Fetch option prices at 3:25 PM for selected strikes.
+    
+    Args:
+        strike_data (pd.DataFrame): Output of process_strike_selection; read
+            from the stored strike_selection when not given
+        save (bool): Write option_prices to the reports directory
+        store (MarketStore): Columnar store to read from; opened from
+            data/store when built, otherwise OPT.db is queried
+        chain_loader (OptionChainLoader): Shared chain loader; created from
+            the store or OPT.db when not given
+        entry_time (str): Time the legs are priced at
+        executor (DayExecutor): Runs the days in parallel; a thread pool
+            over all cores by default
+        expiry_rollover (str): Expiry rule, see contracts.EXPIRY_ROLLOVER;
+            by default a trade entered on expiry day goes to the next expiry
+        
+    Returns:
+        pd.DataFrame: Entry premiums indexed by date; days that failed are
+        listed in results.attrs['failures']
+    """
     # Get absolute paths
     current_dir = os.path.dirname(os.path.abspath(__file__))
     base_dir = os.path.dirname(current_dir)
@@ -24,81 +85,51 @@ def fetch_option_prices():
     reports_dir = os.path.join(base_dir, 'reports')
     
     # Read strike selection data
-    try:
-        strike_data = pd.read_csv(os.path.join(reports_dir, 'strike_selection.csv'))
-        strike_data.set_index('date', inplace=True)
-    except FileNotFoundError:
-        print("Error: strike_selection.csv not found. Please run 03_select_strike.py first.")
-        return
-    
-    # Connect to options database
-    conn = sqlite3.connect(os.path.join(data_dir, 'OPT.db'))
-    cursor = conn.cursor()
-    
-    # Initialize results DataFrame
-    results = pd.DataFrame(index=strike_data.index)
-    
-    # Process each day
-    for date in strike_data.index:
-        try:
-            # Format date for table name
-            table_date = format_date(date)
-            
-            atm_strike = int(strike_data.loc[date, 'atm_strike'])
-            hedge_strike = int(strike_data.loc[date, 'hedge_strike'])
-            direction = strike_data.loc[date, 'direction']
-            
-            # Query for ATM option price (CE for UP, PE for DOWN)
-            atm_query = f"""
-            SELECT close as price
-            FROM '{table_date}'
-            WHERE time = '15:25:00'
-            AND strike = {atm_strike}
-            AND instrument_type = '{"CE" if direction == "UP" else "PE"}'
-            """
-            
-            # Query for hedge option price (PE for UP, CE for DOWN)
-            hedge_query = f"""
-            SELECT close as price
-            FROM '{table_date}'
-            WHERE time = '15:25:00'
-            AND strike = {hedge_strike}
-            AND instrument_type = '{"PE" if direction == "UP" else "CE"}'
-            """
-            
-            # Execute queries
-            cursor.execute(atm_query)
-            atm_price = cursor.fetchone()
-            
-            cursor.execute(hedge_query)
-            hedge_price = cursor.fetchone()
-            
-            # Store results
-            results.loc[date, 'atm_strike'] = atm_strike
-            results.loc[date, 'hedge_strike'] = hedge_strike
-            results.loc[date, 'direction'] = direction
-            results.loc[date, 'atm_price'] = atm_price[0] if atm_price else None
-            results.loc[date, 'hedge_price'] = hedge_price[0] if hedge_price else None
-            
-        except (sqlite3.OperationalError, KeyError) as e:
-            print(f"Error processing date {date}: {str(e)}")
-            continue
-    
-    conn.close()
+    if strike_data is None:
+        strike_data = read_frame('strike_selection', reports_dir)
+        if strike_data is None:
+            print("Error: strike_selection not found. Please run 03_select_strike.py first.")
+            return
+    
+    # Read from the columnar store when it has been built
+    if store is None:
+        store = open_store(data_dir)
+    
+    if chain_loader is None:
+        chain_loader = OptionChainLoader(data_dir, store)
+    
+    # An executor made here is closed again; one passed in belongs to the caller
+    owned = executor is None
+    if owned:
+        executor = DayExecutor()
+    
+    # Price every day on the executor; rows come back in date order
+    days = executor.map(_price_day, strike_data.index,
+                        (strike_data, chain_loader, entry_time, expiry_rollover))
+    if owned:
+        executor.close()
+    rows = days.values()
+    
+    results = pd.DataFrame(rows, columns=['date', 'atm_strike', 'hedge_strike', 'direction',
+                                          'option_type', 'expiry', 'atm_price', 'hedge_price'])
+    results.set_index('date', inplace=True)
     
     # Drop rows with missing prices
     results = results.dropna(subset=['atm_price', 'hedge_price'])
     
     # Calculate total premium
     results['total_premium'] = results['atm_price'] + results['hedge_price']
+    results.attrs['failures'] = days.failures
     
     # Save results
-    results.to_csv(os.path.join(reports_dir, 'option_prices.csv'))
+    if save:
+        write_frame(results, 'option_prices', reports_dir)
     
     # Print summary
     print("\nOption Price Analysis:")
     print("=====================")
     print(f"Total days processed: {len(results)}")
+    print_failures(days.failures)
     print("\nAverage Premiums by Direction:")
     print(results.groupby('direction')[['atm_price', 'hedge_price', 'total_premium']].mean())
     print("\nSample of first 5 days:")
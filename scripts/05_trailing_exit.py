@@ -1,35 +1,31 @@
 import sqlite3
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import os
 
-def format_date(date_str):
-    """Format date string to match table names (e.g., 1092023 -> 01092023)."""
-    try:
-        # Convert to datetime for consistent formatting
-        date = datetime.strptime(str(date_str), '%d%m%Y')
-        return date.strftime('%d%m%Y')
-    except:
-        return str(date_str)
+import instrumentation
+from bar_cache import open_bar_cache
+from executor import DayExecutor, print_failures
+from intermediates import read_frame, write_frame
+from market_store import list_day_tables, minute_of_day, open_store
+from option_chain import OptionChainLoader
+from positions import LegBook
+from trading_calendar import TradingCalendar, build_calendar
+from trailing import bar_matrix, trailing_exits
 
-def get_next_trading_day(conn, date_str):
+def get_next_trading_day(conn, date_str, calendar=None):
     """Get the next available trading day from the database."""
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
-    all_dates = [table[0] for table in cursor.fetchall()]
-    
-    try:
-        current_idx = all_dates.index(format_date(date_str))
-        if current_idx < len(all_dates) - 1:
-            return all_dates[current_idx + 1]
-    except ValueError:
-        pass
-    return None
+    if calendar is None:
+        calendar = TradingCalendar(list_day_tables(conn))
+    return calendar.next_day(date_str)
 
 def calculate_trailing_exit(prices, direction, window=3):
     """
     Calculate trailing exit based on 3-minute high/low.
     
+    Single-day wrapper around trailing.trailing_exits; prices is not modified.
+    
     Args:
         prices (pd.DataFrame): DataFrame with time and close price columns
         direction (str): 'UP' or 'DOWN' indicating trade direction
@@ -41,44 +37,117 @@ def calculate_trailing_exit(prices, direction, window=3):
     if len(prices) < window:
         return None, None, None
     
-    # Get entry price (first price of the day)
-    entry_price = prices.iloc[0]['close']
-    
     # For UP trades, we trail below the low
     # For DOWN trades, we trail above the high
-    price_col = 'low' if direction == 'UP' else 'high'
-    comparison = (lambda x, y: x > y) if direction == 'UP' else (lambda x, y: x < y)
-    
-    # Calculate rolling extreme
-    prices['rolling_extreme'] = prices[price_col].rolling(window=window).min() if direction == 'UP' else prices[price_col].rolling(window=window).max()
+    side = 1 if direction == 'UP' else -1
+    exit_index, exit_price, _ = trailing_exits(
+        prices['high'].to_numpy()[np.newaxis, :],
+        prices['low'].to_numpy()[np.newaxis, :],
+        prices['close'].to_numpy()[np.newaxis, :],
+        [side], window
+    )
     
-    # Initialize variables
-    current_extreme = float('inf') if direction == 'UP' else float('-inf')
-    exit_price = None
-    exit_time = None
+    # Entry price is the first price of the day
+    entry_price = prices['close'].iloc[0]
+    exit_time = prices['time'].iloc[exit_index[0]]
     
-    # Find the first price that crosses the trailing stop
-    for i in range(window, len(prices)):
-        current_price = prices.iloc[i]['close']
-        prev_extreme = prices['rolling_extreme'].iloc[i-1]
-        
-        if comparison(prev_extreme, current_extreme):
-            current_extreme = prev_extreme
+    return exit_price[0], exit_time, entry_price
+
+def _load_trade_bars(shared, trade):
+    """Read the next-morning bars of one trade's legs; raises when the day has no chain."""
+    book, groups, next_dates, chain_loader, start_time, end_time, bar_minutes = shared
+    next_date = next_dates.get(trade)
+    if next_date is None:
+        return []
+    
+    parts = []
+    for expiry, legs in groups[trade]:
+        # Keep trading the contracts that were entered, not the next day's nearest expiry,
+        # and read only the strikes between the trade's legs
+        strikes = book.strike[legs]
+        chain = chain_loader.load(next_date, start_time, end_time,
+                                  expiry if isinstance(expiry, str) else None, bar_minutes,
+                                  strikes=(strikes.min(), strikes.max()))
+        if chain is None:
+            raise LookupError(f"no option chain for {next_date}")
         
-        if comparison(current_price, current_extreme):
-            exit_price = current_price
-            exit_time = prices.iloc[i]['time']
-            break
-    
-    # If no exit found, use the last price
-    if exit_price is None:
-        exit_price = prices.iloc[-1]['close']
-        exit_time = prices.iloc[-1]['time']
+        leg_minutes, fields = chain.leg_bars(strikes, book.option_type[legs])
+        have = ~np.isnan(fields['close'])
+        parts.append((np.broadcast_to(legs[:, np.newaxis], have.shape)[have],
+                      np.broadcast_to(leg_minutes, have.shape)[have],
+                      fields['high'][have], fields['low'][have], fields['close'][have]))
+    return parts
+
+def _load_leg_bars(book, next_dates, chain_loader, start_time, end_time, bar_minutes=1, executor=None):
+    """
+    Read the next-morning option bars (N-minute when bar_minutes > 1) of every leg as flat arrays.
     
-    return exit_price, exit_time, entry_price
+    Trades are loaded on the executor and their bars concatenated in trade
+    order. Returns (row_index, minutes, values, failures) where failures
+    holds a DayFailure for every trade whose bars could not be read.
+    """
+    # Legs of one trade on the same expiry share one chain
+    groups = {}
+    indices = pd.Series(np.arange(len(book))).groupby(
+        [pd.Series(book.trade), pd.Series(book.expiry)], sort=False, dropna=False
+    ).indices
+    for (trade, expiry), legs in indices.items():
+        groups.setdefault(trade, []).append((expiry, legs))
+    
+    # An executor made here is closed again; one passed in belongs to the caller
+    owned = executor is None
+    executor = executor or DayExecutor()
+    days = executor.map(_load_trade_bars, list(groups),
+                        (book, groups, next_dates, chain_loader, start_time, end_time, bar_minutes))
+    if owned:
+        executor.close()
+    parts = [part for trade_parts in days.values() for part in trade_parts]
+    
+    if not parts:
+        return np.array([], dtype=int), np.array([], dtype=int), {
+            'high': np.array([]), 'low': np.array([]), 'close': np.array([])
+        }, days.failures
+    row_index, minutes, highs, lows, closes = zip(*parts)
+    return np.concatenate(row_index), np.concatenate(minutes), {
+        'high': np.concatenate(highs),
+        'low': np.concatenate(lows),
+        'close': np.concatenate(closes)
+    }, days.failures
 
-def process_trailing_exits():
-    """Process trailing exits for all trading days."""
+def process_trailing_exits(option_data=None, save=True, store=None, window=3,
+                           entry_time='09:15:00', exit_time='09:45:00', workers=None,
+                           calendar=None, chain_loader=None, bar_minutes=1, executor=None):
+    """
+    Process trailing exits for every leg of every trade.
+    
+    Each leg trails on its own option chart the next morning: the sold ATM
+    leg above the 3-minute high and the bought hedge below the 3-minute low.
+    The bars of all legs are loaded into one matrix and stepped together by
+    positions.LegBook.
+    
+    Args:
+        option_data (pd.DataFrame): Output of fetch_option_prices; read from
+            the stored option_prices when not given
+        save (bool): Write trailing_exits to the reports directory
+        store (MarketStore): Columnar store to read from; opened from
+            data/store when built, otherwise OPT.db is queried
+        window (int): Number of minutes in the trailing window
+        entry_time (str): First bar of the next morning
+        exit_time (str): Forced exit time if the stop is not hit
+        workers (int): Shard the legs across this many processes when > 1
+        calendar (TradingCalendar): Shared trading calendar; built from the
+            available day tables when not given
+        chain_loader (OptionChainLoader): Shared chain loader; created from
+            the store or OPT.db when not given
+        bar_minutes (int): Trail on N-minute bars (from data/bars when
+            built) instead of minute bars; window then counts N-minute bars
+        executor (DayExecutor): Loads the trades' bars in parallel; a
+            thread pool over all cores by default
+        
+    Returns:
+        pd.DataFrame: One row per leg with its entry and exit, indexed by
+        trade date; trades that failed are listed in results.attrs['failures']
+    """
     # Get absolute paths
     current_dir = os.path.dirname(os.path.abspath(__file__))
     base_dir = os.path.dirname(current_dir)
@@ -86,93 +155,76 @@ def process_trailing_exits():
     reports_dir = os.path.join(base_dir, 'reports')
     
     # Read option prices data
-    try:
-        option_data = pd.read_csv(os.path.join(reports_dir, 'option_prices.csv'))
-        option_data.set_index('date', inplace=True)
-    except FileNotFoundError:
-        print("Error: option_prices.csv not found. Please run 04_fetch_option_prices.py first.")
-        return
+    if option_data is None:
+        option_data = read_frame('option_prices', reports_dir)
+        if option_data is None:
+            print("Error: option_prices not found. Please run 04_fetch_option_prices.py first.")
+            return
     
-    # Connect to spot database
-    conn = sqlite3.connect(os.path.join(data_dir, 'SPOT.db'))
+    # Read from the columnar store when it has been built
+    if store is None:
+        store = open_store(data_dir)
     
-    # Initialize results DataFrame
-    results = pd.DataFrame(index=option_data.index)
+    if calendar is None:
+        calendar = build_calendar(data_dir, store)
     
-    # Process each day
-    for date in option_data.index:
-        try:
-            # Get next trading day
-            next_date = get_next_trading_day(conn, date)
-            if next_date is None:
-                print(f"Warning: No next trading day found for {date}")
-                continue
-            
-            # Query next day's morning prices
-            query = f"""
-            SELECT time, open, high, low, close
-            FROM '{next_date}'
-            WHERE time >= '09:15:00'
-            AND time <= '09:30:00'
-            ORDER BY time
-            """
-            
-            # Get price data
-            prices = pd.read_sql_query(query, conn)
-            
-            if not prices.empty:
-                # Get direction for this trade
-                direction = option_data.loc[date, 'direction']
-                
-                # Calculate trailing exit
-                exit_price, exit_time, spot_entry = calculate_trailing_exit(prices, direction)
-                
-                if exit_price is not None:
-                    # Store results
-                    results.loc[date, 'option_premium'] = option_data.loc[date, 'total_premium']
-                    results.loc[date, 'spot_entry'] = spot_entry
-                    results.loc[date, 'spot_exit'] = exit_price
-                    results.loc[date, 'exit_time'] = exit_time
-                    results.loc[date, 'direction'] = direction
-        
-        except (sqlite3.OperationalError, KeyError) as e:
-            print(f"Error processing date {date}: {str(e)}")
-            continue
-    
-    conn.close()
-    
-    # Drop rows with missing data
-    results = results.dropna()
+    if chain_loader is None:
+        chain_loader = OptionChainLoader(data_dir, store, bar_cache=open_bar_cache(data_dir))
     
-    # Calculate P&L
-    results['spot_points'] = results.apply(
-        lambda row: row['spot_exit'] - row['spot_entry'] if row['direction'] == 'UP' else row['spot_entry'] - row['spot_exit'],
-        axis=1
-    )
+    # Get next trading day of every trade
+    next_dates = {}
+    for date in option_data.index:
+        next_date = calendar.next_day(date)
+        if next_date is None:
+            print(f"Warning: No next trading day found for {date}")
+        next_dates[date] = next_date
+    
+    # One slot per leg; both legs enter at the prices fetched at entry
+    book = LegBook.from_trades(option_data)
+    
+    # Load the next morning of every leg into one bar matrix
+    with instrumentation.span('load_bars'):
+        row_index, minutes, values, failures = _load_leg_bars(book, next_dates, chain_loader, entry_time,
+                                                              exit_time, bar_minutes, executor)
+        bars = bar_matrix(row_index, minutes, values, len(book),
+                          minute_of_day(entry_time), minute_of_day(exit_time))
+    
+    with instrumentation.span('trail'):
+        book.trail(bars['high'], bars['low'], bars['close'], bars['minute'], window, workers)
+    
+    results = book.to_frame().drop(columns=['entry_fill', 'exit_fill'])
+    results['direction'] = option_data['direction'].reindex(results.index).to_numpy()
+    results['exit_date'] = [next_dates.get(date) for date in results.index]
+    
+    # Drop trades with a leg that has no exit, e.g. a contract that expired on the entry day
+    complete = book.complete()
+    for date in pd.unique(results.index[~complete]):
+        if next_dates.get(date) is not None:
+            print(f"Warning: No next-morning bars for every leg of {date}")
+    results = results[complete]
+    results.attrs['failures'] = failures
     
     # Save results
-    results.to_csv(os.path.join(reports_dir, 'trailing_exits.csv'))
+    if save:
+        write_frame(results, 'trailing_exits', reports_dir)
     
     # Print summary
     print("\nTrailing Exit Analysis:")
     print("======================")
-    print(f"Total days processed: {len(results)}")
+    print(f"Total trades processed: {results.index.nunique()} ({len(results)} legs)")
+    print_failures(failures, "Failed trades")
     
-    print("\nAverage Exit Times by Direction:")
-    results['minutes_after_open'] = results['exit_time'].apply(
+    print("\nAverage Exit Times by Leg:")
+    minutes_after_open = results['exit_time'].apply(
         lambda x: (datetime.strptime(x, '%H:%M:%S') - datetime.strptime('09:15:00', '%H:%M:%S')).total_seconds() / 60
     )
-    avg_times = results.groupby('direction')['minutes_after_open'].mean()
-    print(avg_times)
+    print(minutes_after_open.groupby([results['leg'], results['direction']]).mean())
     
-    print("\nProfitability Analysis:")
-    print("\nAverage Spot Points by Direction:")
-    print(results.groupby('direction')['spot_points'].mean())
-    print("\nAverage Option Premium by Direction:")
-    print(results.groupby('direction')['option_premium'].mean())
+    print("\nExit Reasons by Leg:")
+    print(results.groupby(['leg', 'exit_reason']).size())
     
-    print("\nSample of first 5 days:")
-    print(results[['option_premium', 'spot_entry', 'spot_exit', 'spot_points', 'direction', 'exit_time']].head())
+    print("\nSample of first 5 legs:")
+    print(results[['leg', 'side', 'strike', 'option_type', 'entry_price', 'exit_price', 'exit_time', 'exit_reason']].head())
     
     return results
 
@@ -3,58 +3,59 @@ import numpy as np
 import os
 from datetime import datetime
 
-def calculate_pnl():
-    """Calculate PnL and drawdown analysis from trailing exits."""
+from intermediates import read_frame, write_frame
+from analytics import direction_stats, equity_curve, leg_pnl, summary_stats, trade_pnl
+
+def calculate_pnl(data=None, save=True, slippage_pct=0.5):
+    """
+    Calculate PnL and drawdown analysis from trailing exits.
+    
+    Slippage is applied to every leg's entry and exit fill, the legs are
+    valued on their own, and the leg PnL is summed per trade. All metrics
+    come from the analytics module and are computed without per-row Python.
+    
+    Args:
+        data (pd.DataFrame): Leg exits from process_trailing_exits; read
+            from the stored trailing_exits when not given
+        save (bool): Write pnl_analysis and leg_pnl to the reports
+            directory
+        slippage_pct (float): Slippage charged on entry and on exit, in
+            percent of each leg's price
+        
+    Returns:
+        tuple: (pnl_data, stats, direction_stats, legs); pnl_data has one
+        row per trade and legs one row per leg
+    """
     # Get absolute paths
     current_dir = os.path.dirname(os.path.abspath(__file__))
     base_dir = os.path.dirname(current_dir)
     reports_dir = os.path.join(base_dir, 'reports')
     
     # Read trailing exits data
-    try:
-        data = pd.read_csv(os.path.join(reports_dir, 'trailing_exits.csv'))
-        data.set_index('date', inplace=True)
-    except FileNotFoundError:
-        print("Error: trailing_exits.csv not found. Please run 05_trailing_exit.py first.")
-        return
+    if data is None:
+        data = read_frame('trailing_exits', reports_dir)
+        if data is None:
+            print("Error: trailing_exits not found. Please run 05_trailing_exit.py first.")
+            return
     
-    # Calculate P&L
-    data['pnl'] = data.apply(
-        lambda row: row['spot_points'] - row['option_premium'] if row['direction'] == 'UP' else row['spot_points'] - row['option_premium'],
-        axis=1
-    )
+    # Slippage-adjusted fills and PnL of every leg, summed per trade
+    legs = leg_pnl(data, slippage_pct)
+    data = trade_pnl(legs)
     
-    # Calculate cumulative P&L
-    data['cumulative_pnl'] = data['pnl'].cumsum()
-    
-    # Calculate drawdown
-    data['peak'] = data['cumulative_pnl'].cummax()
-    data['drawdown'] = data['cumulative_pnl'] - data['peak']
+    # Equity curve with drawdown depth and duration
+    curve = equity_curve(data['pnl'])
+    data[curve.columns] = curve.to_numpy()
     
     # Calculate statistics
-    stats = {
-        'Total Trades': len(data),
-        'Winning Trades': len(data[data['pnl'] > 0]),
-        'Losing Trades': len(data[data['pnl'] < 0]),
-        'Win Rate': len(data[data['pnl'] > 0]) / len(data) * 100,
-        'Average Win': data[data['pnl'] > 0]['pnl'].mean(),
-        'Average Loss': data[data['pnl'] < 0]['pnl'].mean(),
-        'Largest Win': data['pnl'].max(),
-        'Largest Loss': data['pnl'].min(),
-        'Total P&L': data['pnl'].sum(),
-        'Max Drawdown': data['drawdown'].min(),
-        'Average Drawdown': data['drawdown'].mean()
-    }
+    stats = summary_stats(data)
     
     # Calculate statistics by direction
-    direction_stats = data.groupby('direction').agg({
-        'pnl': ['count', 'mean', 'sum', 'min', 'max'],
-        'spot_points': ['mean', 'sum'],
-        'option_premium': ['mean', 'sum']
-    })
+    by_direction = direction_stats(data)
     
     # Save results
-    data.to_csv(os.path.join(reports_dir, 'pnl_analysis.csv'))
+    if save:
+        write_frame(data, 'pnl_analysis', reports_dir)
+        write_frame(legs, 'leg_pnl', reports_dir)
     
     # Print summary
     print("\nPnL and Drawdown Analysis:")
@@ -67,12 +68,15 @@ def calculate_pnl():
             print(f"{key}: {value}")
     
     print("\nStatistics by Direction:")
-    print(direction_stats)
+    print(by_direction)
+    
+    print("\nPnL by Leg:")
+    print(legs.groupby(['leg', 'side'])['pnl'].agg(['count', 'mean', 'sum']))
     
     print("\nSample of first 5 days:")
-    print(data[['direction', 'spot_points', 'option_premium', 'pnl', 'cumulative_pnl', 'drawdown']].head())
+    print(data[['direction', 'net_premium', 'slippage', 'pnl', 'cumulative_pnl', 'drawdown']].head())
     
-    return data, stats, direction_stats
+    return data, stats, by_direction, legs
 
 if __name__ == "__main__":
     calculate_pnl() 
\ No newline at end of file
@@ -1,102 +1,213 @@
 import pandas as pd
+import numpy as np
 import os
 from datetime import datetime
 
-def generate_excel_report():
-    """Generate a comprehensive Excel report with all analysis results."""
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+import instrumentation
+from analytics import period_breakdowns, summary_stats
+from contracts import contract_symbol
+from intermediates import read_frame
+from params import DEFAULT_PARAMS
+from positions import SELL, SIDE_NAMES
+from trading_calendar import normalize_date
+from trailing import EXIT_TIME, EXIT_TRAIL
+
+HEADER_FONT = Font(bold=True)
+
+def _cell_value(value):
+    """Convert a pandas/NumPy value to something openpyxl can write."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or (isinstance(value, float) and not np.isfinite(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+def _append_title(sheet, title):
+    cell = WriteOnlyCell(sheet, value=title)
+    cell.font = HEADER_FONT
+    sheet.append([cell])
+
+def _append_frame(sheet, frame, title=None):
+    """
+    Stream a DataFrame into a write-only sheet row by row.
+    
+    Args:
+        sheet (WriteOnlyWorksheet): Sheet to append to
+        frame (pd.DataFrame): Rows to write; the index is written as the
+            first column when it is named
+        title (str): Optional bold title row above the table
+    """
+    if title:
+        _append_title(sheet, title)
+    
+    if frame.index.name is not None:
+        frame = frame.reset_index()
+    
+    header = []
+    for name in frame.columns:
+        cell = WriteOnlyCell(sheet, value=str(name))
+        cell.font = HEADER_FONT
+        header.append(cell)
+    sheet.append(header)
+    
+    for row in frame.itertuples(index=False, name=None):
+        sheet.append([_cell_value(value) for value in row])
+    
+    # Blank row between tables
+    sheet.append([])
+
+def trade_list(trades, params, spot_movement=None):
+    """
+    Build the trade list with one row per leg.
+    
+    Args:
+        trades (pd.DataFrame): Leg rows from calculate_pnl
+        params (StrategyParams): Parameters the trades were run with
+        spot_movement (pd.DataFrame): Output of get_spot_movement, used for
+            the entry reason
+    
+    Returns:
+        pd.DataFrame: Trade list ready to write
+    """
+    entry_dates = [normalize_date(d) for d in trades.index]
+    
+    # Entry reason: the spot move that decided the side of the trade
+    reasons = 'Spot ' + trades['direction'].astype(str) + f" {params.open_time}-{params.entry_time}"
+    if spot_movement is not None and 'pct_change' in spot_movement:
+        pct = pd.Series(spot_movement['pct_change'].to_numpy(),
+                        index=[normalize_date(d) for d in spot_movement.index])
+        moves = pct.reindex(entry_dates).to_numpy()
+        reasons = reasons + pd.Series([f" ({m:+.2f}%)" if not np.isnan(m) else '' for m in moves],
+                                      index=trades.index)
+    
+    window = params.trail_window
+    span = f"{window}-min"
+    if params.trail_bar_minutes > 1:
+        span = f"{window} x {params.trail_bar_minutes}-min bar"
+    trailed = np.where(trades['side'] == SIDE_NAMES[SELL],
+                       f"Trailing stop ({span} high)", f"Trailing stop ({span} low)")
+    reason = trades['exit_reason'].astype(str).to_numpy()
+    exit_reasons = np.where(reason == EXIT_TRAIL, trailed,
+                            np.where(reason == EXIT_TIME, f"Time exit {params.exit_time}", reason))
+    
+    exit_dates = trades['exit_date'] if 'exit_date' in trades else pd.Series(None, index=trades.index)
+    
+    # Symbol of the contract each leg was resolved to
+    symbols = [contract_symbol(params.underlying, expiry, strike, option_type)
+               for expiry, strike, option_type in zip(trades['expiry'], trades['strike'], trades['option_type'])]
+    return pd.DataFrame({
+        'Entry Date': entry_dates,
+        'Entry Time': params.entry_time,
+        'Exit Date': [normalize_date(d) if pd.notna(d) else None for d in exit_dates],
+        'Exit Time': trades['exit_time'].to_numpy(),
+        'Leg': trades['leg'].to_numpy(),
+        'Side': trades['side'].to_numpy(),
+        'Symbol': symbols,
+        'Strike': trades['strike'].to_numpy(),
+        'Option Type': trades['option_type'].to_numpy(),
+        'Expiry': trades['expiry'].to_numpy(),
+        'Entry Price': trades['entry_price'].to_numpy(),
+        'Entry Fill': trades['entry_fill'].to_numpy(),
+        'Exit Price': trades['exit_price'].to_numpy(),
+        'Exit Fill': trades['exit_fill'].to_numpy(),
+        'Entry Reason': reasons.to_numpy(),
+        'Exit Reason': exit_reasons,
+        'P&L': trades['pnl'].to_numpy()
+    })
+
+def generate_excel_report(pnl_analysis=None, trades=None, params=None, spot_movement=None,
+                          stats=None, output_file=None):
+    """
+    Generate the Excel report with the three sheets from instructions.txt.
+    
+    Sheets are written in openpyxl's write-only mode, so rows are streamed
+    to disk instead of building the whole workbook in memory. Any dataset
+    that is not passed in is read from the stored stage outputs, so
+    the script still works on its own after the other stages.
+    
+    Args:
+        pnl_analysis (pd.DataFrame): Trade-level PnL returned by calculate_pnl
+        trades (pd.DataFrame): Leg-level PnL returned by calculate_pnl
+        params (StrategyParams): Parameters of the run, DEFAULT_PARAMS if not given
+        spot_movement (pd.DataFrame): Output of get_spot_movement
+        stats (dict): Summary metrics from calculate_pnl; computed from
+            pnl_analysis when not given
+        output_file (str): Workbook path, reports/Trade_Report.xlsx by default
+    
+    Returns:
+        str: Path of the written workbook
+    """
     # Get absolute paths
     current_dir = os.path.dirname(os.path.abspath(__file__))
     base_dir = os.path.dirname(current_dir)
     reports_dir = os.path.join(base_dir, 'reports')
     
-    # Check for required files
-    required_files = [
-        'spot_movement.csv',
-        'strike_selection.csv',
-        'option_prices.csv',
-        'trailing_exits.csv',
-        'pnl_analysis.csv'
-    ]
-    
-    for file in required_files:
-        if not os.path.exists(os.path.join(reports_dir, file)):
-            print(f"Error: {file} not found. Please run all previous scripts first.")
-            return
-    
-    # Create Excel writer
-    excel_file = os.path.join(reports_dir, 'Trade_Report.xlsx')
-    writer = pd.ExcelWriter(excel_file, engine='openpyxl')
-    
-    # Read and format each dataset
-    spot_movement = pd.read_csv(os.path.join(reports_dir, 'spot_movement.csv'))
-    strike_selection = pd.read_csv(os.path.join(reports_dir, 'strike_selection.csv'))
-    option_prices = pd.read_csv(os.path.join(reports_dir, 'option_prices.csv'))
-    trailing_exits = pd.read_csv(os.path.join(reports_dir, 'trailing_exits.csv'))
-    pnl_analysis = pd.read_csv(os.path.join(reports_dir, 'pnl_analysis.csv'))
-    
-    # Write each dataset to a separate sheet
-    spot_movement.to_excel(writer, sheet_name='Spot Movement', index=False)
-    strike_selection.to_excel(writer, sheet_name='Strike Selection', index=False)
-    option_prices.to_excel(writer, sheet_name='Option Prices', index=False)
-    trailing_exits.to_excel(writer, sheet_name='Trailing Exits', index=False)
-    pnl_analysis.to_excel(writer, sheet_name='PnL Analysis', index=False)
-    
-    # Create summary sheet
-    summary_data = {
-        'Metric': [
-            'Total Trading Days',
-            'Total Trades',
-            'Winning Trades',
-            'Losing Trades',
-            'Win Rate',
-            'Average Win',
-            'Average Loss',
-            'Largest Win',
-            'Largest Loss',
-            'Total P&L',
-            'Max Drawdown',
-            'Average Drawdown'
-        ],
-        'Value': [
-            len(spot_movement),
-            len(trailing_exits),
-            len(pnl_analysis[pnl_analysis['pnl'] > 0]),
-            len(pnl_analysis[pnl_analysis['pnl'] < 0]),
-            len(pnl_analysis[pnl_analysis['pnl'] > 0]) / len(pnl_analysis) * 100,
-            pnl_analysis[pnl_analysis['pnl'] > 0]['pnl'].mean(),
-            pnl_analysis[pnl_analysis['pnl'] < 0]['pnl'].mean(),
-            pnl_analysis['pnl'].max(),
-            pnl_analysis['pnl'].min(),
-            pnl_analysis['pnl'].sum(),
-            pnl_analysis['drawdown'].min(),
-            pnl_analysis['drawdown'].mean()
-        ]
+    params = params or DEFAULT_PARAMS
+    
+    datasets = {
+        'pnl_analysis': pnl_analysis,
+        'leg_pnl': trades
     }
     
-    summary_df = pd.DataFrame(summary_data)
-    summary_df.to_excel(writer, sheet_name='Summary', index=False)
+    # Read missing datasets
+    for name, frame in datasets.items():
+        if frame is None:
+            datasets[name] = read_frame(name, reports_dir)
+            if datasets[name] is None:
+                print(f"Error: {name} not found. Please run all previous scripts first.")
+                return
+    
+    pnl_analysis = datasets['pnl_analysis']
+    trades = datasets['leg_pnl']
+    
+    if spot_movement is None:
+        spot_movement = read_frame('spot_movement', reports_dir)
     
-    # Create direction-wise summary
-    direction_summary = pnl_analysis.groupby('direction').agg({
-        'pnl': ['count', 'mean', 'sum', 'min', 'max'],
-        'spot_points': ['mean', 'sum'],
-        'option_premium': ['mean', 'sum']
-    }).round(2)
+    workbook = Workbook(write_only=True)
     
-    direction_summary.to_excel(writer, sheet_name='Direction Summary')
+    # Sheet 1 - input parameters
+    with instrumentation.span('parameters_sheet'):
+        parameters = workbook.create_sheet('Parameters')
+        _append_frame(parameters, pd.DataFrame({
+            'Parameter': list(params.to_dict()),
+            'Value': list(params.to_dict().values())
+        }), 'Input Parameters')
     
-    # Save the Excel file
-    writer.close()
+    # Sheet 2 - summary, period breakdowns and date-wise PnL and drawdown
+    with instrumentation.span('pnl_sheet'):
+        pnl_sheet = workbook.create_sheet('PnL')
+        if stats is None:
+            stats = summary_stats(pnl_analysis)
+        _append_frame(pnl_sheet, pd.DataFrame({'Metric': list(stats), 'Value': list(stats.values())}), 'Summary')
+        for title, table in period_breakdowns(pnl_analysis).items():
+            _append_frame(pnl_sheet, table, title)
+        
+        daily = pnl_analysis.copy()
+        daily.index = pd.Index([normalize_date(d) for d in daily.index], name='Date')
+        _append_frame(pnl_sheet, daily, 'Date-wise P&L and Drawdown')
+    
+    # Sheet 3 - list of all trades
+    with instrumentation.span('trades_sheet'):
+        trade_sheet = workbook.create_sheet('Trades')
+        _append_frame(trade_sheet, trade_list(trades, params, spot_movement))
+    
+    excel_file = output_file or os.path.join(reports_dir, 'Trade_Report.xlsx')
+    with instrumentation.span('save'):
+        workbook.save(excel_file)
     
     print(f"\nExcel report generated successfully: {excel_file}")
     print("\nReport Contents:")
-    print("1. Summary - Key performance metrics")
-    print("2. Direction Summary - Performance by trade direction")
-    print("3. Spot Movement - Daily spot price movements")
-    print("4. Strike Selection - Selected strike prices")
-    print("5. Option Prices - Option premiums")
-    print("6. Trailing Exits - Exit points and times")
-    print("7. PnL Analysis - Detailed P&L and drawdown analysis")
+    print("1. Parameters - Input parameters of the run")
+    print("2. PnL - Summary, year/month/day-wise and date-wise P&L and drawdown")
+    print(f"3. Trades - All {len(trades)} legs with entry and exit details")
+    
+    return excel_file
 
 if __name__ == "__main__":
-    generate_excel_report() 
\ No newline at end of file
+    generate_excel_report()
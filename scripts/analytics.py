@@ -0,0 +1,216 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from positions import LegBook
+from trading_calendar import normalize_date
+
+# Sessions per year used to annualise the risk ratios
+TRADING_DAYS = 252
+
+
+def leg_pnl(legs, slippage_pct=0.5):
+    """
+    Value every leg with slippage on its entry and exit fill.
+
+    Args:
+        legs (pd.DataFrame): Leg exits from process_trailing_exits, indexed
+            by trade date
+        slippage_pct (float): Slippage per fill in percent of the price
+
+    Returns:
+        pd.DataFrame: The legs with fills, pnl, slippage and premium (the
+        premium collected at entry, negative for bought legs)
+    """
+    book = LegBook.from_frame(legs)
+    book.fill(slippage_pct)
+
+    table = book.to_frame()
+    for column in ('direction', 'exit_date'):
+        if column in legs:
+            table[column] = legs[column].to_numpy()
+    table['pnl'] = book.pnl()
+    table['slippage'] = book.slippage_cost()
+    table['premium'] = -book.side * book.entry_price * book.quantity
+    return table
+
+
+def trade_pnl(legs):
+    """
+    Sum the legs of each trade.
+
+    Returns:
+        pd.DataFrame: One row per trade with direction, net_premium,
+        slippage, pnl and a <leg>_pnl column per leg name
+    """
+    trades = legs.groupby(level='date', sort=False)
+    table = pd.DataFrame({
+        'direction': trades['direction'].first(),
+        'net_premium': trades['premium'].sum(),
+        'slippage': trades['slippage'].sum(),
+        'pnl': trades['pnl'].sum()
+    })
+    by_leg = legs.groupby([legs.index, 'leg'], sort=False)['pnl'].sum().unstack('leg')
+    for leg in by_leg.columns:
+        table[f'{leg}_pnl'] = by_leg[leg].reindex(table.index).to_numpy()
+    return table
+
+
+def equity_curve(pnl, start_pnl=0.0, start_peak=-np.inf, start_duration=0):
+    """
+    Cumulative PnL, running peak, drawdown and drawdown duration.
+
+    The start_* arguments continue a curve that ended with those values, so
+    new trades can be appended without recomputing the history.
+
+    Args:
+        pnl (array-like): PnL per trade in time order
+        start_pnl (float): Cumulative PnL before the first trade
+        start_peak (float): Peak before the first trade
+        start_duration (int): Trades spent below start_peak so far
+
+    Returns:
+        pd.DataFrame: cumulative_pnl, peak, drawdown and drawdown_duration
+        (trades since the last peak), with the index of `pnl` if it has one
+    """
+    values = np.asarray(pnl, dtype=float)
+    cumulative = start_pnl + np.cumsum(values)
+    peak = np.maximum.accumulate(np.maximum(cumulative, start_peak))
+    drawdown = cumulative - peak
+
+    # Position of the latest trade that closed at a peak
+    steps = np.arange(len(values))
+    last_peak = np.maximum.accumulate(np.where(drawdown == 0, steps, -1))
+    duration = np.where(last_peak >= 0, steps - last_peak, start_duration + steps + 1)
+
+    return pd.DataFrame({
+        'cumulative_pnl': cumulative,
+        'peak': peak,
+        'drawdown': drawdown,
+        'drawdown_duration': duration
+    }, index=getattr(pnl, 'index', None))
+
+
+def trade_dates(index):
+    """DatetimeIndex of ddmmyyyy trade dates (zero padding optional)."""
+    return pd.to_datetime(pd.Index(index).map(normalize_date), format='%d%m%Y')
+
+
+def risk_stats(pnl, periods=TRADING_DAYS):
+    """
+    Sharpe, Sortino and profit factor of a PnL series.
+
+    Ratios are computed on PnL per trade (one trade per session) and
+    annualised with `periods` sessions per year.
+    """
+    values = np.asarray(pnl, dtype=float)
+    if len(values) < 2:
+        return {'Sharpe Ratio': np.nan, 'Sortino Ratio': np.nan, 'Profit Factor': np.nan}
+
+    mean = values.mean()
+    std = values.std(ddof=1)
+    downside = np.sqrt(np.mean(np.minimum(values, 0) ** 2))
+    gross_profit = values[values > 0].sum()
+    gross_loss = -values[values < 0].sum()
+
+    return {
+        'Sharpe Ratio': mean / std * np.sqrt(periods) if std > 0 else np.nan,
+        'Sortino Ratio': mean / downside * np.sqrt(periods) if downside > 0 else np.nan,
+        'Profit Factor': gross_profit / gross_loss if gross_loss > 0 else np.inf
+    }
+
+
+def summary_stats(data):
+    """
+    Key performance metrics of a trade-level PnL table.
+
+    Args:
+        data (pd.DataFrame): Trades with pnl and the equity_curve columns,
+            indexed by trade date
+
+    Returns:
+        dict: Metric name to value
+    """
+    pnl = data['pnl'].to_numpy(dtype=float)
+    wins = pnl[pnl > 0]
+    losses = pnl[pnl < 0]
+
+    # Longest stretch below a peak, in trades and in calendar days
+    duration = data['drawdown_duration'].to_numpy() if 'drawdown_duration' in data else np.zeros(len(pnl))
+    longest = int(duration.max()) if len(duration) else 0
+    days = 0
+    if longest:
+        end = int(duration.argmax())
+        dates = trade_dates(data.index)
+        days = (dates[end] - dates[max(end - longest, 0)]).days
+
+    stats = {
+        'Total Trades': len(pnl),
+        'Winning Trades': len(wins),
+        'Losing Trades': len(losses),
+        'Win Rate': len(wins) / len(pnl) * 100 if len(pnl) else np.nan,
+        'Average Win': wins.mean() if len(wins) else np.nan,
+        'Average Loss': losses.mean() if len(losses) else np.nan,
+        'Largest Win': pnl.max() if len(pnl) else np.nan,
+        'Largest Loss': pnl.min() if len(pnl) else np.nan,
+        'Total P&L': pnl.sum(),
+        'Max Drawdown': data['drawdown'].min(),
+        'Average Drawdown': data['drawdown'].mean(),
+        'Max Drawdown Duration (trades)': longest,
+        'Max Drawdown Duration (days)': days
+    }
+    stats.update(risk_stats(pnl))
+    return stats
+
+
+def direction_stats(data):
+    """PnL, premium and slippage grouped by trade direction."""
+    return data.groupby('direction').agg({
+        'pnl': ['count', 'mean', 'sum', 'min', 'max'],
+        'net_premium': ['mean', 'sum'],
+        'slippage': ['mean', 'sum']
+    })
+
+
+def period_breakdowns(data):
+    """
+    Group the trade PnL by year, month and weekday.
+
+    Args:
+        data (pd.DataFrame): Trades with pnl and drawdown, indexed by
+            ddmmyyyy date
+
+    Returns:
+        dict: Title to breakdown table
+    """
+    dates = trade_dates(data.index)
+    frame = pd.DataFrame({
+        'pnl': data['pnl'].to_numpy(),
+        'win': data['pnl'].to_numpy() > 0,
+        'drawdown': data['drawdown'].to_numpy()
+    }, index=dates)
+
+    def breakdown(keys, name):
+        table = frame.groupby(keys, sort=True).agg(
+            **{
+                'Trades': ('pnl', 'size'),
+                'Total P&L': ('pnl', 'sum'),
+                'Average P&L': ('pnl', 'mean'),
+                'Win Rate': ('win', 'mean'),
+                'Max Drawdown': ('drawdown', 'min')
+            }
+        )
+        table['Win Rate'] *= 100
+        table.index.name = name
+        return table
+
+    weekdays = breakdown(dates.weekday, 'Day')
+    weekdays.index = pd.Index([datetime(2024, 1, 1 + day).strftime('%A') for day in weekdays.index],
+                              name='Day')
+
+    return {
+        'Year-wise P&L': breakdown(dates.year, 'Year'),
+        'Month-wise P&L': breakdown(dates.to_period('M').astype(str), 'Month'),
+        'Day-wise P&L': weekdays
+    }
@@ -0,0 +1,350 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from db import connection, count_fetched, day_table
+from market_store import (COLUMN_DTYPES, OPTION_COLUMNS, SORT_KEYS, SPOT_COLUMNS, convert_day,
+                          date_to_table, default_data_dir, list_day_tables, minute_of_day,
+                          table_to_date)
+
+# Bar sizes cached by default, in minutes
+BAR_MINUTES = (3, 5, 15)
+
+# Buckets are aligned to the session open: 09:15-09:17, 09:18-09:20, ...
+ORIGIN = '09:15:00'
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+
+MANIFEST_FILE = 'manifest.json'
+
+DATABASES = (('spot', 'SPOT.db'), ('opt', 'OPT.db'))
+
+
+def default_cache_dir(data_dir=None):
+    """Return the directory the N-minute bars live in (data/bars)."""
+    return os.path.join(data_dir or default_data_dir(), 'bars')
+
+
+def aggregate(keys, minute, fields, minutes, origin=ORIGIN):
+    """
+    Aggregate minute bars into N-minute OHLC bars per key.
+
+    Buckets start at `origin` and every N minutes after it. A bucket's open
+    is its first bar's open, its close the last bar's close, and its high
+    and low the extremes of its bars. Bars with a NaN close are ignored.
+
+    Args:
+        keys (dict): Column name to array identifying the series of each
+            row, e.g. date, expiry, strike and instrument type
+        minute (np.ndarray): Minute of day of each row
+        fields (dict): 'open', 'high', 'low' and 'close' arrays
+        minutes (int): Bar size N
+        origin (str): Start of the first bucket of the day
+
+    Returns:
+        dict: The key columns, 'minute' (the first minute of each bucket) and
+        the OHLC fields, sorted by key and then bucket
+    """
+    minute = np.asarray(minute, dtype=np.int64)
+    ok = ~np.isnan(np.asarray(fields['close'], dtype=float))
+    start = minute_of_day(origin)
+    bucket = start + (minute[ok] - start) // minutes * minutes
+    keys = {name: np.asarray(values)[ok] for name, values in keys.items()}
+
+    # Sort by key, bucket and minute; the last lexsort key is the primary one
+    order = np.lexsort([minute[ok], bucket] + [keys[name] for name in reversed(list(keys))])
+    keys = {name: values[order] for name, values in keys.items()}
+    bucket = bucket[order]
+    if not len(order):
+        return dict(keys, minute=bucket, **{name: np.array([], dtype=float) for name in PRICE_FIELDS})
+
+    changed = np.zeros(len(order), dtype=bool)
+    changed[0] = True
+    for column in [bucket] + list(keys.values()):
+        changed[1:] |= column[1:] != column[:-1]
+    starts = np.flatnonzero(changed)
+    ends = np.r_[starts[1:], len(order)] - 1
+
+    values = {name: np.asarray(fields[name], dtype=float)[ok][order] for name in PRICE_FIELDS}
+    result = {name: column[starts] for name, column in keys.items()}
+    result['minute'] = bucket[starts]
+    result['open'] = values['open'][starts]
+    result['high'] = np.maximum.reduceat(values['high'], starts)
+    result['low'] = np.minimum.reduceat(values['low'], starts)
+    result['close'] = values['close'][ends]
+    return {name: result[name] for name in list(keys) + ['minute'] + list(PRICE_FIELDS)}
+
+
+def table_fingerprint(conn, table):
+    """
+    Signature of a day table: row count, last rowid and sum of closes.
+
+    Appending, deleting or rewriting rows changes at least one of them, so
+    a day whose fingerprint differs from the manifest is aggregated again.
+    Computing it scans the whole table, so it is only done for databases
+    whose database_stamp has changed.
+    """
+    rows, last, total = conn.execute(
+        f'SELECT COUNT(*), MAX(rowid), TOTAL(close) FROM {day_table(table)}').fetchone()
+    return [int(rows), int(last or 0), round(float(total), 6)]
+
+
+def database_stamp(db_path):
+    """
+    Size and modification time of a database file and its write-ahead log.
+
+    Any write to the database changes the stamp, so while it matches the
+    one in the manifest no day table can have changed. Costs one stat()
+    per file.
+    """
+    stamp = []
+    for path in (db_path, db_path + '-wal'):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stamp += [stat.st_size, stat.st_mtime_ns]
+    return stamp
+
+
+def _aggregate_day(frame, table, kind, minutes):
+    """Aggregate one day table read from SQLite into every bar size."""
+    columns = convert_day(frame, table, kind)
+    keys = ['date'] if kind == 'spot' else ['date', 'expiry', 'strike', 'instrument_type']
+    bars = {}
+    for n in minutes:
+        result = aggregate({name: columns[name].to_numpy() for name in keys},
+                           columns['minute'].to_numpy(), columns, n)
+        bars[n] = pd.DataFrame(result)
+    return bars
+
+
+def _write_partition(cache_dir, n, kind, partition, frames):
+    """Write one month of N-minute bars as one .npy file per column."""
+    data = pd.concat(frames, ignore_index=True)
+    data = data.sort_values(SORT_KEYS[kind], kind='stable', ignore_index=True)
+    names = SPOT_COLUMNS if kind == 'spot' else OPTION_COLUMNS
+
+    part_dir = os.path.join(cache_dir, f'{n}m', kind, partition)
+    os.makedirs(part_dir, exist_ok=True)
+    for col in names:
+        np.save(os.path.join(part_dir, f'{col}.npy'), data[col].to_numpy().astype(COLUMN_DTYPES[col]))
+
+    dates = data['date'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]]) if len(dates) else []
+    stops = np.r_[starts[1:], len(dates)] if len(dates) else []
+    return {
+        date_to_table(dates[start]): [partition, int(start), int(stop)]
+        for start, stop in zip(starts, stops)
+    }
+
+
+def load_manifest(cache_dir):
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_bar_cache(data_dir=None, minutes=BAR_MINUTES, cache_dir=None, refresh=False):
+    """
+    Build or update the N-minute OHLC bars of every instrument and day.
+
+    Bars are written next to the raw data in data/bars/<N>m/, in monthly
+    partitions of .npy column files like the columnar store. The manifest
+    keeps a fingerprint of every day table (see table_fingerprint); on a
+    rerun only the months holding new, changed or removed days are
+    aggregated and written again. A database whose file has not been
+    written since the last build (see database_stamp) is skipped without
+    fingerprinting its tables.
+
+    Args:
+        data_dir (str): Directory holding SPOT.db and OPT.db
+        minutes (tuple): Bar sizes to build
+        cache_dir (str): Output directory, data/bars by default
+        refresh (bool): Rebuild every day
+
+    Returns:
+        dict: The manifest that was written
+    """
+    data_dir = data_dir or default_data_dir()
+    cache_dir = cache_dir or default_cache_dir(data_dir)
+    minutes = sorted({int(n) for n in minutes})
+
+    manifest = None if refresh else load_manifest(cache_dir)
+    if manifest is None or manifest.get('minutes') != minutes or manifest.get('origin') != ORIGIN:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        manifest = {'minutes': minutes, 'origin': ORIGIN, 'fingerprints': {}, 'stamps': {},
+                    'days': {str(n): {} for n in minutes}}
+    os.makedirs(cache_dir, exist_ok=True)
+
+    for kind, db_name in DATABASES:
+        db_path = os.path.join(data_dir, db_name)
+        if not os.path.exists(db_path):
+            print(f"Warning: {db_name} not found")
+            continue
+        stamp = database_stamp(db_path)
+        if kind in manifest['fingerprints'] and manifest.get('stamps', {}).get(kind) == stamp:
+            print(f"{db_name}: unchanged since the last build")
+            continue
+        conn = connection(db_path)
+        tables = list_day_tables(conn)
+
+        old = manifest['fingerprints'].get(kind, {})
+        fingerprints = {table: table_fingerprint(conn, table) for table in tables}
+        changed = {t for t in tables if old.get(t) != fingerprints[t]} | (set(old) - set(tables))
+        months = {str(table_to_date(t))[:7] for t in changed}
+
+        for month in sorted(months):
+            month_tables = [t for t in tables if str(table_to_date(t))[:7] == month]
+            frames = {n: [] for n in minutes}
+            for table in month_tables:
+                try:
+                    frame = pd.read_sql_query(f'SELECT * FROM {day_table(table)}', conn)
+                except (sqlite3.OperationalError, pd.errors.DatabaseError) as e:
+                    print(f"Error reading {db_name} table {table}: {str(e)}")
+                    continue
+                count_fetched(frame)
+                if frame.empty:
+                    continue
+                for n, bars in _aggregate_day(frame, table, kind, minutes).items():
+                    frames[n].append(bars)
+
+            for n in minutes:
+                days = manifest['days'][str(n)].setdefault(kind, {})
+                for date in [d for d, entry in days.items() if entry[0] == month]:
+                    del days[date]
+                part_dir = os.path.join(cache_dir, f'{n}m', kind, month)
+                shutil.rmtree(part_dir, ignore_errors=True)
+                if frames[n]:
+                    days.update(_write_partition(cache_dir, n, kind, month, frames[n]))
+
+        for n in minutes:
+            days = manifest['days'][str(n)].get(kind, {})
+            manifest['days'][str(n)][kind] = dict(sorted(days.items(),
+                                                         key=lambda item: table_to_date(item[0])))
+        manifest['fingerprints'][kind] = fingerprints
+        manifest.setdefault('stamps', {})[kind] = stamp
+        print(f"{db_name}: {len(changed)} days aggregated in {len(months)} months, "
+              f"{len(tables) - len(changed)} unchanged")
+
+    manifest['built_at'] = datetime.now().isoformat(timespec='seconds')
+    with open(os.path.join(cache_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+class BarCache:
+    """
+    Read-only access to the N-minute bars written by build_bar_cache.
+
+    A day only counts as cached while its table is the one the bars were
+    built from. If a database has been written since the build, each day
+    read from it is fingerprinted once and days whose table changed are
+    left to on-the-fly aggregation until the cache is rebuilt.
+    """
+
+    def __init__(self, cache_dir=None, data_dir=None):
+        """
+        Args:
+            cache_dir (str): Directory of the bars, data/bars by default
+            data_dir (str): Directory holding the databases the bars were
+                built from
+        """
+        self.data_dir = data_dir or default_data_dir()
+        self.cache_dir = cache_dir or default_cache_dir(self.data_dir)
+        self.manifest = load_manifest(self.cache_dir)
+        self._columns = {}
+        self._checked = {}
+
+    def __getstate__(self):
+        # Worker processes map the column files again instead of copying them
+        return dict(self.__dict__, _columns={})
+
+    @property
+    def minutes(self):
+        return tuple(self.manifest['minutes'])
+
+    def has(self, minutes, date=None, kind='opt'):
+        """Whether N-minute bars are cached (for `date`, if given, and still current)."""
+        days = self.manifest['days'].get(str(minutes))
+        if days is None:
+            return False
+        if date is None:
+            return True
+        date = str(date).zfill(8)
+        return date in days.get(kind, {}) and self.is_current(kind, date)
+
+    def is_current(self, kind, date):
+        """Whether a day's table is unchanged since its bars were built."""
+        db_path = os.path.join(self.data_dir, dict(DATABASES)[kind])
+        if kind not in self._checked:
+            # None while the database file is as it was at build time
+            changed = database_stamp(db_path) != self.manifest.get('stamps', {}).get(kind)
+            self._checked[kind] = {} if changed else None
+        checked = self._checked[kind]
+        if checked is None:
+            return True
+        if date not in checked:
+            try:
+                fingerprint = table_fingerprint(connection(db_path), date)
+            except sqlite3.OperationalError:
+                fingerprint = None
+            checked[date] = fingerprint == self.manifest['fingerprints'].get(kind, {}).get(date)
+        return checked[date]
+
+    def column(self, minutes, kind, partition, name):
+        key = (minutes, kind, partition, name)
+        if key not in self._columns:
+            path = os.path.join(self.cache_dir, f'{minutes}m', kind, partition, f'{name}.npy')
+            self._columns[key] = np.load(path, mmap_mode='r')
+        return self._columns[key]
+
+    def day(self, kind, date, minutes, columns=None):
+        """
+        Return one day's N-minute bars as column arrays.
+
+        Each bar's 'minute' is the first minute of its bucket.
+
+        Returns:
+            dict: Column name to array view, or None if the day is not cached
+        """
+        entry = self.manifest['days'].get(str(minutes), {}).get(kind, {}).get(str(date).zfill(8))
+        if entry is None:
+            return None
+        partition, start, stop = entry
+        names = columns or (SPOT_COLUMNS if kind == 'spot' else OPTION_COLUMNS)
+        day = {name: self.column(minutes, kind, partition, name)[start:stop] for name in names}
+        instrumentation.count(rows=stop - start, bytes_read=sum(values.nbytes for values in day.values()))
+        return day
+
+    def spot_day(self, date, minutes, columns=None):
+        return self.day('spot', date, minutes, columns)
+
+    def option_day(self, date, minutes, columns=None):
+        return self.day('opt', date, minutes, columns)
+
+
+def open_bar_cache(data_dir=None):
+    """Open the bar cache if it has been built, otherwise return None."""
+    cache_dir = default_cache_dir(data_dir)
+    if load_manifest(cache_dir) is None:
+        return None
+    return BarCache(cache_dir, data_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the N-minute OHLC bar cache.")
+    parser.add_argument('--data-dir', help="directory holding SPOT.db and OPT.db")
+    parser.add_argument('--minutes', type=int, nargs='+', default=list(BAR_MINUTES),
+                        help="bar sizes in minutes (default: 3 5 15)")
+    parser.add_argument('--refresh', action='store_true', help="rebuild every day")
+    args = parser.parse_args()
+
+    build_bar_cache(args.data_dir, args.minutes, refresh=args.refresh)
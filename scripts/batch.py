@@ -0,0 +1,174 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from db_profile import entry_days
+from market_store import default_data_dir, open_store
+from params import DEFAULT_PARAMS, StrategyParams
+from pipeline import load_stage
+from positions import BUY, SELL, STRATEGY_LEGS
+from replay import (Context, Subscriptions, replay_all, replay_days, replay_results, sessions,
+                    strategy_handlers)
+from trading_calendar import build_calendar
+
+
+@dataclass(frozen=True)
+class Strategy:
+    """
+    One strategy definition run by the batch.
+
+    Attributes:
+        name (str): Name used for the output files
+        params (StrategyParams): Times, strike rules, trailing stop and costs
+        legs (tuple): (leg name, side) pairs; 'atm' and 'hedge' are the
+            strikes picked by the 03 strike rules
+        with_move (bool): Trade the option type of the move (CE after an up
+            move) instead of the one against it
+        description (str): One line shown by --list
+    """
+
+    name: str
+    params: StrategyParams = DEFAULT_PARAMS
+    legs: tuple = STRATEGY_LEGS
+    with_move: bool = False
+    description: str = field(default='', compare=False)
+
+
+# Strategies known to the batch by name
+STRATEGIES = {}
+
+
+def register(name, legs=STRATEGY_LEGS, with_move=False, description='', **changes):
+    """
+    Register a strategy under `name`.
+
+    Args:
+        name (str): Strategy name
+        legs (tuple): (leg name, side) pairs, see Strategy
+        with_move (bool): Trade with the move instead of against it
+        description (str): One line shown by --list
+        **changes: StrategyParams fields that differ from DEFAULT_PARAMS
+
+    Returns:
+        Strategy: The registered strategy
+    """
+    strategy = Strategy(name, DEFAULT_PARAMS.replace(**changes), tuple(legs), with_move, description)
+    STRATEGIES[name] = strategy
+    return strategy
+
+
+register('sell_atm_hedged', description="Sell the ATM option against the move, buy a 2% hedge")
+register('sell_atm_wide_hedge', hedge_pct=3.0, description="Same with the hedge 3% away")
+register('sell_atm_step_hedge', hedge_rule='steps', hedge_steps=2,
+         description="Same with the hedge two strikes away")
+register('sell_atm_naked', legs=(('atm', SELL),), description="Sell the ATM option, no hedge")
+register('buy_with_move', legs=(('atm', BUY), ('hedge', SELL)), with_move=True,
+         description="Buy the ATM option in the direction of the move, sell the hedge")
+
+
+def default_batch_dir():
+    return os.path.join(os.path.dirname(SCRIPTS_DIR), 'reports', 'batch')
+
+
+def run_batch(strategies=None, store=None, data_dir=None, calendar=None, dates=None, save=True):
+    """
+    Run several strategies over one shared pass through the market data.
+
+    Each day's spot bars and option chain are read once and fed to the
+    handlers of every strategy (see replay.replay_all), each keeping its own
+    positions. The contracts every strategy holds are read together the next
+    morning. Each strategy then gets its own trade log and PnL.
+
+    Args:
+        strategies (list): Strategy objects or registered names; every
+            registered strategy by default
+        store (MarketStore): Columnar store; SPOT.db/OPT.db are read when None
+        data_dir (str): Directory holding the databases
+        calendar (TradingCalendar): Shared trading calendar
+        dates (list): Entry days, every usable day by default
+        save (bool): Write each strategy's legs and PnL and summary.csv to
+            reports/batch
+
+    Returns:
+        tuple: (summary, results); summary has one row of stats per strategy
+        and results maps each name to {'legs', 'pnl', 'stats'}
+    """
+    calculate_pnl = load_stage('06_calculate_pnl', 'calculate_pnl')
+    strategies = [STRATEGIES[s] if isinstance(s, str) else s
+                  for s in (strategies or STRATEGIES.values())]
+
+    data_dir = data_dir or default_data_dir()
+    if store is None:
+        store = open_store(data_dir)
+    calendar = calendar or build_calendar(data_dir, store)
+    if dates is None:
+        dates, _ = entry_days(calendar, data_dir)
+    entry_dates, days = replay_days(calendar, dates)
+
+    start = time.perf_counter()
+    subscriptions = Subscriptions()
+    runs = [(strategy_handlers(s.params, calendar, entry_dates, s.legs, s.with_move),
+             Context(subscriptions)) for s in strategies]
+    chain_minutes = sorted({s.params.entry_time for s in strategies})
+    replay_all(sessions(days, subscriptions, chain_minutes, store, data_dir), runs)
+    replay_seconds = time.perf_counter() - start
+
+    results, rows = {}, []
+    for strategy, (_, ctx) in zip(strategies, runs):
+        _, legs = replay_results(ctx, entry_dates)
+        if legs.empty:
+            print(f"Warning: {strategy.name} made no complete trades")
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            pnl_data, stats, _, leg_pnl = calculate_pnl(legs, save=False,
+                                                        slippage_pct=strategy.params.slippage_pct)
+        results[strategy.name] = {'legs': leg_pnl, 'pnl': pnl_data, 'stats': stats}
+        rows.append(dict(strategy=strategy.name, **stats))
+
+    summary = pd.DataFrame(rows)
+    if not summary.empty:
+        summary = summary.sort_values('Total P&L', ascending=False, ignore_index=True)
+
+    if save:
+        batch_dir = default_batch_dir()
+        os.makedirs(batch_dir, exist_ok=True)
+        for name, result in results.items():
+            result['legs'].to_csv(os.path.join(batch_dir, f'{name}_legs.csv'))
+            result['pnl'].to_csv(os.path.join(batch_dir, f'{name}_pnl.csv'))
+        summary.to_csv(os.path.join(batch_dir, 'summary.csv'), index=False)
+
+    print("\nStrategy Batch:")
+    print("===============")
+    print(f"Strategies: {len(strategies)} over {len(days)} days in one pass, {replay_seconds:.1f}s")
+    if not summary.empty:
+        print(summary[['strategy', 'Total Trades', 'Total P&L', 'Max Drawdown', 'Win Rate']].to_string())
+
+    return summary, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several strategies over one pass of the data.")
+    parser.add_argument('strategies', nargs='*', metavar='STRATEGY',
+                        help="registered strategy names (default: all)")
+    parser.add_argument('--list', action='store_true', help="list the registered strategies")
+    args = parser.parse_args()
+
+    if args.list:
+        for strategy in STRATEGIES.values():
+            print(f"{strategy.name:<22} {strategy.description}")
+        sys.exit(0)
+
+    unknown = set(args.strategies) - set(STRATEGIES)
+    if unknown:
+        parser.error(f"unknown strategies: {', '.join(sorted(unknown))}")
+    run_batch(args.strategies or None)
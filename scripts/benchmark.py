@@ -0,0 +1,296 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from bar_cache import open_bar_cache
+from market_store import build_store, default_data_dir, default_store_dir, open_store
+from option_chain import OptionChainLoader, StrikeIndex
+from params import DEFAULT_PARAMS
+from pipeline import load_stage
+from synthetic_data import generate_databases, load_manifest
+from trading_calendar import build_calendar
+
+DEFAULT_YEARS = (1, 5, 10)
+
+# Stages below this many seconds in the baseline are too noisy to compare
+MIN_SECONDS = 0.05
+
+
+def default_bench_dir():
+    """Directory the synthetic databases are generated into (data/synthetic)."""
+    return os.path.join(default_data_dir(), 'synthetic')
+
+
+def default_results_dir():
+    return os.path.join(os.path.dirname(SCRIPTS_DIR), 'reports', 'benchmarks')
+
+
+def measure(func, *args, trace_memory=True, **kwargs):
+    """
+    Call func and return its result, wall time and peak traced memory.
+
+    Returns:
+        tuple: (result, seconds, peak_mb); peak_mb is None when memory is
+        not traced
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        peak_mb = None
+        if trace_memory:
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+    return result, seconds, peak_mb
+
+
+def prepare_data(years, bench_dir=None, strikes=41, expiries=2, seed=0):
+    """
+    Return the synthetic data directory for one size, generating it if needed.
+
+    A directory is reused when its synthetic.json matches the requested
+    settings; the columnar store is built alongside the databases.
+
+    Returns:
+        tuple: (data_dir, manifest, setup) where setup maps 'generate' and
+        'build_store' to seconds for the steps that had to run
+    """
+    data_dir = os.path.join(bench_dir or default_bench_dir(), f'{years:g}y')
+    wanted = {'years': years, 'strikes': strikes, 'expiries': expiries, 'seed': seed}
+    manifest = load_manifest(data_dir)
+    setup = {}
+
+    if manifest is None or any(manifest.get(k) != v for k, v in wanted.items()):
+        manifest, setup['generate'], _ = measure(
+            generate_databases, data_dir, years=years, strikes=strikes, expiries=expiries,
+            seed=seed, trace_memory=False
+        )
+        # A store built from the previous databases is stale
+        shutil.rmtree(default_store_dir(data_dir), ignore_errors=True)
+
+    if open_store(data_dir) is None:
+        _, setup['build_store'], _ = measure(build_store, data_dir, trace_memory=False)
+    return data_dir, manifest, setup
+
+
+def benchmark_size(data_dir, params=None, trace_memory=True, verbose=False):
+    """
+    Time every stage of one backtest over a synthetic data directory.
+
+    The stages run on the columnar store of data_dir and are chained the
+    same way as in pipeline.run_pipeline, without writing the per-stage
+    CSVs. The report is written inside data_dir.
+
+    Returns:
+        dict: Stage name to {'seconds', 'peak_mb'}
+    """
+    params = params or DEFAULT_PARAMS
+    get_spot_movement = load_stage('02_get_spot_movement', 'get_spot_movement')
+    process_strike_selection = load_stage('03_select_strike', 'process_strike_selection')
+    fetch_option_prices = load_stage('04_fetch_option_prices', 'fetch_option_prices')
+    process_trailing_exits = load_stage('05_trailing_exit', 'process_trailing_exits')
+    calculate_pnl = load_stage('06_calculate_pnl', 'calculate_pnl')
+    generate_excel_report = load_stage('07_generate_excel', 'generate_excel_report')
+
+    store = open_store(data_dir)
+    calendar = build_calendar(data_dir, store)
+    chain_loader = OptionChainLoader(data_dir, store, bar_cache=open_bar_cache(data_dir))
+    stages = {}
+
+    def run(name, func, *args, **kwargs):
+        result, seconds, peak_mb = measure(func, *args, trace_memory=trace_memory, **kwargs)
+        stages[name] = {'seconds': round(seconds, 4),
+                        'peak_mb': None if peak_mb is None else round(peak_mb, 2)}
+        return result
+
+    output = sys.stdout if verbose else io.StringIO()
+    with contextlib.redirect_stdout(output):
+        spot_movement = run('spot_movement', get_spot_movement, save=False, store=store,
+                            calendar=calendar, open_time=params.open_time,
+                            close_time=params.entry_time)
+
+        strike_index = None
+        if params.snap_strikes:
+            strike_index = StrikeIndex(data_dir, store, params.entry_time,
+                                       expiry_rollover=params.expiry_rollover)
+        strike_selection = run('strike_selection', process_strike_selection, spot_movement,
+                               save=False, strike_interval=params.strike_interval,
+                               hedge_rule=params.hedge_rule, hedge_pct=params.hedge_pct,
+                               hedge_steps=params.hedge_steps, snap_strikes=params.snap_strikes,
+                               strike_index=strike_index)
+
+        option_prices = run('option_prices', fetch_option_prices, strike_selection, save=False,
+                            store=store, chain_loader=chain_loader, entry_time=params.entry_time,
+                            expiry_rollover=params.expiry_rollover)
+
+        trailing_exits = run('trailing_exits', process_trailing_exits, option_prices, save=False,
+                             store=store, calendar=calendar, chain_loader=chain_loader,
+                             window=params.trail_window, entry_time=params.trail_start,
+                             exit_time=params.exit_time, bar_minutes=params.trail_bar_minutes)
+
+        pnl_analysis, stats, _, legs = run('pnl', calculate_pnl, trailing_exits, save=False,
+                                           slippage_pct=params.slippage_pct)
+
+        run('excel_report', generate_excel_report, pnl_analysis=pnl_analysis, trades=legs,
+            params=params, spot_movement=spot_movement, stats=stats,
+            output_file=os.path.join(data_dir, 'Trade_Report.xlsx'))
+
+    chain_loader.close()
+    stages['total'] = {
+        'seconds': round(sum(stage['seconds'] for stage in stages.values()), 4),
+        'peak_mb': max((stage['peak_mb'] or 0 for stage in stages.values()), default=0) if trace_memory else None
+    }
+    return stages
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    List the stages that got slower or used more memory than the baseline.
+
+    Args:
+        results (dict): Output of run_benchmark
+        baseline (dict): A saved run_benchmark output
+        tolerance (float): Allowed relative increase, 0.25 = 25%
+
+    Returns:
+        list: One message per regression
+    """
+    regressions = []
+    for size, run in results['sizes'].items():
+        base = baseline.get('sizes', {}).get(size)
+        if base is None:
+            continue
+        for stage, values in run['stages'].items():
+            before = base['stages'].get(stage)
+            if before is None:
+                continue
+            if before['seconds'] >= MIN_SECONDS and values['seconds'] > before['seconds'] * (1 + tolerance):
+                regressions.append(f"{size}: {stage} took {values['seconds']:.3f}s "
+                                   f"(baseline {before['seconds']:.3f}s)")
+            if values.get('peak_mb') and before.get('peak_mb') \
+                    and values['peak_mb'] > before['peak_mb'] * (1 + tolerance):
+                regressions.append(f"{size}: {stage} peaked at {values['peak_mb']:.1f} MB "
+                                   f"(baseline {before['peak_mb']:.1f} MB)")
+    return regressions
+
+
+def run_benchmark(years=DEFAULT_YEARS, bench_dir=None, strikes=41, expiries=2, params=None,
+                  trace_memory=True, save=True, verbose=False):
+    """
+    Benchmark the stages on synthetic data of several sizes.
+
+    Args:
+        years (tuple): Data sizes in years of trading days
+        bench_dir (str): Where the synthetic databases live, data/synthetic
+            by default
+        strikes (int): Strikes per expiry and option type in the data
+        expiries (int): Weekly expiries quoted each day
+        params (StrategyParams): Strategy parameters, DEFAULT_PARAMS by default
+        trace_memory (bool): Record each stage's peak memory with
+            tracemalloc (this slows the stages down somewhat)
+        save (bool): Write the results to reports/benchmarks
+
+    Returns:
+        dict: Environment, settings and per-size stage results
+    """
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'trace_memory': trace_memory,
+        'params': (params or DEFAULT_PARAMS).to_dict(),
+        'sizes': {}
+    }
+
+    for size in years:
+        data_dir, manifest, setup = prepare_data(size, bench_dir, strikes, expiries)
+        for step, seconds in setup.items():
+            print(f"{size:g}y: {step} took {seconds:.1f}s")
+
+        stages = benchmark_size(data_dir, params, trace_memory, verbose)
+        results['sizes'][f'{size:g}y'] = {
+            'days': manifest['days'],
+            'option_rows': manifest['option_rows'],
+            'stages': stages
+        }
+        print_results(f'{size:g}y', manifest, stages)
+
+    if save:
+        results_dir = default_results_dir()
+        os.makedirs(results_dir, exist_ok=True)
+        path = os.path.join(results_dir, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"\nResults saved to {path}")
+    return results
+
+
+def print_results(size, manifest, stages):
+    print(f"\nBenchmark {size}: {manifest['days']} days, {manifest['option_rows']:,} option rows")
+    print("=" * 40)
+    for name, values in stages.items():
+        memory = f"{values['peak_mb']:10.1f} MB" if values['peak_mb'] is not None else ''
+        print(f"{name:<20} {values['seconds']:8.3f}s{memory}")
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the stages on synthetic data.")
+    parser.add_argument('--years', type=float, nargs='+', default=list(DEFAULT_YEARS),
+                        help="data sizes in years (default: 1 5 10)")
+    parser.add_argument('--strikes', type=int, default=41, help="strikes per expiry and option type")
+    parser.add_argument('--expiries', type=int, default=2, help="weekly expiries quoted each day")
+    parser.add_argument('--bench-dir', help="synthetic data directory (default: data/synthetic)")
+    parser.add_argument('--baseline', default=os.path.join(default_results_dir(), 'baseline.json'),
+                        help="baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown or memory growth before failing (default: 0.25)")
+    parser.add_argument('--no-memory', action='store_true', help="skip tracemalloc peak memory")
+    parser.add_argument('--verbose', action='store_true', help="show the stages' own output")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.years, args.bench_dir, args.strikes, args.expiries,
+                            trace_memory=not args.no_memory, verbose=args.verbose)
+
+    baseline = load_baseline(args.baseline)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+    elif baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"\nCompared with {args.baseline}: {len(regressions)} regressions")
+        for message in regressions:
+            print(f"  {message}")
+        if regressions:
+            sys.exit(1)
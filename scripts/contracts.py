@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+from market_store import INSTRUMENT_TYPES, minute_of_day, table_to_date
+
+# 'expiry_day': a trade entered on the day its nearest contract expires goes
+# to the next expiry, since that contract cannot be held to the next session.
+# 'none': always the nearest expiry on or after the entry day
+EXPIRY_ROLLOVER = ('expiry_day', 'none')
+
+# Bit widths of the packed (expiry, strike, type, minute) row key
+_MINUTE_BITS = 11
+_TYPE_BITS = 1
+_STRIKE_BITS = 24
+
+
+def contract_symbol(underlying, expiry, strike, option_type):
+    """
+    Trading symbol of one contract, e.g. BANKNIFTY07SEP2342000CE.
+
+    Args:
+        underlying (str): Underlying name
+        expiry: Expiry as 'YYYY-MM-DD' or datetime64; None gives None
+        strike (int): Strike
+        option_type (str): 'CE' or 'PE'
+    """
+    if expiry is None or pd.isna(expiry) or pd.isna(strike):
+        return None
+    day = pd.Timestamp(np.datetime64(expiry, 'D'))
+    return f"{underlying}{day.strftime('%d%b%y').upper()}{int(strike)}{option_type}"
+
+
+def select_expiry(expiries, date, rollover='expiry_day'):
+    """
+    Pick the weekly expiry a trade entered on date is placed in.
+
+    Args:
+        expiries (np.ndarray): datetime64[D] expiries quoted that day
+        date (str): ddmmyyyy entry day
+        rollover (str): One of EXPIRY_ROLLOVER
+
+    Returns:
+        np.datetime64: The expiry, or None when the day quotes none; the
+        last expiry when every quoted one is already past
+    """
+    if rollover not in EXPIRY_ROLLOVER:
+        raise ValueError(f"Unknown expiry rollover {rollover!r}, expected one of {EXPIRY_ROLLOVER}")
+    expiries = np.unique(np.asarray(expiries, dtype='datetime64[D]'))
+    expiries = expiries[~np.isnat(expiries)]
+    if not len(expiries):
+        return None
+
+    today = np.datetime64(table_to_date(date), 'D')
+    later = expiries[expiries >= today]
+    if rollover == 'expiry_day' and len(later) > 1 and later[0] == today:
+        later = later[1:]
+    return later[0] if len(later) else expiries[-1]
+
+
+def _expiry_keys(expiry):
+    """Day number + 1 of each expiry, 0 for a missing one."""
+    expiry = np.asarray(expiry, dtype='datetime64[D]')
+    return np.where(np.isnat(expiry), 0, expiry.astype(np.int64) + 1)
+
+
+def _valid_rows(columns):
+    """
+    Drop rows that cannot be packed into a contract key.
+
+    An unknown type code (-1) or a missing strike would alias the key of a
+    neighbouring contract. Rows without an expiry are dropped too, unless
+    no row of the day has one (tables written before the expiry column).
+    """
+    code = np.asarray(columns['instrument_type'])
+    strike = np.asarray(columns['strike'], dtype=float)
+    expiry = np.asarray(columns['expiry'], dtype='datetime64[D]')
+    keep = ((code >= 0) & (code < len(INSTRUMENT_TYPES))
+            & (strike >= 0) & (strike < 1 << _STRIKE_BITS))
+    dated = ~np.isnat(expiry)
+    if dated.any():
+        keep &= dated
+    if keep.all():
+        return columns
+    return {name: np.asarray(values)[keep] for name, values in columns.items()}
+
+
+class ContractIndex:
+    """
+    One day's option rows grouped by contract.
+
+    Built once per day from the (expiry, strike, type) columns: the rows
+    of each contract are contiguous in the store (and are sorted into
+    place when read from OPT.db), so a contract maps to one (start, stop)
+    row range. Looking up a contract is then a dict lookup whatever the
+    number of expiries on the day, and a price is a binary search over the
+    contract's own minutes. Price columns are only touched for the rows
+    that are looked up.
+    """
+
+    def __init__(self, date, columns):
+        """
+        Args:
+            date (str): ddmmyyyy trading day
+            columns (dict): minute, expiry, strike, instrument_type and
+                price field arrays of the day's rows, e.g. a store day
+        """
+        self.date = date
+        columns = _valid_rows(columns)
+        expiry = _expiry_keys(columns['expiry'])
+        contract = (((expiry << _STRIKE_BITS) + np.asarray(columns['strike'], dtype=np.int64))
+                    << _TYPE_BITS) + np.asarray(columns['instrument_type'], dtype=np.int64)
+        row_key = (contract << _MINUTE_BITS) + np.asarray(columns['minute'], dtype=np.int64)
+
+        if len(row_key) and (row_key[1:] < row_key[:-1]).any():
+            order = np.argsort(row_key, kind='stable')
+            columns = {name: np.asarray(values)[order] for name, values in columns.items()}
+            contract = contract[order]
+        self.columns = columns
+
+        starts = np.flatnonzero(np.r_[True, contract[1:] != contract[:-1]])
+        starts = starts[starts < len(contract)]
+        stops = np.r_[starts[1:], len(contract)]
+        self._ranges = dict(zip(contract[starts].tolist(), zip(starts.tolist(), stops.tolist())))
+
+        expiries = np.unique(expiry[starts]) if len(starts) else np.array([], dtype=np.int64)
+        self.expiries = (expiries[expiries > 0] - 1).astype('datetime64[D]')
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __contains__(self, contract):
+        return self.rows(*contract) is not None
+
+    def select_expiry(self, rollover='expiry_day'):
+        """Expiry a trade entered on this day is placed in; see select_expiry."""
+        return select_expiry(self.expiries, self.date, rollover)
+
+    def rows(self, expiry, strike, option_type):
+        """
+        Row range of one contract.
+
+        Args:
+            expiry: 'YYYY-MM-DD', datetime64 or None for rows without expiry
+            strike (int): Strike
+            option_type: 'CE'/'PE' or type code
+
+        Returns:
+            slice, or None if the day does not quote the contract
+        """
+        code = INSTRUMENT_TYPES.index(option_type) if isinstance(option_type, str) else int(option_type)
+        key = ((int(_expiry_keys([expiry])[0]) << _STRIKE_BITS) + int(strike)) << _TYPE_BITS
+        span = self._ranges.get(key + code)
+        return None if span is None else slice(*span)
+
+    def bars(self, expiry, strike, option_type, start=None, end=None):
+        """
+        Bars of one contract between start and end.
+
+        Returns:
+            dict: minute and price field arrays, empty when the contract is
+            not quoted
+        """
+        rows = self.rows(expiry, strike, option_type) or slice(0, 0)
+        minutes = self.columns['minute'][rows]
+        first = 0 if start is None else np.searchsorted(minutes, minute_of_day(start))
+        last = len(minutes) if end is None else np.searchsorted(minutes, minute_of_day(end), side='right')
+        rows = slice(rows.start + first, rows.start + last)
+        return {name: np.asarray(values[rows]) for name, values in self.columns.items()
+                if name not in ('date', 'expiry', 'strike', 'instrument_type')}
+
+    def price(self, time, expiry, strike, option_type, field='close'):
+        """Price of one contract at a time of day; None when there is no such bar."""
+        rows = self.rows(expiry, strike, option_type)
+        if rows is None:
+            return None
+        minute = minute_of_day(time) if isinstance(time, str) else int(time)
+        minutes = self.columns['minute'][rows]
+        pos = np.searchsorted(minutes, minute)
+        if pos == len(minutes) or minutes[pos] != minute:
+            return None
+        value = float(self.columns[field][rows.start + pos])
+        return None if np.isnan(value) else value
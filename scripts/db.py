@@ -0,0 +1,168 @@
+import atexit
+import os
+import re
+import sqlite3
+import threading
+
+import instrumentation
+
+# Applied to every read connection. mmap lets SQLite read pages straight from
+# the OS page cache, and a negative cache_size is in KiB.
+READ_PRAGMAS = {
+    'mmap_size': 1 << 30,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+    'query_only': 1
+}
+
+# Prepared statements kept per connection by the sqlite3 module
+STATEMENT_CACHE = 256
+
+_DAY_TABLE = re.compile(r'^\d{7,8}$')
+
+
+def day_table(name):
+    """
+    Quote a ddmmyyyy day table name for use in SQL.
+
+    Table names cannot be bound as statement parameters, so they are checked
+    against the day-table pattern before being placed in the query text.
+    Everything else is passed as a parameter.
+    """
+    name = str(name)
+    if not _DAY_TABLE.match(name):
+        raise ValueError(f"Not a day table name: {name!r}")
+    return f'"{name}"'
+
+
+def fetched_bytes(data):
+    """
+    Bytes of rows fetched from SQLite, as the values are stored.
+
+    Numbers count 8 bytes, text and blobs their length and NULL nothing.
+    Pages are read through the memory map (mmap_size), which no OS read
+    counter sees, so this is what the run log reports as bytes read.
+
+    Args:
+        data: List of row tuples, or a DataFrame from read_sql_query
+    """
+    if hasattr(data, 'dtypes'):
+        total = 0
+        for name, values in data.items():
+            if values.dtype == object:
+                total += int(values.map(lambda v: len(v) if isinstance(v, (str, bytes)) else
+                                        0 if v is None else 8).sum())
+            else:
+                total += 8 * int(values.notna().sum())
+        return total
+    return sum(len(v) if isinstance(v, (str, bytes)) else 0 if v is None else 8
+               for row in data for v in row)
+
+
+def count_fetched(data):
+    """Report rows fetched from SQLite and their bytes to the running stage, if any."""
+    if instrumentation.active_run() is not None:
+        instrumentation.count(rows=len(data), bytes_read=fetched_bytes(data))
+
+
+def connect(db_path, pragmas=None):
+    """
+    Open a read-only connection to a database with the read pragmas applied.
+
+    The database is opened in URI mode=ro, so a missing file raises
+    sqlite3.OperationalError instead of creating an empty database.
+
+    Args:
+        db_path (str): Path of the SQLite database
+        pragmas (dict): Overrides for READ_PRAGMAS
+
+    Returns:
+        sqlite3.Connection
+    """
+    uri = f'file:{os.path.abspath(db_path)}?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE)
+    for name, value in {**READ_PRAGMAS, **(pragmas or {})}.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    conn.set_trace_callback(instrumentation.on_query)
+    return conn
+
+
+class ConnectionPool:
+    """
+    One read-only connection per database and thread.
+
+    A thread gets the same connection every time it asks for a database, so
+    its page cache and prepared statements are reused across days. Worker
+    threads never share a connection, and connections inherited by a forked
+    worker process are dropped and reopened there. Connections of threads
+    that have exited are closed by close_finished(), and whenever a new
+    connection is opened, so short-lived worker pools do not pile them up.
+    """
+
+    def __init__(self, pragmas=None):
+        self.pragmas = pragmas
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = []
+        self._pid = os.getpid()
+
+    def __len__(self):
+        """Number of connections currently open."""
+        return len(self._open)
+
+    def connection(self, db_path):
+        """Return this thread's connection to db_path, opening it on first use."""
+        if os.getpid() != self._pid:
+            self._reset_after_fork()
+
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        key = os.path.abspath(db_path)
+        if key not in conns:
+            conn = connect(key, self.pragmas)
+            conns[key] = conn
+            self.close_finished()
+            with self._lock:
+                self._open.append((threading.current_thread(), conn))
+        return conns[key]
+
+    def close_finished(self):
+        """
+        Close the connections of threads that have exited.
+
+        Returns:
+            int: Number of connections closed
+        """
+        with self._lock:
+            finished = [conn for thread, conn in self._open if not thread.is_alive()]
+            self._open = [(thread, conn) for thread, conn in self._open if thread.is_alive()]
+        for conn in finished:
+            conn.close()
+        return len(finished)
+
+    def _reset_after_fork(self):
+        # The parent's connections must not be used or closed in the child
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = []
+        self._pid = os.getpid()
+
+    def close(self):
+        """Close every connection the pool has opened, in any thread."""
+        with self._lock:
+            conns, self._open = self._open, []
+        for _, conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+
+# Shared by every stage of a run
+POOL = ConnectionPool()
+atexit.register(POOL.close)
+
+
+def connection(db_path):
+    """Return the calling thread's pooled read-only connection to db_path."""
+    return POOL.connection(db_path)
@@ -0,0 +1,254 @@
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from db import connection, day_table
+from market_store import default_data_dir, format_minute, list_day_tables, minute_of_day, table_to_date
+
+PROFILE_FILE = 'db_profile.json'
+
+# Regular session bars, the bars a day needs to enter a trade and the
+# bars the next session needs to exit it
+SESSION = ('09:15:00', '15:29:00')
+ENTRY_TIMES = ('09:15:00', '15:25:00')
+EXIT_TIMES = ('09:45:00',)
+KEY_TIMES = ENTRY_TIMES + EXIT_TIMES
+
+# Bars a day needs to be a trading session at all, an entry day or an exit day
+ROLE_TIMES = {'session': (), 'entry': ENTRY_TIMES, 'exit': EXIT_TIMES}
+
+DATABASES = (('spot', 'SPOT.db'), ('opt', 'OPT.db'))
+
+
+def default_profile_path(data_dir=None):
+    return os.path.join(data_dir or default_data_dir(), PROFILE_FILE)
+
+
+def _time_profile(minutes, counts, session, key_times):
+    """Coverage, gaps, duplicates and missing key bars from per-minute bar counts."""
+    start, end = (minute_of_day(t) for t in session)
+    present = np.unique(minutes)
+    in_session = present[(present >= start) & (present <= end)]
+    bounds = np.r_[start - 1, in_session, end + 1]
+    gaps = np.diff(bounds) - 1
+
+    return {
+        'first_time': format_minute(present[0]) if len(present) else None,
+        'last_time': format_minute(present[-1]) if len(present) else None,
+        'minutes': int(len(present)),
+        'missing_minutes': int(end - start + 1 - len(in_session)),
+        'largest_gap': int(gaps.max()) if len(gaps) else 0,
+        'missing_bars': [t for t in key_times if minute_of_day(t) not in set(present.tolist())],
+        'duplicate_bars': int((counts - 1).clip(min=0).sum())
+    }
+
+
+def profile_spot_day(conn, table, session=SESSION, key_times=KEY_TIMES):
+    """Profile one SPOT.db day table with a single grouped scan."""
+    rows = conn.execute(f'SELECT time, COUNT(*) FROM {day_table(table)} GROUP BY time').fetchall()
+    minutes = np.array([minute_of_day(t) for t, _ in rows], dtype=int)
+    counts = np.array([c for _, c in rows], dtype=int)
+    profile = {'rows': int(counts.sum())}
+    profile.update(_time_profile(minutes, counts, session, key_times))
+    return profile
+
+
+def profile_option_day(conn, table, session=SESSION, key_times=KEY_TIMES):
+    """
+    Profile one OPT.db day table with a single grouped scan.
+
+    Besides the time coverage, reports for every expiry and option type how
+    many strikes are quoted and over what range.
+    """
+    frame = pd.read_sql_query(
+        f'SELECT expiry, time, strike, instrument_type, COUNT(*) AS bars '
+        f'FROM {day_table(table)} GROUP BY expiry, time, strike, instrument_type',
+        conn
+    )
+    minutes = np.array([minute_of_day(t) for t in frame['time'].unique()], dtype=int)
+
+    # More than one bar for a contract in the same minute is a duplicate
+    profile = {'rows': int(frame['bars'].sum())}
+    profile.update(_time_profile(minutes, frame['bars'].to_numpy(), session, key_times))
+
+    strikes = pd.to_numeric(frame['strike'], errors='coerce')
+    coverage = frame.assign(strike=strikes).groupby(['expiry', 'instrument_type'])['strike']
+    profile['expiries'] = [
+        {
+            'expiry': str(expiry),
+            'instrument_type': str(option_type),
+            'strikes': int(values.nunique()),
+            'min_strike': float(values.min()),
+            'max_strike': float(values.max())
+        }
+        for (expiry, option_type), values in coverage
+    ]
+    return profile
+
+
+def _problem(kind, day, times=()):
+    """Why a profiled day cannot serve a role needing `times`, or None if it can."""
+    if day.get('error'):
+        return f"{kind}: {day['error']}"
+    if not day.get('rows'):
+        return f"{kind}: no rows"
+    missing = [t for t in day.get('missing_bars', []) if t in times]
+    if missing:
+        return f"{kind}: missing {', '.join(missing)}"
+    return None
+
+
+def profile_databases(data_dir=None, workers=None, refresh=False, session=SESSION, entry_times=ENTRY_TIMES,
+                      exit_times=EXIT_TIMES):
+    """
+    Profile every day table of SPOT.db and OPT.db and save the manifest.
+
+    Tables are profiled on a thread pool; each worker thread reads through
+    its own pooled read-only connection (SQLite releases the GIL while a
+    query runs). Days already
+    in the saved manifest are not queried again unless `refresh` is set,
+    so rerunning after appending data only profiles the new tables.
+
+    Args:
+        data_dir (str): Directory holding the databases
+        workers (int): Worker threads, os.cpu_count() by default
+        refresh (bool): Profile every table again
+        session (tuple): First and last regular session bar
+        entry_times (tuple): Bars a day needs to enter a trade
+        exit_times (tuple): Bars the next session needs to exit it
+
+    Returns:
+        dict: The manifest; manifest[kind][date] holds one day's profile
+    """
+    data_dir = data_dir or default_data_dir()
+    path = default_profile_path(data_dir)
+    key_times = tuple(entry_times) + tuple(exit_times)
+    header = {'session': list(session), 'entry_times': list(entry_times), 'exit_times': list(exit_times)}
+    manifest = load_profile(data_dir) if not refresh else None
+    if manifest is None or any(manifest.get(key) != value for key, value in header.items()):
+        manifest = dict(header)
+
+    profilers = {'spot': profile_spot_day, 'opt': profile_option_day}
+
+    for kind, db_name in DATABASES:
+        db_path = os.path.join(data_dir, db_name)
+        if not os.path.exists(db_path):
+            print(f"Warning: {db_name} not found")
+            continue
+
+        tables = list_day_tables(connection(db_path))
+
+        existing = set(tables)
+        days = {date: day for date, day in manifest.get(kind, {}).items() if date in existing}
+        todo = [table for table in tables if table not in days]
+
+        def run(table):
+            try:
+                profile = profilers[kind](connection(db_path), table, session, key_times)
+            except (sqlite3.OperationalError, pd.errors.DatabaseError) as e:
+                profile = {'rows': 0, 'error': str(e), 'missing_bars': list(key_times)}
+            profile['usable'] = _problem(kind, profile) is None
+            profile['entry'] = _problem(kind, profile, entry_times) is None
+            profile['exit'] = _problem(kind, profile, exit_times) is None
+            return table, profile
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            for table, profile in executor.map(run, todo):
+                days[table] = profile
+
+        manifest[kind] = dict(sorted(days.items(), key=lambda item: table_to_date(item[0])))
+        print(f"{db_name}: {len(todo)} tables profiled, {len(days) - len(todo)} from the cached manifest")
+
+    manifest['profiled_at'] = datetime.now().isoformat(timespec='seconds')
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def load_profile(data_dir=None):
+    """Return the saved manifest, or None if the databases have not been profiled."""
+    path = default_profile_path(data_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def bad_days(data_dir=None, role='session'):
+    """
+    Days the saved manifest marks as unusable, without querying the databases.
+
+    Args:
+        data_dir (str): Directory holding the manifest
+        role (str): 'session' for days without any data, which are not
+            trading days at all; 'entry' also counts days missing one of
+            the manifest's entry bars, 'exit' days missing an exit bar
+
+    Returns:
+        dict: ddmmyyyy date to list of reasons; empty if there is no manifest
+    """
+    if role not in ROLE_TIMES:
+        raise ValueError(f"role must be one of {tuple(ROLE_TIMES)}")
+    manifest = load_profile(data_dir)
+    if manifest is None:
+        return {}
+    times = manifest.get(f'{role}_times', ROLE_TIMES[role])
+
+    reasons = {}
+    for kind, _ in DATABASES:
+        for date, day in manifest.get(kind, {}).items():
+            reason = _problem(kind, day, times)
+            if reason:
+                reasons.setdefault(date, []).append(reason)
+
+    # A day without option data cannot be traded even if its spot table is fine
+    spot_days = set(manifest.get('spot', {}))
+    for date in spot_days - set(manifest.get('opt', {})):
+        if 'opt' in manifest:
+            reasons.setdefault(date, []).append("opt: no table")
+    return reasons
+
+
+def entry_days(calendar, data_dir=None):
+    """
+    Split the calendar into days a trade can be entered on and days it cannot.
+
+    A day is entered only if it has every entry bar and the session after
+    it has every exit bar. The last day is kept, its exit is not due yet.
+
+    Args:
+        calendar (TradingCalendar): Trading days of the run
+        data_dir (str): Directory holding the manifest
+
+    Returns:
+        tuple: (dates, skipped) where skipped maps every other ddmmyyyy
+        date to its reasons
+    """
+    no_entry = bad_days(data_dir, 'entry')
+    no_exit = bad_days(data_dir, 'exit')
+
+    dates, skipped = [], {}
+    for date in calendar:
+        reasons = list(no_entry.get(date, []))
+        next_date = calendar.next_day(date)
+        reasons += [f"next session {next_date} {reason}" for reason in no_exit.get(next_date, [])]
+        if reasons:
+            skipped[date] = reasons
+        else:
+            dates.append(date)
+    return dates, skipped
+
+
+def profile_frame(manifest, kind):
+    """Return one database's day profiles as a DataFrame indexed by date."""
+    days = manifest.get(kind, {})
+    frame = pd.DataFrame.from_dict(days, orient='index')
+    frame.index.name = 'date'
+    if 'missing_bars' in frame:
+        frame['missing_bars'] = frame['missing_bars'].map(lambda bars: ', '.join(bars))
+    return frame.drop(columns=['expiries'], errors='ignore')
@@ -0,0 +1,137 @@
+import os
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from db import POOL
+
+BACKENDS = ('thread', 'process')
+
+# One day that raised; error is 'ExceptionType: message'
+DayFailure = namedtuple('DayFailure', 'day error traceback')
+
+# Shared object of the worker processes, set once per process by _init_worker
+_shared = {}
+
+
+def _init_worker(shared):
+    _shared['value'] = shared
+
+
+def _call(func, shared, day):
+    """Run func on one day and return ('ok', value) or ('error', DayFailure)."""
+    try:
+        return 'ok', func(shared, day)
+    except Exception as e:
+        return 'error', DayFailure(day, f'{type(e).__name__}: {e}', traceback.format_exc())
+
+
+def _call_in_worker(func, day):
+    return _call(func, _shared['value'], day)
+
+
+class DayResults:
+    """
+    Outcome of one DayExecutor.map call.
+
+    Attributes:
+        results (list): (day, value) for every day that succeeded, in the
+            order the days were given
+        failures (list): DayFailure for every day that raised, in the same
+            order
+    """
+
+    def __init__(self, results, failures):
+        self.results = results
+        self.failures = failures
+
+    def values(self):
+        return [value for _, value in self.results]
+
+
+def print_failures(failures, title="Failed days"):
+    """Print collected DayFailures, one line each."""
+    if failures:
+        print(f"\n{title}: {len(failures)}")
+        for failure in failures:
+            print(f"  {failure.day}: {failure.error}")
+
+
+class DayExecutor:
+    """
+    Runs independent per-day work on a pool of threads or processes.
+
+    Results always come back in the order the days were given, whatever
+    order the workers finish in, so the output of a stage does not depend
+    on the worker count. A day that raises does not stop the others; its
+    exception is collected as a DayFailure instead.
+
+    Threads suit SQLite-bound work: every thread reads through its own
+    pooled connection and SQLite releases the GIL while a query runs. The
+    thread pool lives as long as the executor, so its threads and their
+    connections are reused by every map call until close().
+    Processes suit CPU-bound work; `func` must then be a module-level
+    function, and `shared` is pickled once per worker process rather than
+    once per day. Counters of the run log are only collected from threads.
+    """
+
+    def __init__(self, workers=None, backend='thread'):
+        """
+        Args:
+            workers (int): Pool size, os.cpu_count() by default; 1 runs the
+                days in the calling thread
+            backend (str): 'thread' or 'process'
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = backend
+        self._threads = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Stop the worker threads and close the connections they opened."""
+        if self._threads is not None:
+            self._threads.shutdown(wait=True)
+            self._threads = None
+        POOL.close_finished()
+
+    def map(self, func, days, shared=None):
+        """
+        Call func(shared, day) for every day.
+
+        Args:
+            func (callable): Work for one day
+            days (iterable): Days or other work items
+            shared: Read-only object every call gets, e.g. a chain loader
+
+        Returns:
+            DayResults
+        """
+        days = list(days)
+        workers = min(self.workers, len(days))
+        if workers <= 1:
+            outcomes = [_call(func, shared, day) for day in days]
+        elif self.backend == 'thread':
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.workers)
+            outcomes = list(self._threads.map(lambda day: _call(func, shared, day), days))
+        else:
+            chunksize = max(1, len(days) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(shared,)) as executor:
+                outcomes = list(executor.map(_call_in_worker, [func] * len(days), days,
+                                             chunksize=chunksize))
+
+        results, failures = [], []
+        for day, (status, value) in zip(days, outcomes):
+            if status == 'ok':
+                results.append((day, value))
+            else:
+                failures.append(value)
+        return DayResults(results, failures)
@@ -0,0 +1,174 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from analytics import equity_curve
+from market_store import table_to_date
+from trading_calendar import normalize_date
+
+STATE_FILE = 'state.json'
+
+# Stored results merged across incremental runs, one row per date (per leg for 'legs')
+LOG_FILES = {
+    'spot_movement': 'spot_movement.csv',
+    'legs': 'legs.csv',
+    'pnl': 'pnl.csv'
+}
+
+
+def default_state_dir(reports_dir=None):
+    if reports_dir is None:
+        reports_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'reports')
+    return os.path.join(reports_dir, 'incremental')
+
+
+def load_state(state_dir):
+    """Return the saved state ({'fingerprint', 'params', 'processed'}), or None."""
+    path = os.path.join(state_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state_dir, params, processed):
+    os.makedirs(state_dir, exist_ok=True)
+    state = {
+        'fingerprint': params.fingerprint(),
+        'params': params.to_dict(),
+        'processed': sorted(processed, key=table_to_date)
+    }
+    with open(os.path.join(state_dir, STATE_FILE), 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+def dates_to_process(state, calendar, params):
+    """
+    Trading days that still have to be run.
+
+    A day counts as processed once its next session existed when it was
+    run, so the last day of the previous run (whose exit was not in the
+    data yet) is picked up again together with the newly added days.
+
+    Returns:
+        tuple: (dates, processed) where processed is the set of days kept
+        from the saved state. It is empty when there is no state or the
+        state was written with different parameters
+    """
+    if state is None:
+        return list(calendar), set()
+    if state['fingerprint'] != params.fingerprint():
+        print("Parameters changed since the last incremental run; processing every day again")
+        return list(calendar), set()
+
+    processed = {normalize_date(d) for d in state['processed']}
+    return [d for d in calendar if d not in processed], processed
+
+
+def load_logs(state_dir):
+    """Read the stored results, indexed by ddmmyyyy date."""
+    logs = {}
+    for name, file in LOG_FILES.items():
+        path = os.path.join(state_dir, file)
+        if not os.path.exists(path):
+            logs[name] = None
+            continue
+        frame = pd.read_csv(path, dtype={'date': str, 'exit_date': str})
+        frame['date'] = frame['date'].map(normalize_date)
+        logs[name] = frame.set_index('date')
+    return logs
+
+
+def save_logs(state_dir, logs):
+    os.makedirs(state_dir, exist_ok=True)
+    for name, file in LOG_FILES.items():
+        if logs.get(name) is not None:
+            logs[name].to_csv(os.path.join(state_dir, file))
+
+
+def _chronological(frame):
+    order = np.argsort([table_to_date(d) for d in frame.index], kind='stable')
+    return frame.iloc[order]
+
+
+def merge_log(stored, new):
+    """Replace the stored rows of every date in `new` and keep the log in date order."""
+    if new is None or new.empty:
+        return stored
+    new = new.copy()
+    new.index = pd.Index([normalize_date(d) for d in new.index], name='date')
+    if stored is None or stored.empty:
+        return _chronological(new)
+    kept = stored[~stored.index.isin(new.index)]
+    return _chronological(pd.concat([kept, new]))
+
+
+def extend_pnl(stored, new):
+    """
+    Append new trades to the stored PnL log and extend its equity curve.
+
+    The cumulative PnL, peak, drawdown and drawdown duration of the new
+    trades continue from the last stored values, so history is not
+    recomputed. If a new trade falls before the end of the stored log the
+    whole curve is rebuilt.
+    """
+    merged = merge_log(stored, new)
+    if merged is None or new is None or new.empty:
+        return merged
+
+    merged = merged.copy()
+    new_dates = {normalize_date(d) for d in new.index}
+    is_new = merged.index.isin(new_dates)
+    first_new = int(np.argmax(is_new))
+
+    start = {}
+    if stored is not None and not stored.empty and is_new[first_new:].all() and first_new > 0:
+        last = merged.iloc[first_new - 1]
+        start = {
+            'start_pnl': last['cumulative_pnl'],
+            'start_peak': last['peak'],
+            'start_duration': int(last.get('drawdown_duration', 0))
+        }
+    else:
+        first_new = 0
+
+    curve = equity_curve(merged['pnl'].iloc[first_new:], **start)
+    for column in curve.columns:
+        if column not in merged:
+            merged[column] = 0
+        merged.iloc[first_new:, merged.columns.get_loc(column)] = curve[column].to_numpy()
+    return merged
+
+
+def update(state_dir, params, calendar, dates, processed, spot_movement, legs, pnl):
+    """
+    Merge one incremental run into the stored results and save the state.
+
+    Args:
+        state_dir (str): Directory holding the state and stored logs
+        params (StrategyParams): Parameters of the run
+        calendar (TradingCalendar): Calendar of every available day
+        dates (list): Days run this time
+        processed (set): Days kept from the saved state; empty when the
+            stored logs are being rebuilt
+        spot_movement, legs, pnl (pd.DataFrame): Results of this run
+
+    Returns:
+        dict: The merged 'spot_movement', 'legs' and 'pnl' logs
+    """
+    stored = load_logs(state_dir) if processed else dict.fromkeys(LOG_FILES)
+    logs = {
+        'spot_movement': merge_log(stored['spot_movement'], spot_movement),
+        'legs': merge_log(stored['legs'], legs),
+        'pnl': extend_pnl(stored['pnl'], pnl)
+    }
+    save_logs(state_dir, logs)
+
+    finished = {d for d in dates if calendar.next_day(d) is not None}
+    save_state(state_dir, params, processed | finished)
+
+    print(f"\nIncremental run: {len(dates)} days run, "
+          f"{len(processed | finished)} days in the stored results")
+    return logs
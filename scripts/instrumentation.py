@@ -0,0 +1,262 @@
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+# Counters the data-access code reports through count(). bytes_read is
+# counted where the data is read: the memory-mapped store and intermediate
+# columns handed out, and the values fetched from SQLite, whose pages are
+# read through its memory map too, so no OS read counter sees either
+COUNTERS = ('rows', 'queries', 'bytes_read')
+
+RECORD_COLUMNS = ('run_id', 'stage', 'span', 'day', 'wall_s', 'cpu_s', 'rows', 'queries',
+                  'bytes_read', 'peak_rss_mb')
+
+# The run being recorded, if any; count() and span() are no-ops without one
+_active = None
+
+
+def default_runs_dir():
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'reports', 'runs')
+
+
+def _peak_rss_mb():
+    """Peak resident set size since the last reset_peak_rss(), in MB."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and bytes on macOS, and cannot be reset
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def reset_peak_rss():
+    """Restart peak RSS tracking at the current RSS where the kernel allows it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+class _Probe:
+    """Resource readings taken when a stage or span starts."""
+
+    def __init__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.peak_rss_mb = 0.0
+
+    def finish(self, **fields):
+        record = dict(fields)
+        record.update({
+            'wall_s': time.perf_counter() - self.wall,
+            'cpu_s': time.process_time() - self.cpu,
+            'peak_rss_mb': max(self.peak_rss_mb, _peak_rss_mb())
+        })
+        record.update(self.counters)
+        return record
+
+
+class RunLog:
+    """
+    Structured per-stage and per-day measurements of one run.
+
+    Every stage records wall time, CPU time, rows read, SQLite queries,
+    bytes read from storage and peak RSS. Inside a stage, span() records
+    the same for a step (a chain load, the trailing loop, a sheet), usually
+    tagged with the day it worked on. Counters reported from worker threads
+    go to the stage that is running.
+    """
+
+    def __init__(self, run_id=None, meta=None):
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.meta = dict(meta or {})
+        self.records = []
+        self._stage = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measure one pipeline stage."""
+        reset_peak_rss()
+        probe = _Probe()
+        self._stage = (name, probe)
+        try:
+            yield probe
+        finally:
+            self._stage = None
+            self._append(probe.finish(run_id=self.run_id, stage=name, span=None, day=None))
+
+    @contextlib.contextmanager
+    def span(self, name, day=None):
+        """Measure one step of the running stage, optionally for one day."""
+        stage = self._stage
+        probe = _Probe()
+        spans = getattr(self._local, 'spans', None)
+        if spans is None:
+            spans = self._local.spans = []
+        spans.append(probe)
+        try:
+            yield probe
+        finally:
+            spans.pop()
+            record = probe.finish(run_id=self.run_id, stage=stage[0] if stage else None,
+                                  span=name, day=day)
+            if stage is not None:
+                stage[1].peak_rss_mb = max(stage[1].peak_rss_mb, record['peak_rss_mb'])
+            self._append(record)
+
+    def count(self, **counters):
+        """Add to the counters of the running stage and this thread's open spans."""
+        probes = list(getattr(self._local, 'spans', None) or [])
+        stage = self._stage
+        if stage is not None:
+            probes.append(stage[1])
+        with self._lock:
+            for probe in probes:
+                for name, value in counters.items():
+                    probe.counters[name] = probe.counters.get(name, 0) + value
+
+    def _append(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def to_frame(self):
+        return pd.DataFrame(self.records, columns=list(RECORD_COLUMNS))
+
+    def stage_frame(self):
+        """One row per stage, plus per-span totals over all days."""
+        frame = self.to_frame()
+        stages = frame[frame['span'].isna()].drop(columns=['run_id', 'span', 'day'])
+        spans = frame[frame['span'].notna()].groupby(['stage', 'span'], sort=False).agg(
+            days=('day', 'nunique'), wall_s=('wall_s', 'sum'), cpu_s=('cpu_s', 'sum'),
+            rows=('rows', 'sum'), queries=('queries', 'sum'), bytes_read=('bytes_read', 'sum'),
+            peak_rss_mb=('peak_rss_mb', 'max')
+        )
+        return stages.set_index('stage'), spans
+
+    def save(self, runs_dir=None):
+        """
+        Write run_<id>.json (meta, stages and every record) and run_<id>.csv.
+
+        Returns:
+            tuple: (json path, csv path)
+        """
+        runs_dir = runs_dir or default_runs_dir()
+        os.makedirs(runs_dir, exist_ok=True)
+        base = os.path.join(runs_dir, f'run_{self.run_id}')
+
+        frame = self.to_frame()
+        frame.to_csv(f'{base}.csv', index=False)
+        with open(f'{base}.json', 'w') as f:
+            json.dump({
+                'run_id': self.run_id,
+                'meta': self.meta,
+                'records': json.loads(frame.to_json(orient='records'))
+            }, f, indent=1)
+        return f'{base}.json', f'{base}.csv'
+
+    def print_summary(self):
+        stages, spans = self.stage_frame()
+        with pd.option_context('display.float_format', '{:.3f}'.format, 'display.width', 120):
+            print("\nRun Log:")
+            print("========")
+            print(stages.to_string())
+            if not spans.empty:
+                print("\nSteps within stages:")
+                print(spans.to_string())
+
+
+def start_run(run_id=None, meta=None):
+    """Make a new RunLog the active one and return it."""
+    global _active
+    _active = RunLog(run_id, meta)
+    return _active
+
+
+def end_run():
+    global _active
+    log, _active = _active, None
+    return log
+
+
+def active_run():
+    return _active
+
+
+def count(**counters):
+    """Report rows read or queries issued to the active run, if any."""
+    if _active is not None:
+        _active.count(**counters)
+
+
+def span(name, day=None):
+    """Measure a step of the running stage; a no-op when no run is active."""
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.span(name, day)
+
+
+def on_query(statement):
+    """sqlite3 trace callback: count the SELECTs issued."""
+    if _active is not None and statement.lstrip()[:6].upper() == 'SELECT':
+        _active.count(queries=1)
+
+
+@contextlib.contextmanager
+def profiled(kind, path):
+    """
+    Profile the enclosed code with cProfile or pyinstrument.
+
+    Args:
+        kind (str): 'cprofile' or 'pyinstrument'; pyinstrument falls back
+            to cProfile when it is not installed
+        path (str): Output file without extension; .prof (cProfile) or
+            .html (pyinstrument) is added
+    """
+    if kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is not installed; using cProfile")
+            kind = 'cprofile'
+
+    if kind == 'pyinstrument':
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(f'{path}.html', 'w') as f:
+                f.write(profiler.output_html())
+            print(f"\nProfile saved to {path}.html")
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(f'{path}.prof')
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(20)
+        print(output.getvalue())
+        print(f"Profile saved to {path}.prof")
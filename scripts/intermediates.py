@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+import instrumentation
+
+# Stage outputs handed from one stage script to the next
+NAMES = ('spot_movement', 'strike_selection', 'option_prices', 'trailing_exits',
+         'pnl_analysis', 'leg_pnl')
+
+SCHEMA_FILE = 'schema.json'
+
+# Stored as .npy with their own dtype; everything else is stored as text
+NATIVE_KINDS = 'biufmM'
+
+
+def default_reports_dir():
+    return os.path.join(os.path.dirname(SCRIPTS_DIR), 'reports')
+
+
+def intermediate_dir(name, reports_dir=None):
+    """Directory one intermediate is stored in, e.g. reports/spot_movement/."""
+    return os.path.join(reports_dir or default_reports_dir(), name)
+
+
+def _encode(values):
+    """Return (array to store, null mask or None) for one column."""
+    values = np.asarray(values)
+    if values.dtype.kind in NATIVE_KINDS:
+        return values, None
+    nulls = pd.isna(values)
+    text = np.where(nulls, '', values).astype(str)
+    return text, nulls if nulls.any() else None
+
+
+def write_frame(frame, name, reports_dir=None):
+    """
+    Write a DataFrame as one .npy file per column plus a schema.
+
+    Numbers, booleans and datetimes keep their dtype; text columns become
+    fixed-width unicode arrays with a null mask when they hold missing
+    values. The index is stored as a column too, so a ddmmyyyy date index
+    stays text instead of turning into an int as it does in a CSV.
+
+    The files are written to a new directory that then replaces the old
+    one, so readers never see a half-written intermediate.
+
+    Returns:
+        str: The intermediate's directory
+    """
+    path = intermediate_dir(name, reports_dir)
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    index_name = frame.index.name
+    columns = [(index_name, frame.index.to_numpy())] if index_name is not None else []
+    columns += [(str(col), frame[col].to_numpy()) for col in frame.columns]
+
+    schema = {'rows': len(frame), 'index': index_name, 'columns': []}
+    for col, values in columns:
+        data, nulls = _encode(values)
+        entry = {'name': col, 'file': f'{col}.npy', 'dtype': data.dtype.str,
+                 'text': values.dtype.kind not in NATIVE_KINDS}
+        np.save(os.path.join(tmp, entry['file']), data)
+        if nulls is not None:
+            entry['nulls'] = f'{col}.nulls.npy'
+            np.save(os.path.join(tmp, entry['nulls']), nulls)
+        schema['columns'].append(entry)
+
+    with open(os.path.join(tmp, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f, indent=1)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return path
+
+
+def read_schema(name, reports_dir=None):
+    """Return the schema of a stored intermediate, or None if it is missing."""
+    path = os.path.join(intermediate_dir(name, reports_dir), SCHEMA_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_columns(name, reports_dir=None):
+    """
+    Return a stored intermediate as a dict of column arrays.
+
+    Every column, the index included, is memory-mapped; numeric columns
+    are used in place without being copied or parsed. Text columns are
+    fixed-width unicode arrays, with missing values as ''.
+
+    Returns:
+        dict: Column name to array, or None if the intermediate is missing
+    """
+    schema = read_schema(name, reports_dir)
+    if schema is None:
+        return None
+    path = intermediate_dir(name, reports_dir)
+    columns = {entry['name']: np.load(os.path.join(path, entry['file']), mmap_mode='r')
+               for entry in schema['columns']}
+    instrumentation.count(rows=schema['rows'], bytes_read=sum(values.nbytes for values in columns.values()))
+    return columns
+
+
+def read_frame(name, reports_dir=None):
+    """
+    Read a stored intermediate back into the DataFrame that was written.
+
+    Numeric columns wrap the memory-mapped arrays without copying them.
+    A <name>.csv export is never read back: it may be left over from an
+    older run with a different layout.
+
+    Returns:
+        pd.DataFrame, or None if the intermediate has not been stored
+    """
+    schema = read_schema(name, reports_dir)
+    if schema is None:
+        return None
+
+    path = intermediate_dir(name, reports_dir)
+    data = {}
+    mapped = 0
+    for entry in schema['columns']:
+        values = np.load(os.path.join(path, entry['file']), mmap_mode='r')
+        mapped += values.nbytes
+        if entry['text']:
+            values = values.astype(object)
+            if 'nulls' in entry:
+                values[np.load(os.path.join(path, entry['nulls']))] = None
+        data[entry['name']] = values
+    instrumentation.count(rows=schema['rows'], bytes_read=mapped)
+
+    frame = pd.DataFrame(data, copy=False)
+    if schema['index'] is not None:
+        frame = frame.set_index(schema['index'])
+    return frame
+
+
+def export_csv(name, reports_dir=None):
+    """Write a stored intermediate to reports/<name>.csv; returns the path or None."""
+    if read_schema(name, reports_dir) is None:
+        return None
+    frame = read_frame(name, reports_dir)
+    csv_file = os.path.join(reports_dir or default_reports_dir(), f'{name}.csv')
+    frame.to_csv(csv_file)
+    return csv_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export stored stage outputs to CSV.")
+    parser.add_argument('names', nargs='*', metavar='NAME', help=f"intermediates (default: {', '.join(NAMES)})")
+    args = parser.parse_args()
+
+    for name in args.names or NAMES:
+        csv_file = export_csv(name)
+        print(f"{name}: {csv_file or 'not found'}")
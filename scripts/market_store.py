@@ -0,0 +1,278 @@
+import argparse
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from db import connection, day_table
+
+# Option types are stored as small integer codes
+INSTRUMENT_TYPES = ('CE', 'PE')
+
+SPOT_COLUMNS = ('date', 'minute', 'open', 'high', 'low', 'close')
+OPTION_COLUMNS = ('date', 'minute', 'expiry', 'strike', 'instrument_type',
+                  'open', 'high', 'low', 'close')
+
+COLUMN_DTYPES = {
+    'date': 'datetime64[D]',
+    'expiry': 'datetime64[D]',
+    'minute': np.int16,
+    'strike': np.int32,
+    'instrument_type': np.int8,
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64
+}
+
+# Rows are sorted so one day (spot) or one contract-day (options) is contiguous
+SORT_KEYS = {
+    'spot': ['date', 'minute'],
+    'opt': ['date', 'expiry', 'strike', 'instrument_type', 'minute']
+}
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def default_data_dir():
+    """Return the repository's data directory."""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(os.path.dirname(current_dir), 'data')
+
+
+def default_store_dir(data_dir=None):
+    """Return the directory the columnar store lives in."""
+    return os.path.join(data_dir or default_data_dir(), 'store')
+
+
+def table_to_date(table_name):
+    """Convert a ddmmyyyy table name (zero padding optional) to a datetime64[D]."""
+    return np.datetime64(datetime.strptime(str(table_name).zfill(8), '%d%m%Y').date(), 'D')
+
+
+def date_to_table(date):
+    """Convert a datetime64/date back to its ddmmyyyy table name."""
+    return pd.Timestamp(date).strftime('%d%m%Y')
+
+
+def minute_of_day(time_str):
+    """Convert an 'HH:MM[:SS]' string to minutes after midnight."""
+    parts = str(time_str).split(':')
+    return int(parts[0]) * 60 + int(parts[1])
+
+
+def format_minute(minute):
+    """Convert minutes after midnight back to an 'HH:MM:SS' string."""
+    return f"{int(minute) // 60:02d}:{int(minute) % 60:02d}:00"
+
+
+def parse_expiries(values):
+    """Parse expiry strings (ISO or day-first) into a datetime64[D] array."""
+    values = pd.Index(values, dtype=object).astype(str)
+    parsed = pd.to_datetime(values, format='ISO8601', errors='coerce')
+    if parsed.isna().all():
+        parsed = pd.to_datetime(values, dayfirst=True, errors='coerce')
+    return parsed.to_numpy().astype('datetime64[D]')
+
+
+def list_day_tables(conn):
+    """Return the ddmmyyyy day tables of a database in chronological order."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    tables = []
+    for (name,) in cursor.fetchall():
+        try:
+            tables.append((table_to_date(name), name))
+        except ValueError:
+            continue
+    return [name for _, name in sorted(tables)]
+
+
+def convert_day(frame, table_name, kind):
+    """Convert one day table read from SQLite into typed store columns."""
+    # A day only has a few hundred distinct times, so parse each one once
+    codes, times = pd.factorize(frame['time'].astype(str))
+    columns = {
+        'date': np.full(len(frame), table_to_date(table_name)),
+        'minute': np.array([minute_of_day(t) for t in times], dtype=np.int16)[codes]
+    }
+    for col in ('open', 'high', 'low', 'close'):
+        columns[col] = pd.to_numeric(frame[col], errors='coerce').to_numpy()
+
+    if kind == 'opt':
+        if 'expiry' in frame.columns:
+            codes, expiries = pd.factorize(frame['expiry'].astype(str))
+            columns['expiry'] = parse_expiries(expiries)[codes]
+        else:
+            columns['expiry'] = np.full(len(frame), np.datetime64('NaT', 'D'))
+        columns['strike'] = pd.to_numeric(frame['strike'], errors='coerce').round().to_numpy()
+        codes = {name: code for code, name in enumerate(INSTRUMENT_TYPES)}
+        columns['instrument_type'] = frame['instrument_type'].map(codes).fillna(-1).to_numpy()
+
+    names = SPOT_COLUMNS if kind == 'spot' else OPTION_COLUMNS
+    return pd.DataFrame({
+        name: np.asarray(columns[name]).astype(COLUMN_DTYPES[name]) for name in names
+    })
+
+
+def _write_partition(store_dir, kind, partition, frames):
+    """Write one month of day frames as one .npy file per column."""
+    data = pd.concat(frames, ignore_index=True)
+    data = data.sort_values(SORT_KEYS[kind], kind='stable', ignore_index=True)
+
+    part_dir = os.path.join(store_dir, kind, partition)
+    os.makedirs(part_dir, exist_ok=True)
+    for col in data.columns:
+        np.save(os.path.join(part_dir, f'{col}.npy'), data[col].to_numpy().astype(COLUMN_DTYPES[col]))
+
+    # Row range of every day inside the partition
+    dates = data['date'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])
+    stops = np.r_[starts[1:], len(dates)]
+    return {
+        date_to_table(dates[start]): [partition, int(start), int(stop)]
+        for start, stop in zip(starts, stops)
+    }
+
+
+def build_store(data_dir=None, store_dir=None):
+    """
+    Convert SPOT.db and OPT.db into the partitioned columnar store.
+
+    Every day table is read once, converted to typed columns (datetime64
+    date and expiry, integer minute-of-day, strike and instrument type) and
+    written into monthly partitions of .npy files that can be memory-mapped.
+
+    Args:
+        data_dir (str): Directory holding SPOT.db and OPT.db
+        store_dir (str): Output directory, data/store by default
+
+    Returns:
+        dict: The manifest that was written
+    """
+    data_dir = data_dir or default_data_dir()
+    store_dir = store_dir or default_store_dir(data_dir)
+    os.makedirs(store_dir, exist_ok=True)
+
+    manifest = {'built_at': datetime.now().isoformat(timespec='seconds')}
+
+    for kind, db_name in (('spot', 'SPOT.db'), ('opt', 'OPT.db')):
+        conn = connection(os.path.join(data_dir, db_name))
+        tables = list_day_tables(conn)
+
+        days = {}
+        partition, frames = None, []
+        for table in tables:
+            day_partition = str(table_to_date(table))[:7]
+            if frames and day_partition != partition:
+                days.update(_write_partition(store_dir, kind, partition, frames))
+                frames = []
+            partition = day_partition
+
+            try:
+                frame = pd.read_sql_query(f'SELECT * FROM {day_table(table)}', conn)
+            except (sqlite3.OperationalError, pd.errors.DatabaseError) as e:
+                print(f"Error reading {db_name} table {table}: {str(e)}")
+                continue
+            if not frame.empty:
+                frames.append(convert_day(frame, table, kind))
+
+        if frames:
+            days.update(_write_partition(store_dir, kind, partition, frames))
+
+        manifest[kind] = days
+        print(f"{db_name}: {len(days)} days converted")
+
+    with open(os.path.join(store_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    return manifest
+
+
+class MarketStore:
+    """Read-only access to the columnar store written by build_store."""
+
+    def __init__(self, store_dir=None):
+        self.store_dir = store_dir or default_store_dir()
+        with open(os.path.join(self.store_dir, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self._columns = {}
+
+    def __getstate__(self):
+        # Worker processes map the column files again instead of copying them
+        return dict(self.__dict__, _columns={})
+
+    def dates(self, kind='spot'):
+        """Return the stored ddmmyyyy dates in chronological order."""
+        return sorted(self.manifest[kind], key=table_to_date)
+
+    def has_date(self, date, kind='spot'):
+        return str(date).zfill(8) in self.manifest[kind]
+
+    def column(self, kind, partition, name):
+        """Return one partition column as a memory-mapped array."""
+        key = (kind, partition, name)
+        if key not in self._columns:
+            path = os.path.join(self.store_dir, kind, partition, f'{name}.npy')
+            self._columns[key] = np.load(path, mmap_mode='r')
+        return self._columns[key]
+
+    def day(self, kind, date, columns=None):
+        """
+        Return the rows of one day as column arrays.
+
+        Args:
+            kind (str): 'spot' or 'opt'
+            date (str): ddmmyyyy table name
+            columns (list): Columns to return, all by default
+
+        Returns:
+            dict: Column name to array view, or None if the day is missing
+        """
+        entry = self.manifest[kind].get(str(date).zfill(8))
+        if entry is None:
+            return None
+        partition, start, stop = entry
+        names = columns or (SPOT_COLUMNS if kind == 'spot' else OPTION_COLUMNS)
+        day = {name: self.column(kind, partition, name)[start:stop] for name in names}
+        instrumentation.count(rows=stop - start, bytes_read=sum(values.nbytes for values in day.values()))
+        return day
+
+    def spot_day(self, date, columns=None):
+        return self.day('spot', date, columns)
+
+    def option_day(self, date, columns=None):
+        return self.day('opt', date, columns)
+
+    def scan(self, kind, columns):
+        """Concatenate the given columns across every partition in date order."""
+        partitions = sorted({entry[0] for entry in self.manifest[kind].values()})
+        data = {
+            name: np.concatenate([self.column(kind, p, name) for p in partitions])
+            if partitions else np.array([], dtype=COLUMN_DTYPES[name])
+            for name in columns
+        }
+        instrumentation.count(rows=sum(stop - start for _, start, stop in self.manifest[kind].values()),
+                              bytes_read=sum(values.nbytes for values in data.values()))
+        return data
+
+
+def open_store(data_dir=None):
+    """Open the columnar store if it has been built, otherwise return None."""
+    store_dir = default_store_dir(data_dir)
+    if not os.path.exists(os.path.join(store_dir, MANIFEST_FILE)):
+        return None
+    return MarketStore(store_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the columnar market-data store.")
+    parser.add_argument('--data-dir', help="directory holding SPOT.db and OPT.db")
+    parser.add_argument('--store-dir', help="output directory (default: data/store)")
+    args = parser.parse_args()
+
+    build_store(args.data_dir, args.store_dir)
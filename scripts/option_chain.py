@@ -0,0 +1,513 @@
+import argparse
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from bar_cache import aggregate
+from contracts import ContractIndex, select_expiry
+from db import day_table
+from market_store import (INSTRUMENT_TYPES, default_data_dir, format_minute, list_day_tables,
+                          minute_of_day)
+from query import scan_options
+from trading_calendar import normalize_date
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+
+
+class OptionChain:
+    """
+    One day's option chain held as dense (minute, strike, type) arrays.
+
+    Looking up a leg is plain array indexing: the minute and strike are
+    mapped to positions with a binary search over the sorted axes.
+    """
+
+    def __init__(self, date, minute, strike, instrument_type, fields, expiry=None):
+        """
+        Args:
+            date (str): ddmmyyyy trading day
+            minute (np.ndarray): Minute of day of every row
+            strike (np.ndarray): Strike of every row
+            instrument_type (np.ndarray): Type code of every row (0=CE, 1=PE)
+            fields (dict): Price field name to array of row values
+            expiry (np.datetime64): Expiry the chain was filtered to, if any
+        """
+        self.date = date
+        self.expiry = expiry
+        self.minutes = np.unique(minute)
+        self.strikes = np.unique(strike)
+
+        shape = (len(self.minutes), len(self.strikes), len(INSTRUMENT_TYPES))
+        m_idx = np.searchsorted(self.minutes, minute)
+        s_idx = np.searchsorted(self.strikes, strike)
+        valid = (instrument_type >= 0) & (instrument_type < len(INSTRUMENT_TYPES))
+
+        # Assign in reverse so the first row wins when a bar is duplicated
+        order = np.flatnonzero(valid)[::-1]
+        self.fields = {}
+        for name, values in fields.items():
+            cube = np.full(shape, np.nan)
+            cube[m_idx[order], s_idx[order], instrument_type[order]] = np.asarray(values, dtype=float)[order]
+            self.fields[name] = cube
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def _minute_pos(self, minutes):
+        minutes = np.atleast_1d(minutes)
+        pos = np.clip(np.searchsorted(self.minutes, minutes), 0, max(len(self.minutes) - 1, 0))
+        found = len(self.minutes) > 0
+        return pos, (self.minutes[pos] == minutes) if found else np.zeros(len(minutes), dtype=bool)
+
+    def _strike_pos(self, strikes):
+        strikes = np.atleast_1d(strikes)
+        pos = np.clip(np.searchsorted(self.strikes, strikes), 0, max(len(self.strikes) - 1, 0))
+        found = len(self.strikes) > 0
+        return pos, (self.strikes[pos] == strikes) if found else np.zeros(len(strikes), dtype=bool)
+
+    def prices(self, times, strikes, option_types, field='close'):
+        """
+        Look up many legs at once.
+
+        Args:
+            times (list): 'HH:MM:SS' strings or minutes of day
+            strikes (list): Strikes
+            option_types (list): 'CE'/'PE' strings or type codes
+            field (str): Price field
+
+        Returns:
+            np.ndarray: Prices, NaN where the chain has no such bar
+        """
+        minutes = np.array([minute_of_day(t) if isinstance(t, str) else t for t in np.atleast_1d(times)])
+        codes = np.array([INSTRUMENT_TYPES.index(t) if isinstance(t, str) else t
+                          for t in np.atleast_1d(option_types)])
+        m_pos, m_found = self._minute_pos(minutes)
+        s_pos, s_found = self._strike_pos(np.asarray(strikes))
+        m_pos, s_pos, codes = np.broadcast_arrays(m_pos, s_pos, codes)
+
+        result = np.full(m_pos.shape, np.nan)
+        found = np.broadcast_to(m_found & s_found, m_pos.shape)
+        if found.any():
+            result[found] = self.fields[field][m_pos[found], s_pos[found], codes[found]]
+        return result
+
+    def price(self, time, strike, option_type, field='close'):
+        """Look up one leg; returns None when the chain has no such bar."""
+        value = self.prices([time], [strike], [option_type], field)[0]
+        return None if np.isnan(value) else float(value)
+
+    def bars(self, strike, option_type, start=None, end=None):
+        """
+        Return the minute bars of one contract between start and end.
+
+        Returns:
+            pd.DataFrame: time, open, high, low, close for the minutes the
+            contract traded
+        """
+        s_pos, s_found = self._strike_pos([strike])
+        code = INSTRUMENT_TYPES.index(option_type) if isinstance(option_type, str) else option_type
+        mask = np.ones(len(self.minutes), dtype=bool)
+        if start is not None:
+            mask &= self.minutes >= minute_of_day(start)
+        if end is not None:
+            mask &= self.minutes <= minute_of_day(end)
+        if not s_found[0]:
+            mask[:] = False
+
+        data = {'time': [format_minute(m) for m in self.minutes[mask]]}
+        for name, cube in self.fields.items():
+            data[name] = cube[mask, s_pos[0], code]
+        frame = pd.DataFrame(data)
+        return frame.dropna(subset=['close']).reset_index(drop=True)
+
+    def leg_bars(self, strikes, option_types, start=None, end=None):
+        """
+        Return the minute bars of several contracts as matrices.
+
+        Returns:
+            tuple: (minutes, fields) where minutes is the minute of day of
+            each column and fields maps price field name to an array of
+            shape (contracts, minutes); cells without a bar are NaN
+        """
+        s_pos, s_found = self._strike_pos(np.asarray(strikes))
+        codes = np.array([INSTRUMENT_TYPES.index(t) if isinstance(t, str) else t
+                          for t in np.atleast_1d(option_types)], dtype=int)
+        mask = np.ones(len(self.minutes), dtype=bool)
+        if start is not None:
+            mask &= self.minutes >= minute_of_day(start)
+        if end is not None:
+            mask &= self.minutes <= minute_of_day(end)
+
+        fields = {}
+        for name, cube in self.fields.items():
+            matrix = cube[mask][:, s_pos, codes].T if len(self.strikes) else np.full((len(s_pos), mask.sum()), np.nan)
+            matrix[~s_found] = np.nan
+            fields[name] = matrix
+        return self.minutes[mask], fields
+
+    def available_strikes(self, option_type=None, time=None):
+        """Strikes that have at least one bar (at `time`, if given)."""
+        close = self.fields['close']
+        if time is not None:
+            pos, found = self._minute_pos([minute_of_day(time)])
+            close = close[pos] if found[0] else close[:0]
+        if option_type is not None:
+            close = close[..., [INSTRUMENT_TYPES.index(option_type)]]
+        return self.strikes[~np.isnan(close).all(axis=(0, 2))]
+
+
+class StrikeIndex:
+    """
+    Strikes quoted on each day at one time of day, per expiry and option type.
+
+    Strikes are snapped within the expiry a trade entered that day is
+    placed in, picked from the expiries quoted at that time with
+    select_expiry like 04 does, so a strike listed only for another expiry
+    is never chosen. Each day is read once (one scan of the store, or one
+    query per day on OPT.db) and kept for the rest of the run.
+    """
+
+    # Spacing between day groups in the flattened search keys
+    _SPAN = 1 << 32
+
+    def __init__(self, data_dir=None, store=None, time='15:25:00', dates=None, expiry_rollover='expiry_day'):
+        """
+        Args:
+            data_dir (str): Directory holding OPT.db
+            store (MarketStore): Columnar store to read from instead of OPT.db
+            time (str): Time of day the strikes must be quoted at
+            dates (list): Only read these ddmmyyyy days from the store,
+                instead of scanning every day
+            expiry_rollover (str): Expiry rule of 04, one of EXPIRY_ROLLOVER
+        """
+        self.data_dir = data_dir
+        self.store = store
+        self.time = time
+        self.expiry_rollover = expiry_rollover
+        self._expiries = {}
+        self._strikes = {}
+        if store is not None:
+            self._load_store(dates)
+
+    def _query(self):
+        return (scan_options(self.data_dir, self.store).between(self.time, self.time)
+                .select('expiry', 'strike', 'instrument_type'))
+
+    def _add_day(self, date, columns):
+        """Group one day's (expiry, strike, type) rows and pick its traded expiry."""
+        expiry = columns['expiry']
+        code = columns['instrument_type']
+        strike = columns['strike'].astype(np.int64)
+        dated = ~np.isnat(expiry)
+
+        # Rows without an expiry only count on days where no row has one
+        keys = np.unique(expiry[dated]) if dated.any() else [None]
+        for key in keys:
+            rows = dated & (expiry == key) if key is not None else np.ones(len(code), dtype=bool)
+            for type_code in range(len(INSTRUMENT_TYPES)):
+                self._strikes[(date, key, type_code)] = np.unique(strike[rows & (code == type_code)])
+        self._expiries[date] = select_expiry(expiry, date, self.expiry_rollover)
+
+    def _load_store(self, dates=None):
+        query = self._query()
+        if dates is not None:
+            query = query.on(dates)
+        for date, columns in query.days():
+            self._add_day(date, columns)
+
+    def _load_db(self, date):
+        days = dict(self._query().on([date]).days())
+        columns = days.get(date)
+        if columns is None:
+            self._expiries[date] = None
+            return
+        self._add_day(date, columns)
+
+    def expiry(self, date):
+        """Expiry a trade entered on date is placed in, or None if none is quoted."""
+        date = normalize_date(date)
+        if date not in self._expiries and self.store is None:
+            self._load_db(date)
+        return self._expiries.get(date)
+
+    def strikes(self, date, option_type, expiry=None):
+        """
+        Sorted strikes of one option type quoted on date.
+
+        Args:
+            date (str): ddmmyyyy day
+            option_type: 'CE', 'PE' or its type code
+            expiry: Expiry of the strikes, the traded expiry by default
+        """
+        date = normalize_date(date)
+        code = INSTRUMENT_TYPES.index(option_type) if isinstance(option_type, str) else option_type
+        key = self.expiry(date) if expiry is None else np.datetime64(expiry, 'D')
+        return self._strikes.get((date, key, code), np.array([], dtype=np.int64))
+
+    def snap(self, dates, targets, option_types, atm=None):
+        """
+        Move each target strike to the nearest strike quoted that day.
+
+        All lookups are done with one searchsorted over the strikes of every
+        requested day laid end to end. Targets on days without quotes are
+        returned unchanged.
+
+        Args:
+            dates (list): ddmmyyyy day per target
+            targets (array-like): Strikes to snap
+            option_types (array-like): 'CE' or 'PE' per target
+            atm (array-like): ATM strike per target when the targets are
+                hedges; each hedge then stays at least one listed strike
+                away from it, below for a PE and above for a CE
+
+        Returns:
+            np.ndarray: Snapped strikes
+        """
+        dates = [normalize_date(d) for d in dates]
+        targets = np.asarray(targets, dtype=np.int64)
+        groups = list(dict.fromkeys(zip(dates, option_types)))
+        group_of = {key: g for g, key in enumerate(groups)}
+
+        keys = [g * self._SPAN + self.strikes(*key).astype(np.int64) for g, key in enumerate(groups)]
+        keys = np.concatenate(keys) if keys else np.array([], dtype=np.int64)
+        if not len(keys):
+            return targets
+
+        request_group = np.array([group_of[key] for key in zip(dates, option_types)], dtype=np.int64)
+        offset = request_group * self._SPAN
+        query = offset + targets
+
+        # Candidates must come from the request's own day group, and a
+        # hedge from its own side of the ATM strike
+        low = np.zeros_like(targets)
+        high = np.full_like(targets, self._SPAN - 1)
+        if atm is not None:
+            atm = np.asarray(atm, dtype=np.int64)
+            put = np.asarray(option_types) == 'PE'
+            high = np.where(put, np.minimum(atm - 1, high), high)
+            low = np.where(put, low, np.maximum(atm + 1, low))
+        first = np.searchsorted(keys, offset + low, side='left')
+        stop = np.searchsorted(keys, offset + high, side='right')
+
+        pos = np.clip(np.searchsorted(keys, query), first, stop)
+        below = keys[np.clip(pos - 1, 0, len(keys) - 1)]
+        above = keys[np.clip(pos, 0, len(keys) - 1)]
+        below_ok = pos > first
+        above_ok = pos < stop
+        use_above = above_ok & (~below_ok | (above - query < query - below))
+        snapped = np.where(use_above, above, np.where(below_ok, below, query))
+        return snapped - offset
+
+
+def index_name(table):
+    return f'idx_{table}_time_strike_type'
+
+
+def ensure_indexes(db_path):
+    """
+    Create the (time, strike, instrument_type) index on every OPT.db day table.
+
+    This is a one-time step; tables that already have the index are skipped.
+
+    Returns:
+        int: Number of indexes created
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index';")
+    existing = {name for (name,) in cursor.fetchall()}
+
+    created = 0
+    for table in list_day_tables(conn):
+        if index_name(table) in existing:
+            continue
+        cursor.execute(
+            f'CREATE INDEX "{index_name(table)}" ON {day_table(table)} (time, strike, instrument_type)'
+        )
+        created += 1
+
+    conn.commit()
+    conn.close()
+    return created
+
+
+def nearest_expiry(expiry, date):
+    """Return the first expiry on or after date among an array of expiries."""
+    return select_expiry(expiry, date, rollover='none')
+
+
+class OptionChainLoader:
+    """
+    Reads one day's chain at a time from the columnar store or OPT.db.
+
+    Loaded chains are kept in a small LRU cache, so the entry-day and
+    next-morning lookups of neighbouring trades reuse the same chain. One
+    loader can be shared by worker threads, and pickled to worker
+    processes without its cache.
+    N-minute chains are read from the bar cache when it holds the day, and
+    aggregated from the minute bars otherwise.
+    """
+
+    def __init__(self, data_dir=None, store=None, cache_size=8, bar_cache=None):
+        self.data_dir = data_dir or default_data_dir()
+        self.store = store
+        self.cache_size = cache_size
+        self.bar_cache = bar_cache
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__, _cache=OrderedDict())
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Drop the cached chains; the connection stays in the shared pool."""
+        with self._lock:
+            self._cache.clear()
+
+    def _read(self, date, start, end, strikes=None):
+        """Read the window from the store or OPT.db, with the filters pushed down."""
+        if self.store is not None and not self.store.has_date(date, 'opt'):
+            return None
+        query = scan_options(self.data_dir, self.store).on([date]).between(start, end)
+        if strikes is not None:
+            query = query.strikes(*strikes)
+        days = list(query.select('minute', 'expiry', 'strike', 'instrument_type', *PRICE_FIELDS).days())
+        return days[0][1] if days else None
+
+    def _read_bars(self, date, start, end, bar_minutes, strikes=None):
+        """
+        N-minute bars that both start and close inside the time window.
+
+        Each bar is labelled with the minute it closes, so an exit on it is
+        reported at the time its close is known.
+        """
+        if self.bar_cache is not None and self.bar_cache.has(bar_minutes, date):
+            day = self.bar_cache.option_day(date, bar_minutes)
+            keep = np.ones(len(day['strike']), dtype=bool)
+            if strikes is not None:
+                keep = (day['strike'] >= strikes[0]) & (day['strike'] <= strikes[1])
+            data = {name: np.asarray(values[keep]) for name, values in day.items() if name != 'date'}
+        else:
+            data = self._read(date, start, end, strikes)
+            if data is None:
+                return None
+            keys = [name for name in ('expiry', 'strike', 'instrument_type') if name in data]
+            data = aggregate({name: data[name] for name in keys}, data['minute'], data, bar_minutes)
+
+        first = data['minute']
+        data['minute'] = first + bar_minutes - 1
+        keep = np.ones(len(first), dtype=bool)
+        if start is not None:
+            keep &= first >= minute_of_day(start)
+        if end is not None:
+            keep &= data['minute'] <= minute_of_day(end)
+        return {name: values[keep] for name, values in data.items()}
+
+    def contracts(self, date, start=None, end=None):
+        """
+        Return the ContractIndex of one day, built on first use.
+
+        Only the rows inside the time window are read, with the filter
+        pushed down to the store or OPT.db; pricing the entry minute reads
+        that minute's rows and nothing else.
+
+        Args:
+            date (str): ddmmyyyy trading day
+            start (str): First time of day to index
+            end (str): Last time of day to index
+
+        Returns:
+            ContractIndex, or None if the day is not in the data
+        """
+        date = normalize_date(date)
+        key = (date, 'contracts', start, end)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        with instrumentation.span('contract_index', day=date):
+            data = self._read(date, start, end)
+            if data is None:
+                return None
+            index = ContractIndex(date, data)
+
+        with self._lock:
+            self._cache[key] = index
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return index
+
+    def load(self, date, start=None, end=None, expiry=None, bar_minutes=1, strikes=None):
+        """
+        Load one day's chain, optionally restricted to a time window.
+
+        When the day holds several expiries the chain is filtered to
+        `expiry`, or to the nearest expiry on or after the date.
+
+        Args:
+            date (str): ddmmyyyy trading day
+            start (str): First time of day to load
+            end (str): Last time of day to load
+            expiry (np.datetime64): Expiry to keep
+            bar_minutes (int): Load N-minute bars instead of minute bars;
+                see _read_bars for the window and labels
+            strikes (tuple): (low, high) strike range to read; the whole
+                chain by default
+
+        Returns:
+            OptionChain, or None if the day is not in the data
+        """
+        date = normalize_date(date)
+        strikes = None if strikes is None else (int(strikes[0]), int(strikes[1]))
+        key = (date, start, end, expiry, bar_minutes, strikes)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        with instrumentation.span('chain_load', day=date):
+            if bar_minutes > 1:
+                data = self._read_bars(date, start, end, bar_minutes, strikes)
+            else:
+                data = self._read(date, start, end, strikes)
+        if data is None:
+            return None
+
+        chosen = None
+        if 'expiry' in data and len(data['expiry']):
+            chosen = np.datetime64(expiry, 'D') if expiry is not None else nearest_expiry(data['expiry'], date)
+            if chosen is not None:
+                keep = data['expiry'] == chosen
+                data = {name: values[keep] for name, values in data.items()}
+
+        chain = OptionChain(
+            date, data['minute'], data['strike'].astype(int), data['instrument_type'].astype(int),
+            {name: data[name] for name in PRICE_FIELDS if name in data}, chosen
+        )
+
+        with self._lock:
+            self._cache[key] = chain
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return chain
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the OPT.db chain lookup index.")
+    parser.add_argument('--data-dir', help="directory holding OPT.db")
+    args = parser.parse_args()
+
+    created = ensure_indexes(os.path.join(args.data_dir or default_data_dir(), 'OPT.db'))
+    print(f"Created {created} indexes on OPT.db")
@@ -0,0 +1,379 @@
+import argparse
+import heapq
+import json
+import os
+import socket
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from contracts import contract_symbol
+from intermediates import write_frame
+from market_store import default_data_dir, format_minute, minute_of_day, open_store, table_to_date
+from params import DEFAULT_PARAMS
+from positions import SIDE_NAMES, STRATEGY_LEGS
+from replay import (SPOT, Bar, Context, option_bars, positions_frame, spot_bars,
+                    strategy_handlers)
+from trading_calendar import build_calendar, normalize_date
+
+# Feed messages, one JSON object per line:
+#   {"date": "01092023", "time": "09:15:00", "key": "SPOT", "open": ..., "close": ...}
+#   {"date": ..., "time": ..., "key": ["2023-09-07", 44000, "CE"], "open": ..., "close": ...}
+#   {"event": "minute", "date": ..., "time": ...}   every bar of that minute has been sent
+#   {"event": "close", "date": ...}                 end of the session
+#   {"event": "end"}                                end of the feed
+MINUTE, CLOSE, END = 'minute', 'close', 'end'
+
+# Latencies kept for the percentiles of the summary
+LATENCY_SAMPLES = 100_000
+
+
+def default_paper_dir():
+    return os.path.join(os.path.dirname(SCRIPTS_DIR), 'reports', 'paper')
+
+
+def encode_bar(bar):
+    key = bar.key if bar.key == SPOT else list(bar.key)
+    return json.dumps({'date': bar.date, 'time': format_minute(bar.minute), 'key': key,
+                       'open': bar.open, 'high': bar.high, 'low': bar.low, 'close': bar.close})
+
+
+def encode_event(event, date=None, minute=None):
+    message = {'event': event}
+    if date is not None:
+        message['date'] = date
+    if minute is not None:
+        message['time'] = format_minute(minute)
+    return json.dumps(message)
+
+
+def feed_lines(days, store=None, data_dir=None, chain_times=('15:25:00',), window=('09:15:00', '09:45:00')):
+    """
+    Turn stored days into feed lines, as a live feed would publish them.
+
+    Every day sends its spot bars and the whole option chain at
+    chain_times and inside the morning window, since a publisher cannot
+    know which contracts the trader holds. Bars of a minute are followed
+    by a minute event, and each day ends with a close event.
+    """
+    data_dir = data_dir or default_data_dir()
+    lo, hi = minute_of_day(window[0]), minute_of_day(window[1])
+    chain_minutes = tuple(sorted({minute_of_day(t) for t in chain_times} | set(range(lo, hi + 1))))
+    for date in days:
+        date = normalize_date(date)
+        bars = heapq.merge(
+            spot_bars(date, store, os.path.join(data_dir, 'SPOT.db')),
+            option_bars(date, None, chain_minutes, store, os.path.join(data_dir, 'OPT.db')),
+            key=lambda bar: bar.minute
+        )
+        minute = None
+        for bar in bars:
+            if minute is not None and bar.minute != minute:
+                yield encode_event(MINUTE, date, minute)
+            minute = bar.minute
+            yield encode_bar(bar)
+        if minute is not None:
+            yield encode_event(MINUTE, date, minute)
+        yield encode_event(CLOSE, date)
+    yield encode_event(END)
+
+
+def write_feed(lines, path, delay=0.0):
+    """Append feed lines to a file, flushing after every minute; delay is seconds per minute."""
+    with open(path, 'a') as f:
+        for line in lines:
+            f.write(line + '\n')
+            if '"event"' in line:
+                f.flush()
+                if delay and f'"{MINUTE}"' in line:
+                    time.sleep(delay)
+
+
+def serve_feed(lines, host='127.0.0.1', port=9009, delay=0.0):
+    """Send feed lines to the first client that connects to host:port."""
+    with socket.create_server((host, port)) as server:
+        print(f"Feed waiting for a trader on {host}:{port}")
+        conn, _ = server.accept()
+        with conn:
+            for line in lines:
+                conn.sendall((line + '\n').encode())
+                if delay and f'"{MINUTE}"' in line:
+                    time.sleep(delay)
+
+
+def tail_file(path, poll=0.05):
+    """Yield the lines of a feed file, waiting for new ones until the end event."""
+    while not os.path.exists(path):
+        time.sleep(poll)
+    with open(path) as f:
+        pending = ''
+        while True:
+            chunk = f.readline()
+            if not chunk:
+                time.sleep(poll)
+                continue
+            pending += chunk
+            if not pending.endswith('\n'):
+                continue
+            line, pending = pending.rstrip('\n'), ''
+            yield line
+            if line.startswith('{"event": "end"'):
+                return
+
+
+def socket_lines(host='127.0.0.1', port=9009):
+    """Yield the lines sent by a feed server until it closes the connection."""
+    with socket.create_connection((host, port)) as conn, conn.makefile('r') as f:
+        for line in f:
+            yield line.rstrip('\n')
+
+
+class LatencyStats:
+    """Per-message decision latency: count, mean, max and recent percentiles."""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.recent = deque(maxlen=samples)
+
+    def record(self, ns):
+        self.count += 1
+        self.total += ns
+        self.max = max(self.max, ns)
+        self.recent.append(ns)
+
+    def summary(self):
+        """Latencies in microseconds."""
+        if not self.count:
+            return {}
+        recent = np.fromiter(self.recent, dtype=np.int64)
+        return {
+            'messages': self.count,
+            'mean_us': self.total / self.count / 1e3,
+            'p50_us': np.percentile(recent, 50) / 1e3,
+            'p99_us': np.percentile(recent, 99) / 1e3,
+            'max_us': self.max / 1e3
+        }
+
+
+class PaperTrader:
+    """
+    Runs the backtest rules on a live stream of minute bars.
+
+    The handlers are the replay engine's SpotMoveEntry, TrailingStop and
+    TimeExit, so the entry uses the 03 strike rules and the legs trail
+    exactly as in a backtest. Every message is handled as it arrives: the
+    day's state is the open N-minute bar and the last `window` extremes of
+    each held leg, and nothing is read back from history. Option bars of
+    contracts that are not held are dropped with one dict lookup, except at
+    the entry minute where the whole chain is needed.
+
+    Entries and exits are returned as decisions as soon as the minute that
+    triggers them is complete.
+    """
+
+    def __init__(self, params=None, calendar=None, legs=STRATEGY_LEGS, with_move=False, data_dir=None,
+                 store=None):
+        """
+        Args:
+            params (StrategyParams): Strategy parameters, DEFAULT_PARAMS by default
+            calendar (TradingCalendar): Trading days, for the next session and
+                expiry tags; built from the data when not given. Legs entered
+                on its last day are trailed on the next session the feed sends
+            legs (tuple): (leg name, side) pairs
+            with_move (bool): Trade with the spot move instead of against it
+        """
+        self.params = params or DEFAULT_PARAMS
+        self.calendar = calendar or build_calendar(data_dir, store if store is not None else open_store(data_dir))
+        self.ctx = Context()
+        self.handlers = strategy_handlers(self.params, self.calendar, legs=legs, with_move=with_move)
+        self.chain_minute = minute_of_day(self.params.entry_time)
+        self.latency = LatencyStats()
+        self.decisions = []
+        self._contracts = {}
+        self._seen = 0
+        self._exiting = []
+
+    def _start_day(self, date):
+        ctx = self.ctx
+        ctx.date = date
+
+        # Legs entered on the last known day trail on the next session that arrives
+        for position in ctx.positions:
+            if position.is_open and position.exit_date is None and position.trade != date:
+                position.exit_date = date
+                ctx.subscriptions.add(date, position.contract, self.params.trail_start, self.params.exit_time)
+        self._contracts = ctx.subscriptions.take(date)
+        for handler in self.handlers:
+            handler.on_day_start(ctx)
+        self._exiting = ctx.trading()
+
+    def _end_day(self):
+        """Close the session; returns the decisions of the legs closed at the end."""
+        date = self.ctx.date
+        for handler in self.handlers:
+            handler.on_day_end(self.ctx)
+        decisions = self._record(date, None)
+        self.ctx.date = None
+        return decisions
+
+    def _wanted(self, bar):
+        if bar.key == SPOT or bar.minute == self.chain_minute:
+            return True
+        window = self._contracts.get(bar.key)
+        return window is not None and window[0] <= bar.minute <= window[1]
+
+    def _record(self, date, minute):
+        """Decisions for the positions opened or closed by the last message."""
+        new = []
+        for position in self.ctx.positions[self._seen:]:
+            new.append(self._decision('ENTRY', position, date, minute, position.entry_price))
+        self._seen = len(self.ctx.positions)
+        for position in self._exiting:
+            if not position.is_open:
+                new.append(self._decision('EXIT', position, date, position.exit_minute,
+                                          position.exit_price, position.exit_reason))
+        self._exiting = [p for p in self._exiting if p.is_open]
+        self.decisions.extend(new)
+        return new
+
+    def _decision(self, action, position, date, minute, price, reason=None):
+        expiry, strike, option_type = position.contract
+        return {
+            'action': action, 'date': date, 'time': format_minute(minute) if minute is not None else None,
+            'trade': position.trade, 'leg': position.leg, 'side': SIDE_NAMES[position.side],
+            'symbol': contract_symbol(self.params.underlying, expiry, strike, option_type),
+            'expiry': expiry, 'strike': strike, 'option_type': option_type,
+            'price': price, 'reason': reason
+        }
+
+    def on_message(self, message):
+        """
+        Handle one decoded feed message.
+
+        Returns:
+            list: Decisions (ENTRY/EXIT dicts) the message triggered
+        """
+        event = message.get('event')
+        decisions = []
+        if event == END:
+            return self._end_day() if self.ctx.date is not None else []
+
+        # A feed without close events starts the next day with its first bar
+        date = normalize_date(message['date'])
+        if date != self.ctx.date:
+            if self.ctx.date is not None:
+                decisions = self._end_day()
+            self._start_day(date)
+
+        if event is None:
+            key = message['key']
+            bar = Bar(date, minute_of_day(message['time']), key if key == SPOT else (key[0], int(key[1]), key[2]),
+                      message['open'], message['high'], message['low'], message['close'])
+            if not self._wanted(bar):
+                return decisions
+            for handler in self.handlers:
+                handler.on_bar(bar, self.ctx)
+            return decisions + self._record(date, bar.minute)
+
+        if event == MINUTE:
+            minute = minute_of_day(message['time'])
+            for handler in self.handlers:
+                handler.on_minute_end(minute, self.ctx)
+            return decisions + self._record(date, minute)
+
+        if event == CLOSE:
+            return decisions + self._end_day()
+        return decisions
+
+    def run(self, lines, log_file=None, verbose=True):
+        """
+        Trade a feed until its end event.
+
+        Args:
+            lines (iterable): Feed lines, e.g. tail_file() or socket_lines()
+            log_file (str): Append every decision to this JSON-lines file
+
+        Returns:
+            pd.DataFrame: The legs in the layout of process_trailing_exits
+        """
+        log = open(log_file, 'a') if log_file else None
+        try:
+            for line in lines:
+                if not line:
+                    continue
+                start = time.perf_counter_ns()
+                decisions = self.on_message(json.loads(line))
+                self.latency.record(time.perf_counter_ns() - start)
+                for decision in decisions:
+                    if log is not None:
+                        log.write(json.dumps(decision, default=float) + '\n')
+                        log.flush()
+                    if verbose:
+                        print(f"{decision['date']} {decision['time']} {decision['action']:<5} "
+                              f"{decision['side']} {decision['leg']} {decision['symbol']} "
+                              f"@ {decision['price']:.2f}"
+                              + (f" ({decision['reason']})" if decision['reason'] else ""))
+        finally:
+            if log is not None:
+                log.close()
+        return positions_frame(self.ctx.positions)
+
+
+def _address(value):
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Paper-trade the strategy on a streaming minute-bar feed.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    simulate = sub.add_parser('simulate', help="publish stored days as a live feed")
+    simulate.add_argument('--file', help="append the feed to this file")
+    simulate.add_argument('--socket', help="serve the feed on HOST:PORT")
+    simulate.add_argument('--start', help="first day (ddmmyyyy)")
+    simulate.add_argument('--end', help="last day (ddmmyyyy)")
+    simulate.add_argument('--delay', type=float, default=0.0, help="seconds per minute (default: 0)")
+
+    trade = sub.add_parser('run', help="paper-trade a feed")
+    trade.add_argument('--file', help="tail this feed file")
+    trade.add_argument('--socket', help="read the feed from HOST:PORT")
+
+    args = parser.parse_args()
+    if bool(args.file) == bool(args.socket):
+        parser.error("give exactly one of --file and --socket")
+
+    if args.command == 'simulate':
+        store = open_store()
+        calendar = build_calendar(store=store)
+        days = [d for d in calendar
+                if (args.start is None or table_to_date(d) >= table_to_date(args.start))
+                and (args.end is None or table_to_date(d) <= table_to_date(args.end))]
+        lines = feed_lines(days, store, chain_times=(DEFAULT_PARAMS.entry_time,),
+                           window=(DEFAULT_PARAMS.trail_start, DEFAULT_PARAMS.exit_time))
+        if args.file:
+            write_feed(lines, args.file, args.delay)
+        else:
+            serve_feed(lines, *_address(args.socket), delay=args.delay)
+        sys.exit(0)
+
+    paper_dir = default_paper_dir()
+    os.makedirs(paper_dir, exist_ok=True)
+    trader = PaperTrader()
+    feed = tail_file(args.file) if args.file else socket_lines(*_address(args.socket))
+    legs = trader.run(feed, log_file=os.path.join(paper_dir, 'decisions.jsonl'))
+    write_frame(legs, 'legs', paper_dir)
+
+    print("\nPaper Trading:")
+    print("==============")
+    print(f"Trades: {legs.index.nunique()} ({len(legs)} legs), decisions in {paper_dir}")
+    for name, value in trader.latency.summary().items():
+        print(f"{name}: {value:.1f}" if isinstance(value, float) else f"{name}: {value}")
@@ -0,0 +1,52 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass, fields, replace
+
+
+@dataclass(frozen=True)
+class StrategyParams:
+    """Every tunable knob of the strategy, with the values from instructions.txt."""
+
+    # Spot movement is measured from open_time to entry_time
+    open_time: str = '09:15:00'
+    entry_time: str = '15:25:00'
+
+    # Strike selection
+    strike_interval: int = 100
+    hedge_rule: str = 'percent'
+    hedge_pct: float = 2.0
+    hedge_steps: int = 1
+    snap_strikes: bool = True
+
+    # Contracts: trades entered on expiry day roll to the next weekly expiry
+    # unless expiry_rollover is 'none'; underlying names the trade symbols
+    underlying: str = 'BANKNIFTY'
+    expiry_rollover: str = 'expiry_day'
+
+    # Next-morning trailing exit
+    trail_start: str = '09:15:00'
+    trail_window: int = 3
+    exit_time: str = '09:45:00'
+    # Bars the stop trails on, in minutes; N > 1 uses the cached N-minute bars
+    trail_bar_minutes: int = 1
+
+    # Cost model
+    slippage_pct: float = 0.5
+
+    def to_dict(self):
+        return asdict(self)
+
+    def fingerprint(self):
+        """Short stable hash of the parameter values."""
+        payload = json.dumps(self.to_dict(), sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def replace(self, **changes):
+        return replace(self, **changes)
+
+    @classmethod
+    def names(cls):
+        return [f.name for f in fields(cls)]
+
+
+DEFAULT_PARAMS = StrategyParams()
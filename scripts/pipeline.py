@@ -0,0 +1,289 @@
+import argparse
+import contextlib
+import importlib
+import os
+import sys
+import time
+
+# The stage scripts start with a digit, so they can only be imported by name
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+import incremental
+import intermediates
+import instrumentation
+from bar_cache import open_bar_cache
+from db_profile import entry_days
+from executor import BACKENDS, DayExecutor
+from market_store import open_store
+from option_chain import OptionChainLoader, StrikeIndex
+from params import DEFAULT_PARAMS
+from replay import run_replay
+from trading_calendar import build_calendar
+
+
+def load_stage(module_name, function_name):
+    """Import a function from one of the numbered stage scripts."""
+    module = importlib.import_module(module_name)
+    return getattr(module, function_name)
+
+
+def run_stage(name, func, timings, *args, **kwargs):
+    """
+    Run one pipeline stage and record how long it took.
+    
+    When a run log is active the stage is also measured there (CPU time,
+    rows, queries, bytes read and peak RSS).
+
+    Args:
+        name (str): Stage name used in the timing summary
+        func (callable): Stage function to call
+        timings (list): List that (name, seconds) is appended to
+
+    Returns:
+        The stage function's return value
+    """
+    print(f"\nRunning {name}...")
+    log = instrumentation.active_run()
+    start = time.perf_counter()
+    with log.stage(name) if log is not None else contextlib.nullcontext():
+        result = func(*args, **kwargs)
+    timings.append((name, time.perf_counter() - start))
+    return result
+
+
+def run_pipeline(save_intermediate=False, check_db=False, store=None, params=None,
+                 incremental_run=False, profile=None, run_log=True, engine='vectorized',
+                 export_csv=False, workers=None, backend='thread'):
+    """
+    Run every analysis stage in a single process.
+
+    Each stage hands its DataFrame straight to the next one instead of
+    writing it to reports/ and having the next script read it back.
+    The run is measured per stage and per day and the run log is written
+    to reports/runs as JSON and CSV.
+
+    Args:
+        save_intermediate (bool): Also store each stage's output in reports/
+            as typed .npy columns (see intermediates.py)
+        check_db (bool): Run the database structure check first
+        store (MarketStore): Columnar store shared by the stages; opened
+            from data/store when built, otherwise the stages query SQLite
+        params (StrategyParams): Strategy knobs, DEFAULT_PARAMS by default
+        incremental_run (bool): Only run the days not processed by earlier
+            incremental runs and merge them into the results stored in
+            reports/incremental
+        profile (str): 'cprofile' or 'pyinstrument' to also profile the run
+            into reports/runs
+        run_log (bool): Record and save the run log
+        engine (str): 'vectorized' runs stages 02-05 over whole columns;
+            'replay' streams the minute bars through the rule handlers of
+            replay.py instead
+        export_csv (bool): Also export the stored stage outputs as CSV
+        workers (int): Workers the option-price and trailing-exit stages
+            spread their days over, os.cpu_count() by default
+        backend (str): 'thread' or 'process' pool for those days
+
+    Returns:
+        list: (stage name, seconds) for every stage that ran, or None if a
+        stage produced no output
+    """
+    params = params or DEFAULT_PARAMS
+    # The worker threads and their connections last for this run only
+    executor = DayExecutor(workers, backend)
+    if not run_log and not profile:
+        with executor:
+            return _run_stages(save_intermediate, check_db, store, params, incremental_run, engine,
+                               export_csv, executor)
+
+    log = instrumentation.start_run(meta={'params': params.to_dict(), 'incremental': incremental_run,
+                                          'engine': engine, 'workers': executor.workers,
+                                          'backend': backend})
+    runs_dir = instrumentation.default_runs_dir()
+    os.makedirs(runs_dir, exist_ok=True)
+    profiler = contextlib.nullcontext()
+    if profile:
+        profiler = instrumentation.profiled(profile, os.path.join(runs_dir, f'run_{log.run_id}'))
+    try:
+        with profiler, executor:
+            return _run_stages(save_intermediate, check_db, store, params, incremental_run, engine,
+                               export_csv, executor)
+    finally:
+        instrumentation.end_run()
+        if run_log and log.records:
+            log.print_summary()
+            json_file, _ = log.save(runs_dir)
+            print(f"\nRun log saved to {json_file}")
+
+
+def _run_stages(save_intermediate, check_db, store, params, incremental_run, engine, export_csv=False,
+                executor=None):
+    calculate_pnl = load_stage('06_calculate_pnl', 'calculate_pnl')
+    generate_excel_report = load_stage('07_generate_excel', 'generate_excel_report')
+
+    if store is None:
+        store = open_store()
+
+    # One calendar for the whole run, shared by every stage that needs dates
+    calendar = build_calendar(store=store)
+    chain_loader = OptionChainLoader(store=store, bar_cache=open_bar_cache())
+
+    # Days to run: every day, or only those an earlier incremental run has not finished
+    dates, processed = None, set()
+    state_dir = incremental.default_state_dir()
+    if incremental_run:
+        state = incremental.load_state(state_dir)
+        dates, processed = incremental.dates_to_process(state, calendar, params)
+
+    # Skip days the saved database profile says cannot be entered or exited
+    _, skipped = entry_days(calendar)
+    if skipped:
+        candidates = dates if dates is not None else list(calendar)
+        dates = [d for d in candidates if d not in skipped]
+        print(f"Skipping {len(candidates) - len(dates)} days the database profile marks as untradable")
+
+    if incremental_run and not dates:
+        print("No new trading days to process")
+        return []
+
+    timings = []
+
+    if check_db:
+        check_database_structure = load_stage('01_check_db', 'check_database_structure')
+        run_stage('check_db', check_database_structure, timings)
+
+    if engine == 'replay':
+        result = run_stage('replay', run_replay, timings, params, store=store, calendar=calendar,
+                           dates=dates, save=save_intermediate)
+    else:
+        result = _run_vectorized(timings, save_intermediate, store, params, calendar, chain_loader, dates,
+                                 executor)
+    if result is None:
+        return None
+    spot_movement, trailing_exits = result
+
+    # An incremental run of only the newest day has no exits yet
+    pnl_analysis, legs, stats = None, None, None
+    if not (incremental_run and trailing_exits.empty):
+        pnl_result = run_stage('pnl', calculate_pnl, timings,
+                               trailing_exits, save=save_intermediate,
+                               slippage_pct=params.slippage_pct)
+        if pnl_result is None:
+            return None
+        pnl_analysis, stats, _, legs = pnl_result
+
+    if incremental_run:
+        logs = run_stage('merge', incremental.update, timings,
+                         state_dir, params, calendar, dates, processed,
+                         spot_movement, legs, pnl_analysis)
+        spot_movement, legs, pnl_analysis = logs['spot_movement'], logs['legs'], logs['pnl']
+        stats = None
+        if pnl_analysis is None:
+            print("No completed trades yet")
+            chain_loader.close()
+            print_timings(timings)
+            return timings
+
+    run_stage('excel_report', generate_excel_report, timings,
+              pnl_analysis=pnl_analysis,
+              trades=legs,
+              params=params,
+              spot_movement=spot_movement,
+              stats=stats)
+
+    if save_intermediate and export_csv:
+        for name in intermediates.NAMES:
+            intermediates.export_csv(name)
+
+    chain_loader.close()
+    print_timings(timings)
+    return timings
+
+
+def _run_vectorized(timings, save_intermediate, store, params, calendar, chain_loader, dates,
+                    executor=None):
+    """Stages 02-05 over whole columns; returns (spot_movement, trailing_exits) or None."""
+    get_spot_movement = load_stage('02_get_spot_movement', 'get_spot_movement')
+    process_strike_selection = load_stage('03_select_strike', 'process_strike_selection')
+    fetch_option_prices = load_stage('04_fetch_option_prices', 'fetch_option_prices')
+    process_trailing_exits = load_stage('05_trailing_exit', 'process_trailing_exits')
+
+    strike_index = None
+    if params.snap_strikes:
+        strike_index = StrikeIndex(store=store, time=params.entry_time, dates=dates,
+                                   expiry_rollover=params.expiry_rollover)
+
+    spot_movement = run_stage('spot_movement', get_spot_movement, timings,
+                              save=save_intermediate, store=store, calendar=calendar,
+                              open_time=params.open_time, close_time=params.entry_time,
+                              dates=dates)
+    if spot_movement is None:
+        return None
+
+    strike_selection = run_stage('strike_selection', process_strike_selection, timings,
+                                 spot_movement, save=save_intermediate,
+                                 strike_interval=params.strike_interval,
+                                 hedge_rule=params.hedge_rule, hedge_pct=params.hedge_pct,
+                                 hedge_steps=params.hedge_steps, snap_strikes=params.snap_strikes,
+                                 strike_index=strike_index)
+    if strike_selection is None:
+        return None
+
+    option_prices = run_stage('option_prices', fetch_option_prices, timings,
+                              strike_selection, save=save_intermediate, store=store,
+                              chain_loader=chain_loader, entry_time=params.entry_time,
+                              executor=executor, expiry_rollover=params.expiry_rollover)
+    if option_prices is None:
+        return None
+
+    trailing_exits = run_stage('trailing_exits', process_trailing_exits, timings,
+                               option_prices, save=save_intermediate, store=store,
+                               calendar=calendar, chain_loader=chain_loader,
+                               window=params.trail_window,
+                               entry_time=params.trail_start, exit_time=params.exit_time,
+                               bar_minutes=params.trail_bar_minutes, executor=executor)
+    if trailing_exits is None:
+        return None
+    return spot_movement, trailing_exits
+
+
+def print_timings(timings):
+    """Print the per-stage timing summary."""
+    total = sum(seconds for _, seconds in timings)
+    print("\nStage Timings:")
+    print("==============")
+    for name, seconds in timings:
+        print(f"{name:<20} {seconds:8.3f}s")
+    print(f"{'total':<20} {total:8.3f}s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the TradeSage analysis pipeline.")
+    parser.add_argument('--save-intermediate', action='store_true',
+                        help="store each stage's output in reports/")
+    parser.add_argument('--export-csv', action='store_true',
+                        help="with --save-intermediate, also export the stage outputs as CSV")
+    parser.add_argument('--check-db', action='store_true',
+                        help="run the database structure check first")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only process days added since the last incremental run")
+    parser.add_argument('--profile', choices=('cprofile', 'pyinstrument'),
+                        help="profile the run and save the profile to reports/runs")
+    parser.add_argument('--engine', choices=('vectorized', 'replay'), default='vectorized',
+                        help="run the strategy over whole columns or by replaying minute bars "
+                             "through the rule handlers (default: vectorized)")
+    parser.add_argument('--workers', type=int,
+                        help="workers for the per-day option-price and exit stages (default: all cores)")
+    parser.add_argument('--backend', choices=BACKENDS, default='thread',
+                        help="run those days on threads or processes (default: thread)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if run_pipeline(save_intermediate=args.save_intermediate, check_db=args.check_db,
+                    incremental_run=args.incremental, profile=args.profile,
+                    engine=args.engine, export_csv=args.export_csv, workers=args.workers,
+                    backend=args.backend) is None:
+        sys.exit(1)
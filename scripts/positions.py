@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+from market_store import format_minute, minute_of_day
+from trailing import trailing_exits, trailing_exits_parallel
+
+SELL = -1
+BUY = 1
+SIDE_NAMES = {SELL: 'SELL', BUY: 'BUY'}
+
+# Legs of the strategy in instructions.txt: sell the ATM option and buy the
+# hedge further out of the money. Each entry is (leg name, side); the trade
+# table holds <name>_strike and <name>_price columns for every leg, and
+# <name>_type when a leg's option type differs from the trade's option_type
+STRATEGY_LEGS = (('atm', SELL), ('hedge', BUY))
+
+
+class LegBook:
+    """
+    Every leg of every trade held as parallel NumPy arrays.
+
+    A leg is one option contract bought or sold as part of a trade. The book
+    has one slot per leg, so strangles, iron flies and the like are just
+    more rows. Entries, trailing exits, fills and PnL are computed for all
+    legs with array operations instead of a Python loop per leg.
+    """
+
+    __slots__ = ('trade', 'leg', 'strike', 'option_type', 'side', 'quantity', 'expiry',
+                 'entry_price', 'entry_fill', 'exit_index', 'exit_minute', 'exit_price',
+                 'exit_fill', 'exit_reason')
+
+    def __init__(self, trade, leg, strike, option_type, side, quantity=None, expiry=None):
+        """
+        Args:
+            trade (array-like): Trade label of each leg (the trade date)
+            leg (array-like): Leg name within its trade, e.g. 'atm'
+            strike (array-like): Strike of each leg
+            option_type (array-like): 'CE' or 'PE' per leg
+            side (array-like): SELL (-1) or BUY (+1) per leg
+            quantity (array-like): Units per leg, 1 by default
+            expiry (array-like): Contract expiry per leg
+        """
+        n = len(trade)
+        self.trade = np.asarray(trade, dtype=object)
+        self.leg = np.asarray(leg, dtype=object)
+        self.strike = np.asarray(strike, dtype=np.int64)
+        self.option_type = np.asarray(option_type, dtype=object)
+        self.side = np.asarray(side, dtype=np.int8)
+        self.quantity = np.ones(n) if quantity is None else np.asarray(quantity, dtype=float)
+        self.expiry = np.full(n, None, dtype=object) if expiry is None else np.asarray(expiry, dtype=object)
+
+        self.entry_price = np.full(n, np.nan)
+        self.entry_fill = np.full(n, np.nan)
+        self.exit_index = np.full(n, -1)
+        self.exit_minute = np.full(n, -1)
+        self.exit_price = np.full(n, np.nan)
+        self.exit_fill = np.full(n, np.nan)
+        self.exit_reason = np.full(n, None, dtype=object)
+
+    def __len__(self):
+        return len(self.trade)
+
+    @classmethod
+    def from_trades(cls, trades, legs=STRATEGY_LEGS):
+        """
+        Build the book from a table with one row per trade.
+
+        Args:
+            trades (pd.DataFrame): Output of fetch_option_prices, indexed by
+                date
+            legs (tuple): (leg name, side) pairs, see STRATEGY_LEGS
+
+        Returns:
+            LegBook: Legs ordered by trade, then by position in `legs`, with
+            entry prices filled in
+        """
+        n = len(trades)
+        names = [name for name, _ in legs]
+
+        def stacked(column, default=None):
+            # One column per leg, interleaved so each trade's legs are adjacent
+            values = [trades[f'{name}_{column}'].to_numpy() if f'{name}_{column}' in trades
+                      else default for name in names]
+            return np.column_stack(values).ravel()
+
+        book = cls(
+            trade=np.repeat(trades.index.to_numpy(), len(legs)),
+            leg=np.tile(names, n),
+            strike=stacked('strike'),
+            option_type=stacked('type', trades['option_type'].to_numpy()),
+            side=np.tile([side for _, side in legs], n),
+            expiry=np.repeat(trades['expiry'].to_numpy(), len(legs)) if 'expiry' in trades else None
+        )
+        book.entry_price = stacked('price').astype(float)
+        return book
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Rebuild a book from the table written by to_frame."""
+        book = cls(
+            trade=frame.index.to_numpy(),
+            leg=frame['leg'].to_numpy(),
+            strike=frame['strike'].to_numpy(),
+            option_type=frame['option_type'].to_numpy(),
+            side=frame['side'].map({name: side for side, name in SIDE_NAMES.items()}).to_numpy(),
+            quantity=frame['quantity'].to_numpy(),
+            expiry=frame['expiry'].to_numpy() if 'expiry' in frame else None
+        )
+        book.entry_price = frame['entry_price'].to_numpy(dtype=float)
+        book.exit_price = frame['exit_price'].to_numpy(dtype=float)
+        book.exit_reason = frame['exit_reason'].to_numpy(dtype=object)
+        if 'exit_time' in frame:
+            book.exit_minute = np.array([minute_of_day(t) if isinstance(t, str) else -1
+                                         for t in frame['exit_time']], dtype=int)
+        return book
+
+    def trail(self, high, low, close, minutes, window=3, workers=None):
+        """
+        Step every leg through its own minute bars in one pass.
+
+        Sold legs trail above the highest high of the last `window` bars and
+        bought legs below the lowest low, each on its own option chart.
+        Legs that are never stopped out exit at their last bar.
+
+        Args:
+            high, low, close (np.ndarray): Option bars, shape (legs, bars),
+                row i holding the bars of leg i (see trailing.bar_matrix)
+            minutes (np.ndarray): Minute of day of each bar, same shape
+            window (int): Number of bars in the trailing window
+            workers (int): Shard the legs across this many processes when > 1
+        """
+        if workers and workers > 1:
+            exit_index, exit_price, exit_reason = trailing_exits_parallel(
+                high, low, close, self.side, window, workers)
+        else:
+            exit_index, exit_price, exit_reason = trailing_exits(high, low, close, self.side, window)
+        found = exit_index >= 0
+        self.exit_index = exit_index
+        self.exit_price = exit_price
+        self.exit_reason = exit_reason
+        self.exit_minute = np.full(len(self), -1)
+        self.exit_minute[found] = minutes[np.flatnonzero(found), exit_index[found]].astype(int)
+
+    def fill(self, slippage_pct=0.0):
+        """
+        Apply slippage to the entry and exit prices of every leg.
+
+        Buying fills slippage_pct percent above the price and selling the
+        same amount below it, on entry and again on exit.
+        """
+        slippage = slippage_pct / 100
+        self.entry_fill = self.entry_price * (1 + self.side * slippage)
+        self.exit_fill = self.exit_price * (1 - self.side * slippage)
+
+    def pnl(self):
+        """PnL of every leg after slippage, in option points times quantity."""
+        return self.side * (self.exit_fill - self.entry_fill) * self.quantity
+
+    def slippage_cost(self):
+        """Points lost to slippage on each leg."""
+        return ((self.entry_fill - self.entry_price) * self.side
+                - (self.exit_fill - self.exit_price) * self.side) * self.quantity
+
+    def complete(self):
+        """Mask of the legs whose trade has an entry and exit price on every leg."""
+        ok = ~np.isnan(self.entry_price) & ~np.isnan(self.exit_price)
+        return pd.Series(ok).groupby(self.trade, sort=False).transform('all').to_numpy()
+
+    def to_frame(self):
+        """Return the book as a DataFrame with one row per leg, indexed by trade."""
+        return pd.DataFrame({
+            'leg': self.leg,
+            'side': [SIDE_NAMES[s] for s in self.side],
+            'strike': self.strike,
+            'option_type': self.option_type,
+            'expiry': self.expiry,
+            'quantity': self.quantity,
+            'entry_price': self.entry_price,
+            'entry_fill': self.entry_fill,
+            'exit_price': self.exit_price,
+            'exit_fill': self.exit_fill,
+            'exit_time': [format_minute(m) if m >= 0 else None for m in self.exit_minute],
+            'exit_reason': self.exit_reason
+        }, index=pd.Index(self.trade, name='date'))
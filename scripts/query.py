@@ -0,0 +1,273 @@
+import os
+import sqlite3
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from db import connection, count_fetched, day_table
+from market_store import (COLUMN_DTYPES, INSTRUMENT_TYPES, OPTION_COLUMNS, SPOT_COLUMNS,
+                          default_data_dir, list_day_tables, minute_of_day, parse_expiries,
+                          table_to_date)
+from trading_calendar import normalize_date
+
+# Rows per chunk yielded by Query.chunks()
+CHUNK_ROWS = 100_000
+
+DATABASES = {'spot': 'SPOT.db', 'opt': 'OPT.db'}
+
+
+@dataclass(frozen=True)
+class Query:
+    """
+    A lazy, immutable read of spot or option minute bars.
+
+    Each filter method returns a new Query; nothing is read until chunks(),
+    days(), arrays() or frame() is called. Filters are pushed down to the
+    storage: on the columnar store only the filter columns of a day are
+    scanned and the other columns are gathered for the matching rows only;
+    on SQLite they become the WHERE clause and rows are fetched in batches.
+    Either way the results use the store's typed columns: 'date' and
+    'expiry' as datetime64[D], integer 'minute' of day and 'strike', and
+    'instrument_type' as a code into INSTRUMENT_TYPES.
+    """
+
+    kind: str = 'opt'
+    data_dir: str = None
+    store: object = None
+    first_date: str = None
+    last_date: str = None
+    on_dates: tuple = None
+    start_time: str = None
+    end_time: str = None
+    low_strike: int = None
+    high_strike: int = None
+    strike_values: tuple = None
+    option_types: tuple = None
+    expiry_value: str = None
+    columns: tuple = None
+
+    # Filters
+
+    def dates(self, start=None, end=None):
+        """Keep the days from start to end (ddmmyyyy), both included."""
+        return replace(self, first_date=start, last_date=end)
+
+    def on(self, dates):
+        """Keep only the given days."""
+        return replace(self, on_dates=tuple(normalize_date(d) for d in dates))
+
+    def between(self, start=None, end=None):
+        """Keep the bars from start to end time of day ('HH:MM:SS'), both included."""
+        return replace(self, start_time=start, end_time=end)
+
+    def strikes(self, low=None, high=None, values=None):
+        """Keep strikes in [low, high], or only the listed values."""
+        values = None if values is None else tuple(sorted({int(v) for v in values}))
+        return replace(self, low_strike=low, high_strike=high, strike_values=values)
+
+    def types(self, *option_types):
+        """Keep the given option types, e.g. 'CE'."""
+        return replace(self, option_types=tuple(option_types))
+
+    def expiry(self, expiry):
+        """Keep one expiry ('YYYY-MM-DD' or datetime64)."""
+        return replace(self, expiry_value=None if expiry is None else str(np.datetime64(expiry, 'D')))
+
+    def select(self, *columns):
+        """Return only these columns."""
+        return replace(self, columns=tuple(columns))
+
+    # Execution
+
+    def _all_columns(self):
+        return SPOT_COLUMNS if self.kind == 'spot' else OPTION_COLUMNS
+
+    def _output_columns(self):
+        return self.columns or self._all_columns()
+
+    def _db_path(self):
+        return os.path.join(self.data_dir or default_data_dir(), DATABASES[self.kind])
+
+    def day_list(self):
+        """Days the query covers, in chronological order."""
+        if self.store is not None:
+            days = self.store.dates(self.kind)
+        else:
+            days = list_day_tables(connection(self._db_path()))
+        if self.on_dates is not None:
+            wanted = set(self.on_dates)
+            days = [d for d in days if d in wanted]
+        if self.first_date is not None:
+            days = [d for d in days if table_to_date(d) >= table_to_date(self.first_date)]
+        if self.last_date is not None:
+            days = [d for d in days if table_to_date(d) <= table_to_date(self.last_date)]
+        return days
+
+    def _store_mask(self, day):
+        """Rows of one store day that pass every filter."""
+        mask = np.ones(len(day['minute']), dtype=bool)
+        if self.start_time is not None:
+            mask &= day['minute'] >= minute_of_day(self.start_time)
+        if self.end_time is not None:
+            mask &= day['minute'] <= minute_of_day(self.end_time)
+        if self.kind == 'opt':
+            if self.low_strike is not None:
+                mask &= day['strike'] >= self.low_strike
+            if self.high_strike is not None:
+                mask &= day['strike'] <= self.high_strike
+            if self.strike_values is not None:
+                mask &= np.isin(day['strike'], self.strike_values)
+            if self.option_types is not None:
+                mask &= np.isin(day['instrument_type'], [INSTRUMENT_TYPES.index(t) for t in self.option_types])
+            if self.expiry_value is not None:
+                mask &= day['expiry'] == np.datetime64(self.expiry_value, 'D')
+        return np.flatnonzero(mask)
+
+    def _filter_columns(self):
+        names = ['minute']
+        if self.kind == 'opt':
+            if self.low_strike is not None or self.high_strike is not None or self.strike_values is not None:
+                names.append('strike')
+            if self.option_types is not None:
+                names.append('instrument_type')
+            if self.expiry_value is not None:
+                names.append('expiry')
+        return names
+
+    def _store_chunks(self, date, rows):
+        day = self.store.day(self.kind, date, self._filter_columns())
+        if day is None:
+            return
+        partition, start, stop = self.store.manifest[self.kind][date]
+
+        # Only the filter columns are scanned; the rest are gathered for the kept rows
+        keep = self._store_mask(day)
+        for first in range(0, len(keep), rows):
+            index = keep[first:first + rows]
+            yield {name: np.asarray(self.store.column(self.kind, partition, name)[start:stop][index])
+                   for name in self._output_columns()}
+
+    def _where(self):
+        # Expiries are stored in several text formats, so they are filtered after parsing
+        where, params = [], []
+        if self.start_time is not None:
+            where.append('time >= ?')
+            params.append(self.start_time)
+        if self.end_time is not None:
+            where.append('time <= ?')
+            params.append(self.end_time)
+        if self.kind == 'opt':
+            if self.low_strike is not None:
+                where.append('strike >= ?')
+                params.append(self.low_strike)
+            if self.high_strike is not None:
+                where.append('strike <= ?')
+                params.append(self.high_strike)
+            if self.strike_values is not None:
+                where.append(f"strike IN ({', '.join('?' for _ in self.strike_values)})")
+                params.extend(self.strike_values)
+            if self.option_types is not None:
+                where.append(f"instrument_type IN ({', '.join('?' for _ in self.option_types)})")
+                params.extend(self.option_types)
+        return where, params
+
+    def _convert(self, date, rows, names):
+        """Typed columns from a batch of SQLite rows."""
+        frame = pd.DataFrame.from_records(rows, columns=names)
+        codes, times = pd.factorize(frame['time'].astype(str))
+        data = {
+            'date': np.full(len(frame), table_to_date(date)),
+            'minute': np.array([minute_of_day(t) for t in times], dtype=COLUMN_DTYPES['minute'])[codes]
+        }
+        for name in ('open', 'high', 'low', 'close'):
+            data[name] = pd.to_numeric(frame[name], errors='coerce').to_numpy() if name in frame \
+                else np.full(len(frame), np.nan)
+
+        if self.kind == 'opt':
+            if 'expiry' in frame:
+                codes, expiries = pd.factorize(frame['expiry'].astype(str))
+                data['expiry'] = parse_expiries(expiries)[codes] if len(frame) \
+                    else np.array([], dtype='datetime64[D]')
+            else:
+                data['expiry'] = np.full(len(frame), np.datetime64('NaT', 'D'))
+            strikes = pd.to_numeric(frame['strike'], errors='coerce').round()
+            type_codes = {name: code for code, name in enumerate(INSTRUMENT_TYPES)}
+            data['instrument_type'] = frame['instrument_type'].map(type_codes).fillna(-1).to_numpy()
+
+            # Rows without a usable strike cannot be looked up
+            ok = strikes.notna().to_numpy()
+            data['strike'] = strikes.fillna(0).to_numpy()
+            if self.expiry_value is not None:
+                ok = ok & (data['expiry'] == np.datetime64(self.expiry_value, 'D'))
+            data = {name: values[ok] for name, values in data.items()}
+
+        return {name: np.asarray(data[name]).astype(COLUMN_DTYPES[name]) for name in self._output_columns()}
+
+    def _db_chunks(self, date, rows):
+        conn = connection(self._db_path())
+        available = {row[1] for row in conn.execute(f'PRAGMA table_info({day_table(date)})')}
+        if not available:
+            return
+        names = ['time'] + [n for n in ('expiry', 'strike', 'instrument_type', 'open', 'high', 'low', 'close')
+                            if n in available]
+        where, params = self._where()
+        sql = f'SELECT {", ".join(names)} FROM {day_table(date)}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        try:
+            cursor = conn.execute(sql, params)
+        except sqlite3.OperationalError as e:
+            print(f"Error reading {DATABASES[self.kind]} table {date}: {str(e)}")
+            return
+        while True:
+            batch = cursor.fetchmany(rows)
+            if not batch:
+                break
+            count_fetched(batch)
+            yield self._convert(date, batch, names)
+
+    def chunks(self, rows=CHUNK_ROWS):
+        """
+        Yield the matching rows as dicts of column arrays.
+
+        Days are read one after another and no chunk holds more than `rows`
+        rows or spans two days, so memory is bounded by the chunk size
+        whatever the date range.
+        """
+        for date in self.day_list():
+            reader = self._store_chunks if self.store is not None else self._db_chunks
+            yield from reader(date, rows)
+
+    def days(self):
+        """Yield (date, columns) for every day with matching rows."""
+        for date in self.day_list():
+            reader = self._store_chunks if self.store is not None else self._db_chunks
+            parts = list(reader(date, CHUNK_ROWS))
+            if parts:
+                yield date, _concat(parts, self._output_columns())
+
+    def arrays(self):
+        """All matching rows as one dict of column arrays."""
+        return _concat(list(self.chunks()), self._output_columns())
+
+    def frame(self):
+        return pd.DataFrame(self.arrays())
+
+
+def _concat(parts, columns):
+    if not parts:
+        return {name: np.array([], dtype=COLUMN_DTYPES[name]) for name in columns}
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([part[name] for part in parts]) for name in columns}
+
+
+def scan_options(data_dir=None, store=None):
+    """Start a lazy query over OPT.db, or the store's option columns when given."""
+    return Query('opt', data_dir, store)
+
+
+def scan_spot(data_dir=None, store=None):
+    """Start a lazy query over SPOT.db, or the store's spot columns when given."""
+    return Query('spot', data_dir, store)
@@ -0,0 +1,763 @@
+import heapq
+import importlib
+import os
+import sqlite3
+import sys
+from collections import deque, namedtuple
+
+import numpy as np
+import pandas as pd
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from contracts import select_expiry
+from db import connection, count_fetched, day_table
+from intermediates import write_frame
+from market_store import (INSTRUMENT_TYPES, default_data_dir, format_minute, minute_of_day,
+                          parse_expiries)
+from params import DEFAULT_PARAMS
+from positions import STRATEGY_LEGS, LegBook
+from trading_calendar import build_calendar, normalize_date
+from trailing import EXIT_TIME, EXIT_TRAIL
+
+SPOT = 'SPOT'
+SESSION_START = '09:15:00'
+SESSION_MINUTE = minute_of_day(SESSION_START)
+
+# One minute (or resampled N-minute) bar. key is SPOT or an option contract
+# (expiry 'YYYY-MM-DD', strike, 'CE'/'PE')
+Bar = namedtuple('Bar', 'date minute key open high low close')
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+
+# Strike rules of the opposite move, used to trade with the move
+FLIPPED = {'UP': 'DOWN', 'DOWN': 'UP'}
+
+
+def _window(start, end):
+    return (minute_of_day(start) if start is not None else 0,
+            minute_of_day(end) if end is not None else 24 * 60 - 1)
+
+
+def spot_bars(date, store=None, db_path=None, start=None, end=None):
+    """
+    Stream the spot bars of one day in time order.
+
+    The bars come from a slice of the store's memory-mapped columns, or from
+    a time-ordered query on the day table of SPOT.db.
+    """
+    date = normalize_date(date)
+    lo, hi = _window(start, end)
+    if store is not None:
+        day = store.spot_day(date, ('minute',) + PRICE_FIELDS)
+        if day is None:
+            return
+        keep = np.flatnonzero((day['minute'] >= lo) & (day['minute'] <= hi))
+        keep = keep[np.argsort(day['minute'][keep], kind='stable')]
+        rows = zip(*(day[name][keep].tolist() for name in ('minute',) + PRICE_FIELDS))
+    else:
+        try:
+            rows = connection(db_path).execute(
+                f'SELECT time, open, high, low, close FROM {day_table(date)} '
+                f'WHERE time >= ? AND time <= ? ORDER BY time',
+                (format_minute(lo), format_minute(hi))
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return
+        count_fetched(rows)
+        rows = ((minute_of_day(t), o, h, l, c) for t, o, h, l, c in rows)
+
+    # Keep the first bar when a minute is duplicated
+    last = None
+    for minute, o, h, l, c in rows:
+        if minute != last:
+            yield Bar(date, minute, SPOT, o, h, l, c)
+        last = minute
+
+
+class Subscriptions:
+    """
+    Option contracts the handlers want bars for, per day.
+
+    Handlers add a contract for a later day (e.g. the next morning of a
+    position they just opened); sessions() takes a day's subscriptions
+    only when the replay reaches that day. A contract subscribed more than
+    once is read over the union of the windows.
+    """
+
+    def __init__(self):
+        self._days = {}
+
+    def add(self, date, contract, start, end):
+        contracts = self._days.setdefault(normalize_date(date), {})
+        lo, hi = _window(start, end)
+        if contract in contracts:
+            lo, hi = min(lo, contracts[contract][0]), max(hi, contracts[contract][1])
+        contracts[contract] = (lo, hi)
+
+    def take(self, date):
+        return self._days.pop(normalize_date(date), {})
+
+
+def _contract_rows(columns, chain_minutes, contracts):
+    """Rows to stream: the whole chain at chain_minutes plus each contract's window."""
+    minute = columns['minute']
+    keep = np.isin(minute, list(chain_minutes))
+    for (expiry, strike, option_type), (lo, hi) in contracts.items():
+        keep |= ((columns['expiry'] == expiry) & (columns['strike'] == strike)
+                 & (columns['instrument_type'] == option_type) & (minute >= lo) & (minute <= hi))
+    return np.flatnonzero(keep)
+
+
+def _option_day_store(store, date, chain_minutes, contracts):
+    day = store.option_day(date)
+    if day is None:
+        return None
+
+    # Match in the store's own encoding, then convert only the rows kept
+    encoded = {(np.datetime64(expiry, 'D'), strike, INSTRUMENT_TYPES.index(option_type)): window
+               for (expiry, strike, option_type), window in contracts.items()
+               if option_type in INSTRUMENT_TYPES}
+    keep = _contract_rows(day, chain_minutes, encoded)
+    return {
+        'minute': day['minute'][keep],
+        'expiry': day['expiry'][keep].astype(str),
+        'strike': day['strike'][keep],
+        'instrument_type': np.array(INSTRUMENT_TYPES + ('',), dtype=object)[day['instrument_type'][keep]],
+        **{name: day[name][keep] for name in PRICE_FIELDS}
+    }
+
+
+def _option_day_db(db_path, date, chain_minutes, contracts):
+    conn = connection(db_path)
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({day_table(date)})')}
+    if not columns:
+        return None
+
+    # Narrow the scan with the indexed columns, then match contracts exactly
+    where = [f"time IN ({', '.join('?' for _ in chain_minutes)})"] if chain_minutes else []
+    params = [format_minute(m) for m in chain_minutes]
+    if contracts:
+        strikes = sorted({strike for _, strike, _ in contracts})
+        lo = min(lo for lo, _ in contracts.values())
+        hi = max(hi for _, hi in contracts.values())
+        where.append(f"(time >= ? AND time <= ? AND strike IN ({', '.join('?' for _ in strikes)}))")
+        params += [format_minute(lo), format_minute(hi)] + strikes
+    if not where:
+        return None
+
+    expiry = 'expiry' if 'expiry' in columns else 'NULL AS expiry'
+    frame = pd.read_sql_query(
+        f'SELECT time, {expiry}, strike, instrument_type, open, high, low, close '
+        f'FROM {day_table(date)} WHERE {" OR ".join(where)}',
+        conn, params=params
+    )
+    count_fetched(frame)
+    codes, expiries = pd.factorize(frame['expiry'].astype(str))
+    day = {
+        'minute': np.array([minute_of_day(t) for t in frame['time']], dtype=int),
+        'expiry': parse_expiries(expiries).astype(str)[codes] if len(frame) else np.array([], dtype=str),
+        'strike': pd.to_numeric(frame['strike'], errors='coerce').round().fillna(-1).astype(int).to_numpy(),
+        'instrument_type': frame['instrument_type'].astype(str).to_numpy(),
+        **{name: pd.to_numeric(frame[name], errors='coerce').to_numpy() for name in PRICE_FIELDS}
+    }
+    keep = _contract_rows(day, chain_minutes, contracts)
+    return {name: values[keep] for name, values in day.items()}
+
+
+def option_bars(date, contracts=None, chain_minutes=(), store=None, db_path=None):
+    """
+    Stream the option bars of one day in time order.
+
+    Every contract's bar at chain_minutes is streamed (the chain the entry
+    rule picks strikes from), plus the bars of `contracts` inside their
+    time window. Bars of one minute are ordered by expiry, strike and
+    option type.
+
+    Args:
+        date (str): ddmmyyyy day
+        contracts (dict): (expiry, strike, option_type) to (first, last)
+            minute, see Subscriptions.take
+        chain_minutes (tuple): Minutes, or 'HH:MM:SS' times, at which the
+            whole chain is streamed
+    """
+    date = normalize_date(date)
+    contracts = contracts or {}
+    chain_minutes = tuple(minute_of_day(t) if isinstance(t, str) else t for t in chain_minutes)
+    if store is not None:
+        day = _option_day_store(store, date, chain_minutes, contracts)
+    else:
+        day = _option_day_db(db_path, date, chain_minutes, contracts)
+    if day is None:
+        return
+
+    order = np.lexsort((day['instrument_type'], day['strike'], day['expiry'], day['minute']))
+    rows = zip(*(day[name][order].tolist()
+                 for name in ('minute', 'expiry', 'strike', 'instrument_type') + PRICE_FIELDS))
+
+    last = None
+    for minute, expiry, strike, option_type, o, h, l, c in rows:
+        key = (expiry, strike, option_type)
+        if (minute, key) != last and not np.isnan(c):
+            yield Bar(date, minute, key, o, h, l, c)
+        last = (minute, key)
+
+
+def sessions(days, subscriptions, chain_minutes=(), store=None, data_dir=None):
+    """
+    Yield (date, bars) for each day, bars being spot and option bars merged in time order.
+
+    A day's bars are only read when the consumer moves on to it, so the
+    contracts subscribed while replaying earlier days are included.
+    Spot bars come before option bars of the same minute.
+    """
+    data_dir = data_dir or default_data_dir()
+    spot_db = os.path.join(data_dir, 'SPOT.db')
+    option_db = os.path.join(data_dir, 'OPT.db')
+    for date in days:
+        date = normalize_date(date)
+        contracts = subscriptions.take(date)
+        yield date, heapq.merge(
+            spot_bars(date, store, spot_db),
+            option_bars(date, contracts, chain_minutes, store, option_db),
+            key=lambda bar: bar.minute
+        )
+
+
+def _extend(current, bar):
+    """Add a later bar of the same key to an N-minute bar."""
+    return current._replace(high=max(current.high, bar.high), low=min(current.low, bar.low),
+                            close=bar.close)
+
+
+class Resampler:
+    """Aggregates the bars of one key into N-minute bars aligned to origin."""
+
+    def __init__(self, minutes, origin=SESSION_START):
+        self.minutes = minutes
+        self.origin = minute_of_day(origin)
+        self.current = None
+
+    def bucket(self, minute):
+        return self.origin + (minute - self.origin) // self.minutes * self.minutes
+
+    def update(self, bar):
+        """Add a bar; return the previous N-minute bar if this one starts a new bucket."""
+        start = self.bucket(bar.minute)
+        done = None
+        if self.current is not None and (self.current.date, self.current.minute) != (bar.date, start):
+            done = self.current
+            self.current = None
+        if self.current is None:
+            self.current = bar._replace(minute=start)
+        else:
+            self.current = _extend(self.current, bar)
+        return done
+
+    def flush(self):
+        done, self.current = self.current, None
+        return done
+
+
+def resample(bars, minutes, origin=SESSION_START):
+    """
+    Resample a time-ordered bar stream to N-minute bars per key.
+
+    Each N-minute bar is labelled with the first minute of its bucket and
+    emitted as soon as the stream moves past the bucket, so only one open
+    bar per key is held in memory.
+    """
+    if minutes <= 1:
+        yield from bars
+        return
+
+    origin = minute_of_day(origin)
+    open_bars = {}
+    position = None
+    for bar in bars:
+        bucket = origin + (bar.minute - origin) // minutes * minutes
+        if (bar.date, bucket) != position:
+            yield from open_bars.values()
+            open_bars = {}
+            position = (bar.date, bucket)
+        current = open_bars.get(bar.key)
+        if current is None:
+            open_bars[bar.key] = bar._replace(minute=bucket)
+        else:
+            open_bars[bar.key] = _extend(current, bar)
+    yield from open_bars.values()
+
+
+class Position:
+    """One open or closed option leg of a replayed trade."""
+
+    __slots__ = ('trade', 'leg', 'side', 'contract', 'entry_price', 'direction', 'exit_date',
+                 'bars', 'stop', 'extremes', 'last_minute', 'last_close',
+                 'exit_minute', 'exit_price', 'exit_reason')
+
+    def __init__(self, trade, leg, side, contract, entry_price, direction, exit_date):
+        self.trade = trade
+        self.leg = leg
+        self.side = side
+        self.contract = contract
+        self.entry_price = entry_price
+        self.direction = direction
+        self.exit_date = exit_date
+        self.bars = 0
+        self.stop = -np.inf
+        self.extremes = deque()
+        self.last_minute = None
+        self.last_close = None
+        self.exit_minute = None
+        self.exit_price = np.nan
+        self.exit_reason = None
+
+    @property
+    def is_open(self):
+        return self.exit_reason is None
+
+
+class Context:
+    """State shared by the handlers of one replay."""
+
+    def __init__(self, subscriptions=None):
+        self.date = None
+        self.subscriptions = subscriptions or Subscriptions()
+        self.positions = []
+        self.spot_moves = {}
+
+    def trading(self):
+        """Open positions that are managed on the current day."""
+        return [p for p in self.positions if p.is_open and p.exit_date == self.date]
+
+    def close(self, position, minute, price, reason):
+        position.exit_minute = minute
+        position.exit_price = price
+        position.exit_reason = reason
+
+
+class Handler:
+    """
+    Base class of the replay callbacks; override the hooks a rule needs.
+
+    on_minute_end is only called by feeds that mark the end of each minute
+    (see paper.py); rules act on it as soon as a minute is complete instead
+    of waiting for the first bar of the next one.
+    """
+
+    def on_day_start(self, ctx):
+        pass
+
+    def on_bar(self, bar, ctx):
+        pass
+
+    def on_minute_end(self, minute, ctx):
+        pass
+
+    def on_day_end(self, ctx):
+        pass
+
+
+class _QuotedStrikes:
+    """StrikeIndex stand-in over the traded expiry's entry-minute bars collected during the replay."""
+
+    def __init__(self, chain, expiry):
+        self.chain = chain
+        self.expiry = expiry
+
+    def snap(self, dates, targets, option_types, atm=None):
+        snapped = []
+        for i, (target, option_type) in enumerate(zip(targets, option_types)):
+            strikes = np.array(sorted({k for e, k, t in self.chain if e == self.expiry and t == option_type}))
+            # A hedge stays on its own side of the ATM strike, like StrikeIndex.snap
+            if atm is not None:
+                strikes = strikes[strikes < atm[i]] if option_type == 'PE' else strikes[strikes > atm[i]]
+            if not len(strikes):
+                snapped.append(target)
+                continue
+            pos = np.searchsorted(strikes, target)
+            below = strikes[max(pos - 1, 0)]
+            above = strikes[min(pos, len(strikes) - 1)]
+            # Ties go to the lower strike, like StrikeIndex.snap
+            use_above = pos == 0 or (pos < len(strikes) and above - target < target - below)
+            snapped.append(above if use_above else below)
+        return np.asarray(snapped, dtype=np.int64)
+
+
+class SpotMoveEntry(Handler):
+    """
+    Sell the ATM option against the open-to-entry spot move and buy a hedge.
+
+    At entry_time the spot move since open_time picks the side (PE sold
+    after an up move, CE otherwise); strikes come from the 03 strike rules
+    and are snapped to the strikes quoted at entry. Prices are the closes of
+    the entry-minute option bars on the expiry picked by select_expiry, so
+    an expiry-day entry rolls to the next weekly expiry like in 04. Each leg
+    is then subscribed for the next session's trailing window.
+
+    With with_move the option type follows the move instead (CE after an up
+    move, hedge further out of the money above it), for strategies that buy
+    in the direction of the move.
+    """
+
+    def __init__(self, calendar, open_time='09:15:00', entry_time='15:25:00', strike_interval=100,
+                 hedge_rule='percent', hedge_pct=2.0, hedge_steps=1, snap_strikes=True,
+                 trail_start='09:15:00', exit_time='09:45:00', legs=STRATEGY_LEGS, entry_dates=None,
+                 with_move=False, expiry_rollover='expiry_day'):
+        self.calendar = calendar
+        self.open_minute = minute_of_day(open_time)
+        self.entry_minute = minute_of_day(entry_time)
+        self.strike_rule = dict(strike_interval=strike_interval, hedge_rule=hedge_rule,
+                                hedge_pct=hedge_pct, hedge_steps=hedge_steps)
+        self.snap_strikes = snap_strikes
+        self.trail_window = (trail_start, exit_time)
+        self.legs = legs
+        self.entry_dates = None if entry_dates is None else {normalize_date(d) for d in entry_dates}
+        self.with_move = with_move
+        self.expiry_rollover = expiry_rollover
+        self.select_strikes = importlib.import_module('03_select_strike').select_strikes_vectorized
+
+    def on_day_start(self, ctx):
+        self.open_price = None
+        self.signal = None
+        self.chain = {}
+
+    def on_bar(self, bar, ctx):
+        if self.signal is not None and bar.minute > self.entry_minute:
+            self._enter(ctx)
+        if bar.key == SPOT:
+            if bar.minute == self.open_minute:
+                self.open_price = bar.close
+            elif bar.minute == self.entry_minute and self.open_price is not None:
+                self._signal(bar, ctx)
+        elif bar.minute == self.entry_minute:
+            self.chain[bar.key] = bar.close
+
+    def on_minute_end(self, minute, ctx):
+        if self.signal is not None and minute >= self.entry_minute:
+            self._enter(ctx)
+
+    def on_day_end(self, ctx):
+        if self.signal is not None:
+            self._enter(ctx)
+
+    def _signal(self, bar, ctx):
+        change = bar.close - self.open_price
+        direction = 'UP' if change > 0 else 'DOWN' if change < 0 else 'FLAT'
+        ctx.spot_moves[ctx.date] = {
+            'price_915': self.open_price,
+            'price_1525': bar.close,
+            'price_change': change,
+            'direction': direction,
+            'pct_change': round(change / self.open_price * 100, 2),
+            'is_expiry': self.calendar.is_expiry(ctx.date)
+        }
+        if self.entry_dates is None or ctx.date in self.entry_dates:
+            self.signal = (bar.close, direction)
+
+    def _enter(self, ctx):
+        spot, direction = self.signal
+        self.signal = None
+        next_date = self.calendar.next_day(ctx.date)
+
+        # Same expiry rule as 04, with the expiry-day rollover
+        expiry = select_expiry([e for e, _, _ in self.chain], ctx.date, self.expiry_rollover)
+        if expiry is None:
+            return
+        expiry = str(expiry)
+
+        strike_index = _QuotedStrikes(self.chain, expiry) if self.snap_strikes else None
+        side_of = FLIPPED.get(direction, direction) if self.with_move else direction
+        atm, hedge, option_types = self.select_strikes([spot], [side_of], dates=[ctx.date],
+                                                       strike_index=strike_index, **self.strike_rule)
+        option_type = str(option_types[0])
+        strikes = {'atm': int(atm[0]), 'hedge': int(hedge[0])}
+
+        prices = {name: self.chain.get((expiry, strikes.get(name), option_type)) for name, _ in self.legs}
+        if any(price is None for price in prices.values()):
+            print(f"Error processing date {ctx.date}: no entry price for every leg")
+            return
+
+        for name, side in self.legs:
+            contract = (expiry, strikes[name], option_type)
+            ctx.positions.append(Position(ctx.date, name, side, contract, prices[name],
+                                          direction, next_date))
+            if next_date is not None:
+                ctx.subscriptions.add(next_date, contract, *self.trail_window)
+
+
+class TrailingStop(Handler):
+    """
+    Trail each open leg on its own option bars.
+
+    A bought leg trails below the lowest low of the previous `window` bars
+    and a sold leg above the highest high, ratcheting only in the trade's
+    favour; the leg exits at the close of the first bar through the stop.
+    With bar_minutes > 1 the legs trail on N-minute bars built on the fly.
+    """
+
+    def __init__(self, window=3, start='09:15:00', end='09:45:00', bar_minutes=1):
+        self.window = window
+        self.start, self.end = _window(start, end)
+        self.bar_minutes = bar_minutes
+
+    def on_day_start(self, ctx):
+        self.held = {}
+        for position in ctx.trading():
+            self.held.setdefault(position.contract, []).append(position)
+        self.resamplers = {}
+
+    def on_bar(self, bar, ctx):
+        if bar.minute > self.end:
+            self._flush(ctx)
+            return
+        if bar.key not in self.held or bar.minute < self.start:
+            return
+        if self.bar_minutes > 1:
+            if bar.key not in self.resamplers:
+                self.resamplers[bar.key] = Resampler(self.bar_minutes)
+            done = self.resamplers[bar.key].update(bar)
+            if done is not None:
+                self._step_bucket(done, ctx)
+        else:
+            self._step(bar, bar.minute, ctx)
+
+    def on_minute_end(self, minute, ctx):
+        # The last minute of a bucket completes every open N-minute bar
+        if self.resamplers and (minute >= self.end or (minute + 1 - SESSION_MINUTE) % self.bar_minutes == 0):
+            self._flush(ctx)
+
+    def on_day_end(self, ctx):
+        self._flush(ctx)
+
+    def _step_bucket(self, bar, ctx):
+        # An N-minute bar is labelled with its first minute but closes at its
+        # last; like the cached bars, only bars inside start-end are used
+        closed_at = bar.minute + self.bar_minutes - 1
+        if bar.minute >= self.start and closed_at <= self.end:
+            self._step(bar, closed_at, ctx)
+
+    def _flush(self, ctx):
+        for resampler in self.resamplers.values():
+            done = resampler.flush()
+            if done is not None:
+                self._step_bucket(done, ctx)
+
+    def _step(self, bar, minute, ctx):
+        for position in self.held.get(bar.key, ()):
+            if not position.is_open:
+                continue
+            # Flip sold legs so every leg trails below a rising stop
+            extreme = bar.low if position.side > 0 else -bar.high
+            price = bar.close if position.side > 0 else -bar.close
+            if len(position.extremes) == self.window:
+                position.stop = max(position.stop, min(position.extremes))
+                if price < position.stop:
+                    ctx.close(position, minute, bar.close, EXIT_TRAIL)
+                    continue
+                position.extremes.popleft()
+            position.extremes.append(extreme)
+            position.bars += 1
+            position.last_minute = minute
+            position.last_close = bar.close
+
+
+class TimeExit(Handler):
+    """
+    Close the legs still open at exit_time at their last bar.
+
+    Legs with fewer than min_bars bars that morning are left without an
+    exit, and their trade is dropped like in the vectorized engine.
+    """
+
+    def __init__(self, exit_time='09:45:00', min_bars=3):
+        self.exit_minute = minute_of_day(exit_time)
+        self.min_bars = min_bars
+
+    def on_day_start(self, ctx):
+        self.done = False
+
+    def on_bar(self, bar, ctx):
+        if not self.done and bar.minute > self.exit_minute:
+            self._close(ctx)
+
+    def on_minute_end(self, minute, ctx):
+        if not self.done and minute >= self.exit_minute:
+            self._close(ctx)
+
+    def on_day_end(self, ctx):
+        if not self.done:
+            self._close(ctx)
+
+    def _close(self, ctx):
+        self.done = True
+        for position in ctx.trading():
+            if position.bars >= self.min_bars:
+                ctx.close(position, position.last_minute, position.last_close, EXIT_TIME)
+
+
+def replay(days, handlers, ctx=None, bar_minutes=1):
+    """
+    Feed each day's bars through the handlers.
+
+    Handlers see every bar in time order, with on_day_start and on_day_end
+    around each day. Only the bars of the current day are being read and
+    nothing but the handlers' own state is kept, so memory does not grow
+    with the length of the history.
+
+    Args:
+        days (iterable): (date, bars) pairs, see sessions()
+        handlers (list): Handler instances, called in order for every event
+        ctx (Context): Shared state, a new Context by default
+        bar_minutes (int): Resample the bars to N-minute bars first
+
+    Returns:
+        Context: The final context, holding every position
+    """
+    ctx = ctx or Context()
+    replay_all(days, [(handlers, ctx)], bar_minutes)
+    return ctx
+
+
+def replay_all(days, runs, bar_minutes=1):
+    """
+    Feed one pass over the bars to several independent sets of handlers.
+
+    Each run has its own Context, so strategies replayed together never see
+    each other's positions, while the bars are read only once. Give the
+    contexts one shared Subscriptions object so every run's contracts are
+    read.
+
+    Args:
+        days (iterable): (date, bars) pairs, see sessions()
+        runs (list): (handlers, ctx) pairs
+        bar_minutes (int): Resample the bars to N-minute bars first
+    """
+    for date, bars in days:
+        for handlers, ctx in runs:
+            ctx.date = date
+            for handler in handlers:
+                handler.on_day_start(ctx)
+        for bar in resample(bars, bar_minutes):
+            for handlers, ctx in runs:
+                for handler in handlers:
+                    handler.on_bar(bar, ctx)
+        for handlers, ctx in runs:
+            for handler in handlers:
+                handler.on_day_end(ctx)
+
+
+def positions_frame(positions):
+    """
+    Leg table in the layout of process_trailing_exits.
+
+    Trades with a leg that never exited are dropped.
+    """
+    book = LegBook(
+        trade=[p.trade for p in positions],
+        leg=[p.leg for p in positions],
+        strike=[p.contract[1] for p in positions],
+        option_type=[p.contract[2] for p in positions],
+        side=[p.side for p in positions],
+        expiry=[p.contract[0] for p in positions]
+    )
+    book.entry_price = np.array([p.entry_price for p in positions], dtype=float)
+    book.exit_price = np.array([p.exit_price for p in positions], dtype=float)
+    book.exit_minute = np.array([p.exit_minute if p.exit_minute is not None else -1
+                                 for p in positions], dtype=int)
+    book.exit_reason = np.array([p.exit_reason for p in positions], dtype=object)
+
+    results = book.to_frame().drop(columns=['entry_fill', 'exit_fill'])
+    results['direction'] = [p.direction for p in positions]
+    results['exit_date'] = [p.exit_date for p in positions]
+    return results[book.complete()] if len(positions) else results
+
+
+def replay_days(calendar, dates=None):
+    """
+    Days to replay for trades entered on `dates` (every day by default).
+
+    Returns:
+        tuple: (entry_dates, days), days adding the sessions the legs of
+        those trades are trailed on
+    """
+    entry_dates = list(calendar) if dates is None else [normalize_date(d) for d in dates]
+    days = set(entry_dates) | {calendar.next_day(d) for d in entry_dates}
+    return entry_dates, [d for d in calendar if d in days]
+
+
+def strategy_handlers(params, calendar, entry_dates=None, legs=STRATEGY_LEGS, with_move=False,
+                      bar_minutes=None):
+    """The entry, trailing stop and time exit handlers of one parameter set."""
+    bar_minutes = bar_minutes or params.trail_bar_minutes
+    return [
+        SpotMoveEntry(calendar, params.open_time, params.entry_time, params.strike_interval,
+                      params.hedge_rule, params.hedge_pct, params.hedge_steps, params.snap_strikes,
+                      params.trail_start, params.exit_time, legs, entry_dates, with_move,
+                      params.expiry_rollover),
+        TrailingStop(params.trail_window, params.trail_start, params.exit_time, bar_minutes),
+        TimeExit(params.exit_time, params.trail_window)
+    ]
+
+
+def replay_results(ctx, entry_dates):
+    """
+    Spot movement and legs of a finished replay.
+
+    Returns:
+        tuple: (spot_movement, legs) in the layouts of get_spot_movement and
+        process_trailing_exits
+    """
+    spot_movement = pd.DataFrame.from_dict(ctx.spot_moves, orient='index')
+    spot_movement.index.name = 'date'
+    spot_movement = spot_movement[spot_movement.index.isin(entry_dates)]
+    return spot_movement, positions_frame(ctx.positions)
+
+
+def run_replay(params=None, store=None, data_dir=None, calendar=None, dates=None, bar_minutes=None,
+               save=False):
+    """
+    Run the strategy by replaying minute bars through the rule handlers.
+
+    Produces the same legs as stages 02-05 (vectorized engine) while holding
+    one day of bars at a time.
+
+    Args:
+        params (StrategyParams): Strategy parameters, DEFAULT_PARAMS by default
+        store (MarketStore): Columnar store; SPOT.db/OPT.db are read when None
+        data_dir (str): Directory holding the databases
+        calendar (TradingCalendar): Shared trading calendar
+        dates (list): Only enter trades on these days, all days by default
+        bar_minutes (int): Trail on N-minute bars instead of minute bars,
+            params.trail_bar_minutes by default
+        save (bool): Write spot_movement and trailing_exits to the
+            reports directory
+
+    Returns:
+        tuple: (spot_movement, legs) in the layouts of get_spot_movement and
+        process_trailing_exits, or None if no day had spot data
+    """
+    params = params or DEFAULT_PARAMS
+    data_dir = data_dir or default_data_dir()
+    calendar = calendar or build_calendar(data_dir, store)
+    entry_dates, days = replay_days(calendar, dates)
+
+    ctx = Context()
+    handlers = strategy_handlers(params, calendar, entry_dates, bar_minutes=bar_minutes)
+    replay(sessions(days, ctx.subscriptions, (params.entry_time,), store, data_dir), handlers, ctx)
+
+    spot_movement, legs = replay_results(ctx, entry_dates)
+    if spot_movement.empty:
+        print("Error: no spot data for the requested days")
+        return None
+
+    if save:
+        write_frame(spot_movement, 'spot_movement')
+        write_frame(legs, 'trailing_exits')
+
+    print("\nBar Replay:")
+    print("===========")
+    print(f"Days replayed: {len(days)}, trades: {legs.index.nunique()} ({len(legs)} legs)")
+    return spot_movement, legs
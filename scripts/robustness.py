@@ -0,0 +1,283 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from analytics import TRADING_DAYS
+from executor import BACKENDS, DayExecutor
+from intermediates import read_frame, write_frame
+
+# Paths per work item are chosen so one item's (paths, trades) matrices
+# hold about this many cells, small enough to stay in the CPU cache
+CHUNK_CELLS = 250_000
+
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+# Default ruin levels, as multiples of the historical max drawdown
+RUIN_MULTIPLES = (1.0, 1.5, 2.0, 3.0)
+
+METRIC_NAMES = {
+    'total_pnl': 'Total P&L',
+    'max_drawdown': 'Max Drawdown',
+    'max_drawdown_duration': 'Max Drawdown Duration (trades)',
+    'worst_equity': 'Worst Equity',
+    'sharpe': 'Sharpe Ratio'
+}
+
+
+def resample_indices(rng, trades, paths, horizon, block=1):
+    """
+    Trade positions of bootstrap paths, drawn with replacement.
+
+    With block > 1 runs of `block` consecutive trades are drawn (circular
+    moving-block bootstrap), which keeps losing streaks and volatility
+    clusters of the series in the paths.
+
+    Args:
+        rng (np.random.Generator): Random generator
+        trades (int): Length of the trade series
+        paths (int): Paths to draw
+        horizon (int): Trades per path
+        block (int): Block length; 1 is the plain bootstrap
+
+    Returns:
+        np.ndarray: (paths, horizon) positions into the trade series
+    """
+    if block == 1:
+        return rng.integers(0, trades, size=(paths, horizon), dtype=np.int32)
+    blocks = -(-horizon // block)
+    starts = rng.integers(0, trades, size=(paths, blocks, 1), dtype=np.int32)
+    index = (starts + np.arange(block, dtype=np.int32)).reshape(paths, blocks * block)[:, :horizon]
+    # Blocks that run past the last trade wrap around to the first, as
+    # often as needed when a block is longer than the series
+    index %= trades
+    return index
+
+
+def path_metrics(pnl):
+    """
+    Equity statistics of every path of a PnL matrix.
+
+    Unlike analytics.equity_curve the paths start at a peak of 0, so a
+    loss on the first trade already counts as drawdown.
+
+    Args:
+        pnl (np.ndarray): (paths, trades) PnL per trade
+
+    Returns:
+        dict: total_pnl, max_drawdown, max_drawdown_duration (trades),
+        worst_equity (lowest cumulative PnL, at most 0) and annualised
+        sharpe of every path
+    """
+    pnl = np.atleast_2d(np.asarray(pnl, dtype=float))
+    sharpe = np.full(len(pnl), np.nan)
+    if pnl.shape[1] > 1:
+        std = pnl.std(axis=1, ddof=1)
+        np.divide(pnl.mean(axis=1), std, out=sharpe, where=std > 0)
+        sharpe *= np.sqrt(TRADING_DAYS)
+
+    # Reuse two buffers for the cumulative PnL, running peak and drawdown
+    cumulative = np.cumsum(pnl, axis=1)
+    total = cumulative[:, -1].copy()
+    worst = np.minimum(cumulative.min(axis=1), 0)
+    drawdown = np.maximum(cumulative, 0)
+    np.maximum.accumulate(drawdown, axis=1, out=drawdown)
+    np.subtract(cumulative, drawdown, out=drawdown)
+
+    # Position of the latest trade that closed at a peak, -1 before the first
+    steps = np.arange(pnl.shape[1], dtype=np.int32)
+    last_peak = np.where(drawdown == 0, steps, np.int32(-1))
+    np.maximum.accumulate(last_peak, axis=1, out=last_peak)
+    np.subtract(steps, last_peak, out=last_peak)
+
+    return {
+        'total_pnl': total,
+        'max_drawdown': drawdown.min(axis=1),
+        'max_drawdown_duration': last_peak.max(axis=1),
+        'worst_equity': worst,
+        'sharpe': sharpe
+    }
+
+
+def _simulate_chunk(shared, chunk):
+    """Metrics of one chunk of paths; chunk is (paths, seed sequence)."""
+    pnl, horizon, block = shared
+    paths, seed = chunk
+    rng = np.random.default_rng(seed)
+    return path_metrics(pnl[resample_indices(rng, len(pnl), paths, horizon, block)])
+
+
+def simulate(pnl, paths=10_000, block=1, horizon=None, seed=None, executor=None):
+    """
+    Bootstrap synthetic equity paths from a per-trade PnL series.
+
+    Paths are simulated in chunks of whole NumPy matrices, so memory stays
+    bounded for long series. Each chunk has its own seed spawned from
+    `seed`, which makes the result independent of the worker count.
+
+    Args:
+        pnl (array-like): PnL per trade in time order
+        paths (int): Paths to simulate
+        block (int): Block length of the moving-block bootstrap; 1 draws
+            trades independently
+        horizon (int): Trades per path, the length of the series by default
+        seed (int): Seed for reproducible paths
+        executor (DayExecutor): Runs the chunks; a thread pool over all
+            cores by default
+
+    Returns:
+        pd.DataFrame: One row per path with the path_metrics columns
+    """
+    pnl = np.asarray(pnl, dtype=float)
+    pnl = pnl[~np.isnan(pnl)]
+    if not len(pnl):
+        raise ValueError("No trades to resample")
+    if paths < 1 or block < 1:
+        raise ValueError("paths and block must be at least 1")
+    horizon = horizon or len(pnl)
+
+    per_chunk = max(1, CHUNK_CELLS // horizon)
+    sizes = [min(per_chunk, paths - start) for start in range(0, paths, per_chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    executor = executor or DayExecutor()
+    chunks = executor.map(_simulate_chunk, list(zip(sizes, seeds)), (pnl, horizon, block))
+    if chunks.failures:
+        raise RuntimeError(f"Simulation failed: {chunks.failures[0].error}")
+
+    parts = chunks.values()
+    return pd.DataFrame({name: np.concatenate([part[name] for part in parts]) for name in parts[0]})
+
+
+def distribution(metrics, historical):
+    """Percentiles and mean of every path metric next to the historical value."""
+    table = metrics.quantile(np.array(PERCENTILES) / 100).T
+    table.columns = [f'P{p}' for p in PERCENTILES]
+    table.insert(0, 'Mean', metrics.mean())
+    table.insert(0, 'Historical', pd.Series(historical))
+    return table.rename(index=METRIC_NAMES)
+
+
+def confidence_intervals(metrics, horizon, confidence=0.95):
+    """
+    Confidence intervals of total, per-trade and risk-adjusted PnL.
+
+    Returns:
+        pd.DataFrame: Lower bound, median and upper bound per measure
+    """
+    tail = (1 - confidence) / 2
+    measures = pd.DataFrame({
+        'Total P&L': metrics['total_pnl'],
+        'Average P&L per Trade': metrics['total_pnl'] / horizon,
+        'Sharpe Ratio': metrics['sharpe']
+    })
+    table = measures.quantile([tail, 0.5, 1 - tail]).T
+    table.columns = [f'Lower ({confidence:.0%})', 'Median', f'Upper ({confidence:.0%})']
+    table['P(< 0) %'] = (measures < 0).mean() * 100
+    return table
+
+
+def risk_of_ruin(metrics, levels):
+    """
+    Share of paths whose equity ever falls `level` or more below the start.
+
+    Returns:
+        pd.DataFrame: Risk of ruin in percent per loss level
+    """
+    worst = metrics['worst_equity'].to_numpy()
+    return pd.DataFrame({
+        'Loss Level': levels,
+        'Risk of Ruin %': [np.mean(worst <= -level) * 100 for level in levels]
+    }).set_index('Loss Level')
+
+
+def run_robustness(pnl_data=None, paths=10_000, block=1, horizon=None, seed=None, ruin_levels=None,
+                   confidence=0.95, executor=None, save=True):
+    """
+    Resample the trade PnL of a backtest and report how robust it is.
+
+    Args:
+        pnl_data (pd.DataFrame): Trade-level PnL from calculate_pnl; read
+            from the stored pnl_analysis when not given
+        paths (int): Paths to simulate
+        block (int): Bootstrap block length in trades
+        horizon (int): Trades per path, the backtest's trade count by default
+        seed (int): Seed for reproducible paths
+        ruin_levels (list): Losses from the start that count as ruin;
+            RUIN_MULTIPLES of the historical max drawdown by default
+        confidence (float): Level of the confidence intervals
+        executor (DayExecutor): Runs the chunks of paths
+        save (bool): Write the per-path metrics to reports/robustness/
+
+    Returns:
+        dict: Title to table, or None when there is no PnL to resample
+    """
+    if pnl_data is None:
+        pnl_data = read_frame('pnl_analysis')
+        if pnl_data is None:
+            print("Error: pnl_analysis not found. Please run 06_calculate_pnl.py first.")
+            return None
+
+    pnl = pnl_data['pnl'].to_numpy(dtype=float)
+    pnl = pnl[~np.isnan(pnl)]
+    if not len(pnl):
+        print("Error: pnl_analysis has no trades to resample.")
+        return None
+    horizon = horizon or len(pnl)
+
+    start = time.perf_counter()
+    metrics = simulate(pnl, paths, block, horizon, seed, executor)
+    elapsed = time.perf_counter() - start
+
+    historical = {name: values[0] for name, values in path_metrics(pnl).items()}
+    if ruin_levels is None:
+        worst_drawdown = -historical['max_drawdown']
+        ruin_levels = [round(worst_drawdown * multiple, 2) for multiple in RUIN_MULTIPLES] \
+            if worst_drawdown > 0 else [round(np.abs(pnl).max(), 2)]
+
+    tables = {
+        'Path Distribution': distribution(metrics, historical),
+        'Confidence Intervals': confidence_intervals(metrics, horizon, confidence),
+        'Risk of Ruin': risk_of_ruin(metrics, ruin_levels)
+    }
+
+    if save:
+        write_frame(metrics, 'robustness')
+
+    print("\nRobustness Analysis:")
+    print("====================")
+    print(f"Paths: {paths:,} of {horizon} trades resampled from {len(pnl)} "
+          f"(block {block}) in {elapsed:.2f}s")
+    for title, table in tables.items():
+        print(f"\n{title}:")
+        print(table.round(2).to_string())
+
+    return tables
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bootstrap the backtest's trade PnL into synthetic equity paths.")
+    parser.add_argument('--paths', type=int, default=10_000, help="paths to simulate (default: 10000)")
+    parser.add_argument('--block', type=int, default=1,
+                        help="block length in trades; 1 resamples trades independently (default: 1)")
+    parser.add_argument('--horizon', type=int, help="trades per path (default: the backtest's trade count)")
+    parser.add_argument('--seed', type=int, help="random seed for reproducible paths")
+    parser.add_argument('--ruin', type=float, nargs='+', metavar='LOSS',
+                        help="losses from the start that count as ruin "
+                             "(default: 1/1.5/2/3x the historical max drawdown)")
+    parser.add_argument('--confidence', type=float, default=0.95, help="confidence level (default: 0.95)")
+    parser.add_argument('--workers', type=int, help="parallel workers (default: all cores)")
+    parser.add_argument('--backend', choices=BACKENDS, default='thread',
+                        help="run the chunks of paths on threads or processes (default: thread)")
+    args = parser.parse_args()
+
+    run_robustness(paths=args.paths, block=args.block, horizon=args.horizon, seed=args.seed,
+                   ruin_levels=args.ruin, confidence=args.confidence,
+                   executor=DayExecutor(args.workers, args.backend))
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from db import connection, count_fetched, day_table
+from market_store import format_minute, list_day_tables, minute_of_day, table_to_date
+
+# SQLite refuses compound SELECTs with more terms than this by default
+MAX_UNION_TERMS = 500
+
+
+def _snapshots_from_store(store, minutes, column, kind, dates):
+    """Pick the requested minutes out of one scan of the store columns."""
+    data = store.scan(kind, ['date', 'minute', column])
+    mask = np.isin(data['minute'], minutes)
+    if dates is not None:
+        mask &= np.isin(data['date'], [table_to_date(d) for d in dates])
+
+    return pd.DataFrame({
+        'date': data['date'][mask],
+        'minute': data['minute'][mask],
+        'price': data[column][mask]
+    })
+
+
+def _snapshots_from_db(db_path, minutes, column, dates):
+    """Pick the requested minutes out of every day table with UNION ALL queries."""
+    conn = connection(db_path)
+    tables = list_day_tables(conn)
+    if dates is not None:
+        wanted = {str(d).zfill(8) for d in dates}
+        tables = [t for t in tables if t in wanted]
+
+    times = [format_minute(m) for m in minutes]
+    placeholders = ', '.join('?' for _ in times)
+
+    frames = []
+    for start in range(0, len(tables), MAX_UNION_TERMS):
+        chunk = tables[start:start + MAX_UNION_TERMS]
+        query = '\nUNION ALL\n'.join(
+            f'SELECT ? AS date, time, "{column}" AS price FROM {day_table(table)} '
+            f'WHERE time IN ({placeholders})'
+            for table in chunk
+        )
+        params = []
+        for table in chunk:
+            params.append(table)
+            params.extend(times)
+        frames.append(pd.read_sql_query(query, conn, params=params))
+
+    if not frames:
+        return pd.DataFrame(columns=['date', 'minute', 'price'])
+    data = pd.concat(frames, ignore_index=True)
+    count_fetched(data)
+    data['date'] = [table_to_date(d) for d in data['date']]
+    data['minute'] = [minute_of_day(t) for t in data.pop('time')]
+    return data
+
+
+def fetch_snapshots(times, store=None, db_path=None, column='close', kind='spot', dates=None):
+    """
+    Fetch prices at a set of times of day for every trading day in one pass.
+
+    Reads from the columnar store when one is given, otherwise from the day
+    tables of db_path with one UNION ALL query per block of 500 days.
+
+    Args:
+        times (list): Times of day, e.g. ['09:15:00', '15:25:00']
+        store (MarketStore): Columnar store to scan
+        db_path (str): SQLite database to query when there is no store
+        column (str): Price column to return
+        kind (str): 'spot' or 'opt' section of the store
+        dates (list): Restrict to these ddmmyyyy dates, all days by default
+
+    Returns:
+        pd.DataFrame: One row per ddmmyyyy date in chronological order and
+        one column per requested time; days missing a time hold NaN
+    """
+    minutes = sorted({minute_of_day(t) for t in times})
+
+    if store is not None:
+        data = _snapshots_from_store(store, minutes, column, kind, dates)
+    else:
+        data = _snapshots_from_db(db_path, minutes, column, dates)
+
+    # Keep the first bar when a day has duplicate rows for the same minute
+    data = data.drop_duplicates(['date', 'minute'])
+    table = data.pivot(index='date', columns='minute', values='price')
+    table = table.reindex(columns=minutes).sort_index()
+
+    table.index = [pd.Timestamp(d).strftime('%d%m%Y') for d in table.index]
+    table.index.name = 'date'
+    table.columns = [format_minute(m) for m in table.columns]
+    return table
@@ -0,0 +1,234 @@
+import argparse
+import contextlib
+import io
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from bar_cache import open_bar_cache
+from db_profile import entry_days
+from executor import DayExecutor
+from market_store import open_store
+from option_chain import OptionChainLoader, StrikeIndex
+from params import DEFAULT_PARAMS, StrategyParams
+from pipeline import load_stage
+from trading_calendar import build_calendar
+
+# Parameters each cached stage result depends on; later stages add to the key
+STAGE_KEYS = {
+    'spot_movement': ('open_time', 'entry_time'),
+    'strike_selection': ('open_time', 'entry_time', 'strike_interval', 'hedge_rule',
+                         'hedge_pct', 'hedge_steps', 'snap_strikes', 'expiry_rollover'),
+    'option_prices': ('open_time', 'entry_time', 'strike_interval', 'hedge_rule',
+                      'hedge_pct', 'hedge_steps', 'snap_strikes', 'expiry_rollover'),
+    'trailing_exits': ('open_time', 'entry_time', 'strike_interval', 'hedge_rule',
+                       'hedge_pct', 'hedge_steps', 'snap_strikes', 'expiry_rollover',
+                       'trail_start', 'trail_window', 'exit_time', 'trail_bar_minutes')
+}
+
+# Market data shared by every combination run in this process
+_shared = {}
+
+
+def expand_grid(grid, base=None):
+    """
+    Expand a {name: [values]} grid into one StrategyParams per combination.
+
+    Args:
+        grid (dict): Parameter name to list of values; unknown names raise
+        base (StrategyParams): Values for parameters not in the grid
+
+    Returns:
+        list: StrategyParams for every combination
+    """
+    base = base or DEFAULT_PARAMS
+    unknown = set(grid) - set(StrategyParams.names())
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {', '.join(sorted(unknown))}")
+
+    names = list(grid)
+    return [base.replace(**dict(zip(names, values)))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+class BacktestCache:
+    """
+    Runs the backtest for one parameter set, reusing every stage result whose
+    parameters have been seen before.
+    """
+
+    def __init__(self, store=None, calendar=None, chain_loader=None, executor=None, dates=None):
+        self.store = store if store is not None else open_store()
+        self.calendar = calendar or build_calendar(store=self.store)
+        # Same entry days as run_pipeline: none the database profile marks as untradable
+        self.dates = dates if dates is not None else entry_days(self.calendar)[0]
+        self.chain_loader = chain_loader or OptionChainLoader(store=self.store, cache_size=64,
+                                                              bar_cache=open_bar_cache())
+        # The sweep already runs one process per core, so days run serially here
+        self.executor = executor or DayExecutor(1)
+        self._strike_indexes = {}
+        self._results = {name: {} for name in STAGE_KEYS}
+
+        self.get_spot_movement = load_stage('02_get_spot_movement', 'get_spot_movement')
+        self.process_strike_selection = load_stage('03_select_strike', 'process_strike_selection')
+        self.fetch_option_prices = load_stage('04_fetch_option_prices', 'fetch_option_prices')
+        self.process_trailing_exits = load_stage('05_trailing_exit', 'process_trailing_exits')
+        self.calculate_pnl = load_stage('06_calculate_pnl', 'calculate_pnl')
+
+    def _strike_index(self, params):
+        if not params.snap_strikes:
+            return None
+        key = (params.entry_time, params.expiry_rollover)
+        if key not in self._strike_indexes:
+            self._strike_indexes[key] = StrikeIndex(store=self.store, time=params.entry_time,
+                                                    dates=self.dates,
+                                                    expiry_rollover=params.expiry_rollover)
+        return self._strike_indexes[key]
+
+    def _cached(self, stage, params, compute):
+        key = tuple(getattr(params, name) for name in STAGE_KEYS[stage])
+        cache = self._results[stage]
+        if key not in cache:
+            cache[key] = compute()
+        return cache[key]
+
+    def run(self, params):
+        """
+        Run the backtest for one parameter set without writing any files.
+
+        Returns:
+            tuple: (pnl_data, stats) as returned by calculate_pnl
+        """
+        # The stages print summaries meant for a single run
+        with contextlib.redirect_stdout(io.StringIO()):
+            spot = self._cached('spot_movement', params, lambda: self.get_spot_movement(
+                save=False, store=self.store, calendar=self.calendar,
+                open_time=params.open_time, close_time=params.entry_time, dates=self.dates))
+
+            strikes = self._cached('strike_selection', params, lambda: self.process_strike_selection(
+                spot, save=False, strike_interval=params.strike_interval,
+                hedge_rule=params.hedge_rule, hedge_pct=params.hedge_pct,
+                hedge_steps=params.hedge_steps, snap_strikes=params.snap_strikes,
+                strike_index=self._strike_index(params)))
+
+            options = self._cached('option_prices', params, lambda: self.fetch_option_prices(
+                strikes, save=False, store=self.store, chain_loader=self.chain_loader,
+                entry_time=params.entry_time, executor=self.executor,
+                expiry_rollover=params.expiry_rollover))
+
+            exits = self._cached('trailing_exits', params, lambda: self.process_trailing_exits(
+                options, save=False, store=self.store, calendar=self.calendar,
+                chain_loader=self.chain_loader,
+                window=params.trail_window, entry_time=params.trail_start,
+                exit_time=params.exit_time, bar_minutes=params.trail_bar_minutes,
+                executor=self.executor))
+
+            pnl_data, stats, _, _ = self.calculate_pnl(exits, save=False, slippage_pct=params.slippage_pct)
+
+        return pnl_data, stats
+
+
+def group_combinations(combos, stage):
+    """Group combinations that share the cached result of `stage`."""
+    groups = {}
+    for params in combos:
+        key = tuple(getattr(params, name) for name in STAGE_KEYS[stage])
+        groups.setdefault(key, []).append(params)
+    return list(groups.values())
+
+
+def _run_group(group):
+    """Worker entry point: run every combination of one group."""
+    if 'cache' not in _shared:
+        _shared['cache'] = BacktestCache()
+    cache = _shared['cache']
+
+    rows = []
+    for params in group:
+        _, stats = cache.run(params)
+        rows.append(dict(params.to_dict(), **stats))
+    return rows
+
+
+def run_sweep(grid, base=None, workers=None, save=True):
+    """
+    Run the backtest once per parameter combination and compare the results.
+
+    Combinations that share the data-dependent parameters (times and strike
+    rules) are sent to the same worker, so their spot snapshots, strikes
+    and option prices are computed once and only the trailing exit and PnL
+    are redone. Each worker keeps its caches across the groups it runs.
+
+    Args:
+        grid (dict): Parameter name to list of values
+        base (StrategyParams): Values for parameters not in the grid
+        workers (int): Worker processes, os.cpu_count() by default
+        save (bool): Write reports/sweep_results.csv
+
+    Returns:
+        pd.DataFrame: One row per combination with its parameters and stats
+    """
+    combos = expand_grid(grid, base)
+
+    workers = workers or os.cpu_count() or 1
+    groups = group_combinations(combos, 'option_prices')
+    if len(groups) < workers:
+        # Too few data groups to fill the pool: let workers redo the cheap
+        # upstream stages and split on the trailing parameters instead
+        groups = group_combinations(combos, 'trailing_exits')
+
+    workers = min(workers, len(groups))
+    start = time.perf_counter()
+    if workers <= 1:
+        results = [_run_group(group) for group in groups]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_run_group, groups))
+
+    table = pd.DataFrame([row for rows in results for row in rows])
+    table = table.sort_values('Total P&L', ascending=False, ignore_index=True)
+
+    if save:
+        reports_dir = os.path.join(os.path.dirname(SCRIPTS_DIR), 'reports')
+        os.makedirs(reports_dir, exist_ok=True)
+        table.to_csv(os.path.join(reports_dir, 'sweep_results.csv'), index=False)
+
+    print("\nParameter Sweep:")
+    print("================")
+    print(f"Combinations: {len(combos)} in {len(groups)} data groups, "
+          f"{workers} workers, {time.perf_counter() - start:.1f}s")
+    print("\nTop 5 combinations by Total P&L:")
+    print(table.head().to_string())
+
+    return table
+
+
+def parse_value(name, value):
+    """Convert a command-line value to the type of the parameter's default."""
+    kind = type(getattr(DEFAULT_PARAMS, name))
+    if kind is bool:
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return kind(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the backtest over a parameter grid.")
+    for name in StrategyParams.names():
+        parser.add_argument(f"--{name.replace('_', '-')}", nargs='+', metavar='VALUE',
+                            help=f"values to sweep (default {getattr(DEFAULT_PARAMS, name)})")
+    parser.add_argument('--workers', type=int, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    grid = {
+        name: [parse_value(name, v) for v in getattr(args, name)]
+        for name in StrategyParams.names() if getattr(args, name)
+    }
+    run_sweep(grid, workers=args.workers)
@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import sqlite3
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from market_store import INSTRUMENT_TYPES, format_minute
+from trading_calendar import DEFAULT_EXPIRY_WEEKDAY
+
+SPOT_SCHEMA = 'date TEXT, time TEXT, open REAL, high REAL, low REAL, close REAL'
+OPTION_SCHEMA = ('date TEXT, time TEXT, symbol TEXT, expiry TEXT, strike INTEGER, '
+                 'instrument_type TEXT, open REAL, high REAL, low REAL, close REAL')
+
+# Regular session, one bar per minute from 09:15 to 15:29
+SESSION_MINUTES = np.arange(9 * 60 + 15, 15 * 60 + 30)
+
+MANIFEST_FILE = 'synthetic.json'
+
+
+def trading_days(start, years):
+    """Weekdays from start for the given number of years (no holiday calendar)."""
+    end = start + timedelta(days=round(365.25 * years))
+    days = pd.bdate_range(start, end - timedelta(days=1))
+    return [d.date() for d in days]
+
+
+def weekly_expiries(day, count, expiry_weekday=DEFAULT_EXPIRY_WEEKDAY):
+    """The `count` weekly expiries on or after day."""
+    first = day + timedelta(days=(expiry_weekday - day.weekday()) % 7)
+    return [first + timedelta(weeks=n) for n in range(count)]
+
+
+def _norm_cdf(x):
+    # Logistic-tanh approximation, accurate to ~1e-3 and fully vectorized
+    return 0.5 * (1 + np.tanh(np.sqrt(2 / np.pi) * (x + 0.044715 * x ** 3)))
+
+
+def option_prices(spot, strikes, is_call, years_left, vol):
+    """Black-Scholes prices (zero rate) broadcast over spot, strike and type."""
+    years_left = np.maximum(years_left, 1e-5)
+    spread = vol * np.sqrt(years_left)
+    d1 = (np.log(spot / strikes) + 0.5 * spread ** 2) / spread
+    d2 = d1 - spread
+    call = spot * _norm_cdf(d1) - strikes * _norm_cdf(d2)
+    put = call - spot + strikes
+    return np.maximum(np.where(is_call, call, put), 0.05)
+
+
+def spot_day(rng, previous_close, vol):
+    """One session of minute OHLC bars as a random walk from the previous close."""
+    step = vol / np.sqrt(252 * len(SESSION_MINUTES))
+    day_open = previous_close * np.exp(rng.normal(0, 0.005))
+    close = day_open * np.exp(np.cumsum(rng.normal(0, step, len(SESSION_MINUTES))))
+    open_ = np.r_[day_open, close[:-1]]
+    wick = np.abs(rng.normal(0, step / 2, (2, len(close))))
+    high = np.maximum(open_, close) * (1 + wick[0])
+    low = np.minimum(open_, close) * (1 - wick[1])
+    return {'open': open_, 'high': high, 'low': low, 'close': close}
+
+
+def option_day(day, spot, strikes, expiries, vol):
+    """
+    Minute OHLC bars of every (expiry, strike, type) contract for one day.
+
+    Calls take their high from the spot high and puts from the spot low, so
+    the option bars stay consistent with the underlying.
+
+    Returns:
+        dict: Row arrays in time, expiry, strike, type order; expiry is
+        the position in `expiries` and strike_pos the position in `strikes`
+    """
+    minutes = len(SESSION_MINUTES)
+    # Axes: minute, expiry, strike, type
+    shape = (minutes, len(expiries), len(strikes), len(INSTRUMENT_TYPES))
+    strike_grid = np.asarray(strikes, dtype=float)[None, None, :, None]
+    is_call = (np.arange(len(INSTRUMENT_TYPES)) == INSTRUMENT_TYPES.index('CE'))[None, None, None, :]
+
+    # Time to expiry counts the rest of the session as a fraction of a day
+    days_left = np.array([(e - day).days for e in expiries], dtype=float)
+    session_left = 1 - np.arange(minutes) / minutes
+    years_left = ((days_left[None, :] + session_left[:, None]) / 365)[:, :, None, None]
+
+    def price(values):
+        return option_prices(values, strike_grid, is_call, years_left, vol)
+
+    bar = {name: values[:, None, None, None] for name, values in spot.items()}
+    bars = {
+        'open': price(bar['open']),
+        'high': price(np.where(is_call, bar['high'], bar['low'])),
+        'low': price(np.where(is_call, bar['low'], bar['high'])),
+        'close': price(bar['close'])
+    }
+    bars['high'] = np.maximum.reduce([bars['high'], bars['open'], bars['close']])
+    bars['low'] = np.minimum.reduce([bars['low'], bars['open'], bars['close']])
+
+    index = np.indices(shape).reshape(4, -1)
+    rows = {name: np.round(values.reshape(-1), 2) for name, values in bars.items()}
+    rows['minute'] = SESSION_MINUTES[index[0]]
+    rows['expiry'] = index[1]
+    rows['strike_pos'] = index[2]
+    rows['strike'] = np.asarray(strikes)[index[2]]
+    rows['instrument_type'] = index[3]
+    return rows
+
+
+def generate_databases(out_dir, years=1, strikes=41, expiries=2, strike_interval=100,
+                       start=date(2015, 1, 1), spot=20000.0, vol=0.18,
+                       expiry_weekday=DEFAULT_EXPIRY_WEEKDAY, seed=0):
+    """
+    Write synthetic SPOT.db and OPT.db in the per-day-table layout.
+
+    Every weekday gets a ddmmyyyy table in both databases with one bar per
+    minute of the regular session. The option table quotes `strikes`
+    strikes per type around the day's open for each of the next `expiries`
+    weekly expiries, priced off the spot bars with Black-Scholes.
+
+    Args:
+        out_dir (str): Directory to write the databases to
+        years (float): Years of trading days to generate
+        strikes (int): Strikes quoted per expiry and option type
+        expiries (int): Weekly expiries quoted each day
+        strike_interval (int): Gap between strikes
+        start (date): First calendar day
+        spot (float): Spot price at the start
+        vol (float): Annualised volatility of the spot and option IV
+        expiry_weekday (int): Weekday of the weekly expiry (Monday=0)
+        seed (int): Random seed
+
+    Returns:
+        dict: The generation settings and row counts, also saved as
+        synthetic.json next to the databases
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for name in ('SPOT.db', 'OPT.db'):
+        path = os.path.join(out_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    rng = np.random.default_rng(seed)
+    spot_conn = sqlite3.connect(os.path.join(out_dir, 'SPOT.db'))
+    opt_conn = sqlite3.connect(os.path.join(out_dir, 'OPT.db'))
+    for conn in (spot_conn, opt_conn):
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+
+    times = [format_minute(m) for m in SESSION_MINUTES]
+    half = strikes // 2
+    days = trading_days(start, years)
+    option_rows = 0
+
+    for day in days:
+        table = day.strftime('%d%m%Y')
+        bars = spot_day(rng, spot, vol)
+        spot = bars['close'][-1]
+
+        spot_conn.execute(f'CREATE TABLE "{table}" ({SPOT_SCHEMA})')
+        spot_conn.executemany(
+            f'INSERT INTO "{table}" VALUES (?, ?, ?, ?, ?, ?)',
+            zip([table] * len(times), times, *(np.round(bars[f], 2).tolist()
+                                                for f in ('open', 'high', 'low', 'close')))
+        )
+
+        centre = round(bars['open'][0] / strike_interval) * strike_interval
+        day_strikes = centre + strike_interval * np.arange(-half, strikes - half)
+        day_expiries = weekly_expiries(day, expiries, expiry_weekday)
+        rows = option_day(day, bars, day_strikes, day_expiries, vol)
+
+        # Text columns are looked up per row from small per-day tables
+        contracts = (rows['expiry'] * len(day_strikes) + rows['strike_pos']) * len(INSTRUMENT_TYPES) \
+            + rows['instrument_type']
+        symbols = np.array([
+            f"BANKNIFTY{e.strftime('%d%b%y').upper()}{int(k)}{option_type}"
+            for e in day_expiries for k in day_strikes for option_type in INSTRUMENT_TYPES
+        ], dtype=object)
+        opt_conn.execute(f'CREATE TABLE "{table}" ({OPTION_SCHEMA})')
+        opt_conn.executemany(
+            f'INSERT INTO "{table}" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            zip(
+                [table] * len(contracts),
+                np.array(times, dtype=object)[rows['minute'] - SESSION_MINUTES[0]].tolist(),
+                symbols[contracts].tolist(),
+                np.array([e.isoformat() for e in day_expiries], dtype=object)[rows['expiry']].tolist(),
+                rows['strike'].tolist(),
+                np.array(INSTRUMENT_TYPES, dtype=object)[rows['instrument_type']].tolist(),
+                rows['open'].tolist(), rows['high'].tolist(), rows['low'].tolist(), rows['close'].tolist()
+            )
+        )
+        option_rows += len(rows['minute'])
+
+    spot_conn.commit()
+    opt_conn.commit()
+    spot_conn.close()
+    opt_conn.close()
+
+    manifest = {
+        'years': years,
+        'strikes': strikes,
+        'expiries': expiries,
+        'strike_interval': strike_interval,
+        'start': start.isoformat(),
+        'vol': vol,
+        'expiry_weekday': expiry_weekday,
+        'seed': seed,
+        'days': len(days),
+        'spot_rows': len(days) * len(SESSION_MINUTES),
+        'option_rows': option_rows
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    print(f"Generated {len(days)} days ({option_rows:,} option rows) in {out_dir}")
+    return manifest
+
+
+def load_manifest(out_dir):
+    """Return the settings a synthetic data directory was generated with, or None."""
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic SPOT.db and OPT.db.")
+    parser.add_argument('out_dir', help="directory to write the databases to")
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--strikes', type=int, default=41, help="strikes per expiry and option type")
+    parser.add_argument('--expiries', type=int, default=2, help="weekly expiries quoted each day")
+    parser.add_argument('--strike-interval', type=int, default=100)
+    parser.add_argument('--start', type=date.fromisoformat, default=date(2015, 1, 1))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate_databases(args.out_dir, years=args.years, strikes=args.strikes, expiries=args.expiries,
+                       strike_interval=args.strike_interval, start=args.start, seed=args.seed)
@@ -0,0 +1,138 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from db import connection
+from db_profile import bad_days
+from market_store import default_data_dir, list_day_tables, table_to_date
+
+# Weekly index options expire on Thursday unless the exchange says otherwise
+DEFAULT_EXPIRY_WEEKDAY = 3
+
+
+def normalize_date(date):
+    """Return the zero-padded ddmmyyyy form of a table name (e.g. 1092023)."""
+    return str(date).zfill(8)
+
+
+class TradingCalendar:
+    """
+    Chronological list of trading days with constant-time lookups.
+
+    Built once per run from the available day tables and shared by every
+    stage. Dates are ddmmyyyy table names; unpadded names such as 1092023
+    (what a CSV round-trip leaves behind) are accepted everywhere.
+    """
+
+    def __init__(self, dates, expiry_weekday=DEFAULT_EXPIRY_WEEKDAY, expiries=None):
+        """
+        Args:
+            dates (list): ddmmyyyy trading days, in any order
+            expiry_weekday (int): Weekday of the weekly expiry (Monday=0)
+            expiries (list): Known expiry dates; when given they are used
+                instead of the weekday rule
+        """
+        days = sorted({normalize_date(d) for d in dates}, key=table_to_date)
+        self.dates = days
+        self.timestamps = pd.DatetimeIndex([table_to_date(d) for d in days])
+        self._index = {date: i for i, date in enumerate(days)}
+
+        # Weekdays between consecutive sessions with no data are holidays
+        business_days = np.busday_count(
+            self.timestamps[:-1].values.astype('datetime64[D]'),
+            self.timestamps[1:].values.astype('datetime64[D]')
+        )
+        self._holidays_before = np.r_[0, np.maximum(business_days - 1, 0)]
+
+        self._expiry = self._tag_expiries(expiry_weekday, expiries)
+
+    def _tag_expiries(self, expiry_weekday, expiries):
+        """Mark the session on which each weekly contract expires."""
+        if expiries is not None:
+            known = {pd.Timestamp(e).normalize() for e in expiries}
+            return np.array([ts in known for ts in self.timestamps], dtype=bool)
+
+        # Expiry moves to the previous session when its weekday is a holiday
+        days = pd.Series(self.timestamps, index=self.timestamps)
+        target = days - pd.to_timedelta(days.dt.weekday, unit='D') + pd.Timedelta(days=expiry_weekday)
+        eligible = days[days <= target]
+        last_eligible = eligible.groupby(target[days <= target]).transform('max')
+        tagged = pd.Series(False, index=self.timestamps)
+        tagged[last_eligible[last_eligible == eligible].index] = True
+        return tagged.to_numpy()
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __iter__(self):
+        return iter(self.dates)
+
+    def __contains__(self, date):
+        return normalize_date(date) in self._index
+
+    def index(self, date):
+        """Position of a date in the calendar, or None if it is not a trading day."""
+        return self._index.get(normalize_date(date))
+
+    def next_day(self, date, offset=1):
+        """Return the trading day `offset` sessions after date, or None."""
+        i = self.index(date)
+        if i is None or not 0 <= i + offset < len(self.dates):
+            return None
+        return self.dates[i + offset]
+
+    def previous_day(self, date):
+        """Return the trading day before date, or None."""
+        return self.next_day(date, -1)
+
+    def holidays_before(self, date):
+        """Number of weekdays without data between the previous session and date."""
+        i = self.index(date)
+        return None if i is None else int(self._holidays_before[i])
+
+    def is_expiry(self, date):
+        """True if a weekly contract expires on this session."""
+        i = self.index(date)
+        return i is not None and bool(self._expiry[i])
+
+    def next_expiry(self, date):
+        """Return the first expiry session on or after date, or None."""
+        i = self.index(date)
+        if i is None:
+            return None
+        later = np.flatnonzero(self._expiry[i:])
+        return self.dates[i + later[0]] if len(later) else None
+
+    def to_frame(self):
+        """Return the calendar as a DataFrame indexed by ddmmyyyy date."""
+        return pd.DataFrame({
+            'timestamp': self.timestamps,
+            'weekday': self.timestamps.day_name(),
+            'next_day': self.dates[1:] + [None],
+            'holidays_before': self._holidays_before,
+            'is_expiry': self._expiry
+        }, index=pd.Index(self.dates, name='date'))
+
+
+def build_calendar(data_dir=None, store=None, expiry_weekday=DEFAULT_EXPIRY_WEEKDAY):
+    """
+    Build the trading calendar from the columnar store or SPOT.db.
+
+    Days the saved database profile finds without data are left out, so
+    no stage picks them as the session before or after another day.
+
+    Args:
+        data_dir (str): Directory holding SPOT.db and the database profile
+        store (MarketStore): Columnar store to read the dates from
+
+    Returns:
+        TradingCalendar
+    """
+    if store is not None:
+        dates = store.dates('spot')
+    else:
+        dates = list_day_tables(connection(os.path.join(data_dir or default_data_dir(), 'SPOT.db')))
+
+    skipped = bad_days(data_dir)
+    return TradingCalendar([d for d in dates if normalize_date(d) not in skipped], expiry_weekday)
@@ -0,0 +1,135 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+EXIT_TRAIL = 'TRAIL'
+EXIT_TIME = 'TIME'
+
+
+def trailing_exits(high, low, close, sides, window=3):
+    """
+    Find trailing-stop exits for many rows of minute bars at once.
+
+    Each row is one trade leg, with bars in time order and NaN padding after
+    the last bar. A row with side +1 trails below the lowest low of the
+    previous `window` bars; side -1 trails above the highest high. The stop
+    only ever moves in the trade's favour. The trade exits at the close of
+    the first bar that crosses the stop; otherwise at the last bar (the
+    forced time exit).
+
+    Args:
+        high (np.ndarray): Bar highs, shape (rows, bars)
+        low (np.ndarray): Bar lows, shape (rows, bars)
+        close (np.ndarray): Bar closes, shape (rows, bars)
+        sides (np.ndarray): +1 or -1 per row
+        window (int): Number of bars in the trailing window
+
+    Returns:
+        tuple: (exit_index, exit_price, exit_reason) arrays. Rows with fewer
+        than `window` bars get exit_index -1, a NaN price and reason None
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    close = np.asarray(close, dtype=float)
+    sides = np.asarray(sides).reshape(-1, 1)
+    rows, bars = close.shape
+
+    n_bars = np.count_nonzero(~np.isnan(close), axis=1)
+    last_bar = n_bars - 1
+
+    exit_index = last_bar
+    crossed = np.zeros(rows, dtype=bool)
+
+    if bars > window:
+        # Flip short rows so every row trails below a rising stop
+        extreme = np.where(sides > 0, low, -high)
+        price = np.where(sides > 0, close, -close)
+
+        # Stop for bar i is the extreme of bars i-window .. i-1, ratcheted up
+        rolling = sliding_window_view(extreme, window, axis=1).min(axis=-1)[:, :bars - window]
+        stop = np.fmax.accumulate(rolling, axis=1)
+
+        crossing = price[:, window:] < stop
+        crossed = crossing.any(axis=1)
+        exit_index = np.where(crossed, crossing.argmax(axis=1) + window, last_bar)
+
+    exit_index = np.where(n_bars >= window, exit_index, -1)
+    crossed &= exit_index >= 0
+
+    valid = exit_index >= 0
+    exit_price = np.full(rows, np.nan)
+    exit_price[valid] = close[valid, exit_index[valid]]
+
+    exit_reason = np.where(crossed, EXIT_TRAIL, EXIT_TIME).astype(object)
+    exit_reason[~valid] = None
+
+    return exit_index, exit_price, exit_reason
+
+
+def _trailing_shard(args):
+    return trailing_exits(*args)
+
+
+def trailing_exits_parallel(high, low, close, sides, window=3, workers=None):
+    """
+    Run trailing_exits with the rows sharded across a process pool.
+
+    Args:
+        workers (int): Number of processes, os.cpu_count() by default
+
+    Returns:
+        tuple: Same as trailing_exits, in the original row order
+    """
+    workers = workers or os.cpu_count() or 1
+    rows = len(close)
+    if workers <= 1 or rows < 2 * workers:
+        return trailing_exits(high, low, close, sides, window)
+
+    bounds = np.linspace(0, rows, workers + 1).astype(int)
+    shards = [
+        (high[a:b], low[a:b], close[a:b], np.asarray(sides)[a:b], window)
+        for a, b in zip(bounds[:-1], bounds[1:])
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_trailing_shard, shards))
+
+    return tuple(np.concatenate([r[i] for r in results]) for i in range(3))
+
+
+def bar_matrix(row_index, minutes, values, rows, start_minute, end_minute):
+    """
+    Pack flat minute bars into (rows, bars) matrices for trailing_exits.
+
+    Bars of each row are placed left to right in time order, so a missing
+    minute does not leave a gap; the remaining cells are NaN.
+
+    Args:
+        row_index (np.ndarray): Output row of each bar
+        minutes (np.ndarray): Minute of day of each bar
+        values (dict): Field name to flat array of bar values
+        rows (int): Number of output rows
+        start_minute (int): First minute kept
+        end_minute (int): Last minute kept
+
+    Returns:
+        dict: Field name to matrix, plus 'minute' holding each bar's minute
+    """
+    minutes = np.asarray(minutes)
+    row_index = np.asarray(row_index)
+    keep = (minutes >= start_minute) & (minutes <= end_minute)
+
+    order = np.lexsort((minutes[keep], row_index[keep]))
+    bar_rows = row_index[keep][order]
+    first = np.searchsorted(bar_rows, np.arange(rows))
+    cols = np.arange(len(bar_rows)) - first[bar_rows]
+    width = end_minute - start_minute + 1
+
+    matrices = {}
+    fields = dict(values, minute=minutes)
+    for name, flat in fields.items():
+        matrix = np.full((rows, width), np.nan)
+        matrix[bar_rows, cols] = np.asarray(flat)[keep][order]
+        matrices[name] = matrix
+    return matrices
@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import sys
+from datetime import date
+
+import pytest
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from market_store import list_day_tables
+from synthetic_data import generate_databases
+
+# Shape of the synthetic data set the tests share
+STRIKES = 11
+EXPIRIES = 2
+
+
+@pytest.fixture(scope='session')
+def synthetic_dir(tmp_path_factory):
+    """Directory with two weeks of synthetic SPOT.db and OPT.db."""
+    path = str(tmp_path_factory.mktemp('synthetic'))
+    generate_databases(path, years=0.03, strikes=STRIKES, expiries=EXPIRIES, start=date(2023, 9, 4))
+    return path
+
+
+@pytest.fixture(scope='session')
+def synthetic_dates(synthetic_dir):
+    """ddmmyyyy day tables of the synthetic OPT.db."""
+    conn = sqlite3.connect(os.path.join(synthetic_dir, 'OPT.db'))
+    try:
+        return list_day_tables(conn)
+    finally:
+        conn.close()
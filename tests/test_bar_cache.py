@@ -0,0 +1,39 @@
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+
+from bar_cache import build_bar_cache, open_bar_cache
+from option_chain import OptionChainLoader
+
+
+def _copy_databases(synthetic_dir, data_dir):
+    for name in ('SPOT.db', 'OPT.db'):
+        shutil.copy(os.path.join(synthetic_dir, name), data_dir)
+
+
+def test_changed_day_table_is_not_read_from_the_cache(synthetic_dir, synthetic_dates, tmp_path):
+    data_dir = str(tmp_path)
+    _copy_databases(synthetic_dir, data_dir)
+    build_bar_cache(data_dir, minutes=(3,))
+    changed, unchanged = synthetic_dates[:2]
+    assert open_bar_cache(data_dir).has(3, changed)
+
+    conn = sqlite3.connect(os.path.join(data_dir, 'OPT.db'))
+    conn.execute(f'UPDATE "{changed}" SET close = close + 1, high = high + 1')
+    conn.commit()
+    conn.close()
+
+    cache = open_bar_cache(data_dir)
+    assert not cache.has(3, changed)
+    assert cache.has(3, unchanged)
+
+    # The changed day is aggregated from the table as it is now
+    cached = OptionChainLoader(data_dir, bar_cache=cache).load(changed, '09:15:00', '09:45:00', bar_minutes=3)
+    fresh = OptionChainLoader(data_dir).load(changed, '09:15:00', '09:45:00', bar_minutes=3)
+    np.testing.assert_array_equal(cached.fields['close'], fresh.fields['close'])
+
+    # Rebuilding picks the change up and makes the day current again
+    build_bar_cache(data_dir, minutes=(3,))
+    assert open_bar_cache(data_dir).has(3, changed)
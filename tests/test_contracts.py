@@ -0,0 +1,57 @@
+import numpy as np
+
+from contracts import ContractIndex, select_expiry
+
+
+def _index(rows):
+    """ContractIndex of (expiry, strike, type code, minute, close) rows."""
+    expiry, strike, code, minute, close = zip(*rows)
+    return ContractIndex('06092023', {
+        'minute': np.array(minute, dtype=np.int16),
+        'expiry': np.array(expiry, dtype='datetime64[D]'),
+        'strike': np.array(strike, dtype=float),
+        'instrument_type': np.array(code, dtype=np.int8),
+        'close': np.array(close, dtype=float)
+    })
+
+
+def test_lookup_by_contract():
+    index = _index([
+        ('2023-09-07', 44000, 0, 925, 10.0),
+        ('2023-09-07', 44000, 1, 925, 20.0),
+        ('2023-09-14', 44000, 1, 925, 30.0),
+        ('2023-09-07', 44100, 0, 925, 40.0),
+    ])
+    assert len(index) == 4
+    assert index.price(925, '2023-09-07', 44000, 'PE') == 20.0
+    assert index.price(925, '2023-09-14', 44000, 'PE') == 30.0
+    assert index.price(926, '2023-09-07', 44000, 'PE') is None
+    assert index.rows('2023-09-14', 44100, 'CE') is None
+
+
+def test_invalid_rows_do_not_alias_other_contracts():
+    # Unknown type code on 44100 packs to the same key as 44099 PE,
+    # and a row without expiry or strike has no contract
+    index = _index([
+        ('2023-09-07', 44000, 0, 925, 10.0),
+        ('2023-09-07', 44100, -1, 925, 99.0),
+        ('NaT', 44000, 0, 925, 98.0),
+        ('2023-09-07', np.nan, 1, 925, 97.0),
+    ])
+    assert len(index) == 1
+    assert index.rows('2023-09-07', 44099, 'PE') is None
+    assert index.rows(None, 44000, 'CE') is None
+    assert index.price(925, '2023-09-07', 44000, 'CE') == 10.0
+
+
+def test_days_without_expiries_are_indexed_undated():
+    index = _index([('NaT', 44000, 0, 925, 10.0)])
+    assert index.select_expiry() is None
+    assert index.price(925, None, 44000, 'CE') == 10.0
+
+
+def test_expiry_day_rolls_to_next_expiry():
+    expiries = np.array(['2023-09-07', '2023-09-14'], dtype='datetime64[D]')
+    assert select_expiry(expiries, '07092023') == np.datetime64('2023-09-14')
+    assert select_expiry(expiries, '07092023', rollover='none') == np.datetime64('2023-09-07')
+    assert select_expiry(expiries, '06092023') == np.datetime64('2023-09-07')
@@ -0,0 +1,46 @@
+import json
+import os
+import shutil
+
+from db_profile import ENTRY_TIMES, EXIT_TIMES, PROFILE_FILE, bad_days, entry_days
+from trading_calendar import build_calendar
+
+
+def _day(missing=(), rows=100):
+    return {'rows': rows, 'missing_bars': list(missing)}
+
+
+def _write_manifest(data_dir, spot, opt):
+    manifest = {'entry_times': list(ENTRY_TIMES), 'exit_times': list(EXIT_TIMES), 'spot': spot, 'opt': opt}
+    with open(os.path.join(data_dir, PROFILE_FILE), 'w') as f:
+        json.dump(manifest, f)
+
+
+def test_entry_and_exit_bars_are_checked_apart(synthetic_dir, synthetic_dates, tmp_path):
+    data_dir = str(tmp_path)
+    shutil.copy(os.path.join(synthetic_dir, 'SPOT.db'), data_dir)
+    d0, d1, d2, d3, d4 = synthetic_dates[:5]
+    spot = {d: _day() for d in synthetic_dates}
+    opt = dict(spot)
+    spot[d1] = _day(['09:45:00'])
+    opt[d2] = _day(ENTRY_TIMES + EXIT_TIMES, rows=0)
+    spot[d3] = _day(['15:25:00'])
+    _write_manifest(data_dir, spot, opt)
+
+    # A day without data is not a session, so d1 is followed by d3
+    assert list(bad_days(data_dir)) == [d2]
+    calendar = build_calendar(data_dir)
+    assert d2 not in calendar
+    assert calendar.next_day(d1) == d3
+
+    dates, skipped = entry_days(calendar, data_dir)
+    # d0 cannot be exited on d1; d1 lacks only the exit bar, so it is entered
+    assert skipped == {d0: [f"next session {d1} spot: missing 09:45:00"], d3: ["spot: missing 15:25:00"]}
+    assert d1 in dates and d4 in dates
+
+
+def test_without_manifest_every_day_is_entered(synthetic_dir, synthetic_dates):
+    calendar = build_calendar(synthetic_dir)
+    dates, skipped = entry_days(calendar, synthetic_dir)
+    assert dates == list(calendar) == synthetic_dates
+    assert skipped == {}
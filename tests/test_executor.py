@@ -0,0 +1,65 @@
+import os
+import time
+
+import pytest
+
+from db import POOL, connection
+from executor import DayExecutor
+
+
+def _slow_square(delay, day):
+    # Later days finish first
+    time.sleep(delay * (5 - day))
+    return day * day
+
+
+def _fail_on_odd(shared, day):
+    if day % 2:
+        raise ValueError(f"odd day {day}")
+    return day
+
+
+def _count_rows(db_path, day):
+    time.sleep(0.01)
+    return connection(db_path).execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0]
+
+
+@pytest.mark.parametrize('backend', ['thread', 'process'])
+def test_results_keep_the_order_of_the_days(backend):
+    with DayExecutor(4, backend) as executor:
+        days = executor.map(_slow_square, range(5), 0.01)
+    assert days.results == [(day, day * day) for day in range(5)]
+    assert days.failures == []
+
+
+@pytest.mark.parametrize('backend', ['thread', 'process'])
+def test_failures_are_collected_without_stopping_other_days(backend):
+    with DayExecutor(4, backend) as executor:
+        days = executor.map(_fail_on_odd, range(6))
+    assert days.values() == [0, 2, 4]
+    assert [failure.day for failure in days.failures] == [1, 3, 5]
+    assert days.failures[0].error == 'ValueError: odd day 1'
+    assert 'Traceback' in days.failures[0].traceback
+
+
+def test_worker_connections_do_not_pile_up(synthetic_dir):
+    db_path = os.path.join(synthetic_dir, 'SPOT.db')
+    POOL.close_finished()
+    before = len(POOL)
+
+    # Map calls of one executor reuse its threads and their connections
+    with DayExecutor(4) as executor:
+        executor.map(_count_rows, range(8), db_path)
+        opened = len(POOL) - before
+        executor.map(_count_rows, range(8), db_path)
+        assert 0 < opened == len(POOL) - before
+    assert len(POOL) == before
+
+    # Threads of executors that are never closed exit once the executor is
+    # dropped, and their connections are closed after them
+    for _ in range(3):
+        DayExecutor(4).map(_count_rows, range(8), db_path)
+    deadline = time.monotonic() + 5
+    while POOL.close_finished() or len(POOL) > before:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
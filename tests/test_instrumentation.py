@@ -0,0 +1,38 @@
+import instrumentation
+from market_store import MarketStore, build_store
+from option_chain import OptionChainLoader
+
+
+def _stage(name, func):
+    """Run func as one stage of a fresh run log and return the stage's record."""
+    log = instrumentation.start_run()
+    try:
+        with log.stage(name):
+            func()
+    finally:
+        instrumentation.end_run()
+    stages, _ = log.stage_frame()
+    return stages.loc[name]
+
+
+def test_sqlite_stage_reports_bytes_read(synthetic_dir, synthetic_dates):
+    loader = OptionChainLoader(synthetic_dir)
+    record = _stage('chain', lambda: loader.load(synthetic_dates[0], '09:15:00', '09:45:00'))
+    assert record['rows'] > 0
+    # Every row fetched a strike and four prices, besides its text columns
+    assert record['bytes_read'] >= record['rows'] * 5 * 8
+
+
+def test_stage_without_reads_reports_no_bytes():
+    record = _stage('idle', lambda: sum(range(1000)))
+    assert record['rows'] == 0
+    assert record['bytes_read'] == 0
+
+
+def test_store_stage_reports_mapped_columns(synthetic_dir, synthetic_dates, tmp_path):
+    build_store(synthetic_dir, str(tmp_path))
+    store = MarketStore(str(tmp_path))
+    days = []
+    record = _stage('store', lambda: days.append(store.option_day(synthetic_dates[0], ['strike', 'close'])))
+    day = days[0]
+    assert record['bytes_read'] >= day['strike'].nbytes + day['close'].nbytes
@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+from intermediates import read_frame, write_frame
+
+
+def test_round_trip_keeps_types(tmp_path):
+    frame = pd.DataFrame({
+        'date': ['01092023', '04092023'],
+        'strike': np.array([44000, 44100], dtype=np.int32),
+        'direction': ['UP', None],
+        'pnl': [1.5, -2.0]
+    }).set_index('date')
+    write_frame(frame, 'pnl_analysis', str(tmp_path))
+
+    result = read_frame('pnl_analysis', str(tmp_path))
+    assert list(result.index) == ['01092023', '04092023']
+    assert result['strike'].dtype == np.int32
+    assert result['direction'].iloc[0] == 'UP' and pd.isna(result['direction'].iloc[1])
+    assert result['pnl'].tolist() == [1.5, -2.0]
+
+
+def test_stale_csv_is_not_read_back(tmp_path):
+    # A CSV from an older layout must not stand in for a missing stage output
+    pd.DataFrame({'date': ['1092023'], 'pnl': [1.0]}).to_csv(tmp_path / 'leg_pnl.csv', index=False)
+    assert read_frame('leg_pnl', str(tmp_path)) is None
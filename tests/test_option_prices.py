@@ -0,0 +1,38 @@
+import pandas as pd
+
+import instrumentation
+from conftest import EXPIRIES, STRIKES
+from executor import DayExecutor
+from option_chain import OptionChainLoader, StrikeIndex
+from pipeline import load_stage
+
+
+def _strike_selection(data_dir, dates):
+    """Sell a quoted PE near the middle of the chain, hedged two strikes lower."""
+    index = StrikeIndex(data_dir, time='15:25:00')
+    rows = []
+    for date in dates:
+        strikes = index.strikes(date, 'PE')
+        middle = len(strikes) // 2
+        rows.append({'date': date, 'atm_strike': strikes[middle], 'hedge_strike': strikes[middle - 2],
+                     'direction': 'UP', 'option_type': 'PE'})
+    return pd.DataFrame(rows).set_index('date')
+
+
+def test_option_prices_read_only_the_entry_minute(synthetic_dir, synthetic_dates):
+    fetch_option_prices = load_stage('04_fetch_option_prices', 'fetch_option_prices')
+    strike_data = _strike_selection(synthetic_dir, synthetic_dates)
+
+    log = instrumentation.start_run()
+    try:
+        with log.stage('option_prices'):
+            prices = fetch_option_prices(strike_data, save=False, chain_loader=OptionChainLoader(synthetic_dir),
+                                         executor=DayExecutor(1))
+    finally:
+        instrumentation.end_run()
+
+    stages, _ = log.stage_frame()
+    # One bar per contract of every expiry at 15:25, nothing more
+    assert stages.loc['option_prices', 'rows'] == len(synthetic_dates) * EXPIRIES * STRIKES * 2
+    assert len(prices) == len(synthetic_dates)
+    assert prices[['atm_price', 'hedge_price']].notna().all().all()
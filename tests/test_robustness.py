@@ -0,0 +1,21 @@
+import numpy as np
+
+from executor import DayExecutor
+from robustness import resample_indices, simulate
+
+
+def test_blocks_longer_than_the_series_wrap_around():
+    index = resample_indices(np.random.default_rng(0), 5, 10, 20, block=12)
+    assert index.shape == (10, 20)
+    assert index.min() >= 0 and index.max() < 5
+
+    metrics = simulate(np.arange(5.) - 2, paths=10, block=12, horizon=20, seed=1, executor=DayExecutor(1))
+    assert len(metrics) == 10
+    assert np.isfinite(metrics['total_pnl']).all()
+
+
+def test_paths_do_not_depend_on_the_worker_count():
+    pnl = np.random.default_rng(1).normal(5, 20, 50)
+    one = simulate(pnl, paths=20_000, block=3, seed=7, executor=DayExecutor(1))
+    many = simulate(pnl, paths=20_000, block=3, seed=7, executor=DayExecutor(4))
+    assert one.equals(many)
@@ -0,0 +1,63 @@
+import os
+import sqlite3
+
+import numpy as np
+
+from market_store import MarketStore, build_store
+from option_chain import StrikeIndex
+from synthetic_data import OPTION_SCHEMA, SPOT_SCHEMA
+
+# (expiry, strike, type) quoted at 15:25; 44050 is only listed for the far expiry
+CONTRACTS = [('2023-09-07', strike, option_type)
+             for strike in (43900, 44000, 44100, 44200) for option_type in ('CE', 'PE')]
+CONTRACTS += [('2023-09-14', strike, option_type)
+              for strike in (43900, 44000, 44050, 44100, 44200) for option_type in ('CE', 'PE')]
+
+
+def _write_db(data_dir, dates):
+    opt, spot = (sqlite3.connect(os.path.join(data_dir, name)) for name in ('OPT.db', 'SPOT.db'))
+    for date in dates:
+        opt.execute(f'CREATE TABLE "{date}" ({OPTION_SCHEMA})')
+        opt.executemany(f'INSERT INTO "{date}" VALUES (?, ?, ?, ?, ?, ?, 1, 1, 1, 1)',
+                        [(date, '15:25:00', 'X', expiry, strike, option_type)
+                         for expiry, strike, option_type in CONTRACTS])
+        spot.execute(f'CREATE TABLE "{date}" ({SPOT_SCHEMA})')
+        spot.execute(f'INSERT INTO "{date}" VALUES (?, ?, 1, 1, 1, 1)', (date, '15:25:00'))
+    for conn in (opt, spot):
+        conn.commit()
+        conn.close()
+
+
+def test_strikes_come_from_the_traded_expiry(tmp_path):
+    _write_db(str(tmp_path), ['06092023', '07092023'])
+    index = StrikeIndex(str(tmp_path))
+
+    assert index.expiry('06092023') == np.datetime64('2023-09-07')
+    assert index.snap(['06092023'], [44040], ['PE']).tolist() == [44000]
+
+    # On its expiry day the trade rolls to the next expiry, where 44050 is listed
+    assert index.expiry('07092023') == np.datetime64('2023-09-14')
+    assert index.snap(['07092023'], [44040], ['PE']).tolist() == [44050]
+    assert 44050 in index.strikes('06092023', 'PE', expiry='2023-09-14')
+
+
+def test_store_index_matches_the_database(tmp_path):
+    data_dir, store_dir = str(tmp_path / 'data'), str(tmp_path / 'store')
+    os.makedirs(data_dir)
+    _write_db(data_dir, ['06092023', '07092023'])
+    build_store(data_dir, store_dir)
+    from_db, from_store = StrikeIndex(data_dir), StrikeIndex(store=MarketStore(store_dir))
+
+    for date in ('06092023', '07092023'):
+        assert from_store.expiry(date) == from_db.expiry(date)
+        assert from_store.strikes(date, 'PE').tolist() == from_db.strikes(date, 'PE').tolist()
+
+
+def test_hedge_stays_off_the_atm_strike(tmp_path):
+    _write_db(str(tmp_path), ['06092023'])
+    index = StrikeIndex(str(tmp_path))
+    dates = ['06092023'] * 3
+
+    # Nearest listed strikes would be the ATM strike itself
+    hedges = index.snap(dates, [43990, 44120, 43800], ['PE', 'CE', 'PE'], atm=[44000, 44100, 43900])
+    assert hedges.tolist() == [43900, 44200, 43800]